@@ -0,0 +1,84 @@
+"""Async-представления для режима ASGI (config/asgi.py).
+
+DRF 3.14 не умеет async-обработчики, поэтому AsyncAPIView повторяет
+APIView.dispatch: аутентификация и проверка прав (они ходят в базу)
+выполняются через sync_to_async, обработчик — в цикле событий.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import recommendations
+from .serializers import CreateOrderSerializer
+
+
+class AsyncAPIView(APIView):
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(
+            request, response, *args, **kwargs
+        )
+        return self.response
+
+
+class AsyncCreateOrderAPIView(AsyncAPIView):
+    """Создание заказа с расчётом упаковки в обработчике: ответ DS
+    ждётся не дольше RECOMMENDATION_INLINE_TIMEOUT секунд, ожидание
+    не занимает поток. Если DS не успел, расчёт уходит в пул, как в
+    CreateOrderAPIView."""
+
+    @staticmethod
+    def create(data):
+        """Проверка, сохранение заказа и запрос к DS одним вызовом
+        sync_to_async: такие вызовы выполняются в общем потоке."""
+
+        serializer = CreateOrderSerializer(
+            data=data, context={"schedule_recommendation": False}
+        )
+        if not serializer.is_valid():
+            return serializer.errors, None
+        order = serializer.save()
+        return order, recommendations.build_payload(order.pk)
+
+    async def post(self, request):
+        order, payload = await sync_to_async(self.create)(request.data)
+        if payload is None:
+            return Response(order, status=status.HTTP_400_BAD_REQUEST)
+
+        recommendation_status = await recommendations.recommend_inline(
+            order.pk, payload, settings.RECOMMENDATION_INLINE_TIMEOUT
+        )
+        if recommendation_status is None:
+            await sync_to_async(recommendations.schedule)(order.pk)
+            recommendation_status = order.recommendation_status
+        return Response(
+            {
+                "orderkey": order.pk,
+                "order_status": order.status,
+                "recommendation_status": recommendation_status,
+            },
+            status=status.HTTP_201_CREATED,
+        )
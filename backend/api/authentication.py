@@ -0,0 +1,62 @@
+"""Аутентификация по JWT с кэшем пользователей.
+
+Пользователь вместе со столом и принтером берётся из кэша Django,
+поэтому запросы с токеном не обращаются к базе за пользователем. Запись
+удаляется после коммита изменения пользователя, его стола или принтера
+(см. signals) и в любом случае живёт не дольше AUTH_USER_CACHE_TTL
+секунд. При нескольких воркерах нужен общий кэш (REDIS_URL), иначе
+удаление видно только в своём воркере. AUTH_USER_CACHE_TTL=0
+отключает кэш.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import (
+    AuthenticationFailed,
+    InvalidToken,
+)
+from rest_framework_simplejwt.settings import api_settings
+
+
+def user_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def forget_users(user_ids):
+    """Удаляет пользователей из кэша после коммита текущей транзакции."""
+    keys = [user_key(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification")
+            )
+
+        user = cache.get(user_key(user_id))
+        if user is None:
+            try:
+                user = self.user_model.objects.select_related(
+                    "table", "printer"
+                ).get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(
+                    _("User not found"), code="user_not_found"
+                )
+            if settings.AUTH_USER_CACHE_TTL:
+                cache.set(
+                    user_key(user_id), user, settings.AUTH_USER_CACHE_TTL
+                )
+
+        if not user.is_active:
+            raise AuthenticationFailed(
+                _("User is inactive"), code="user_inactive"
+            )
+        return user
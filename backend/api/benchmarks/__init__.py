@@ -0,0 +1,21 @@
+from . import (  # noqa: F401
+    batch_status,
+    catalog_import,
+    cell_load,
+    ds_client,
+    order_create,
+    order_archive,
+    order_details,
+    order_prefetch,
+    packaging_data,
+    packer_flow,
+    packing,
+    query_plans,
+    replica_routing,
+    serving_modes,
+    status_contention,
+    wire_formats,
+)
+from .base import SCENARIOS
+
+__all__ = ["SCENARIOS"]
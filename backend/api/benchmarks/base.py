@@ -0,0 +1,79 @@
+import time
+from statistics import mean
+
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+SCENARIOS = {}
+
+
+def register(scenario_class):
+    """Регистрирует сценарий для команды manage.py benchmark."""
+    SCENARIOS[scenario_class.name] = scenario_class
+    return scenario_class
+
+
+def percentile(values, pct):
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize(timings, **extra):
+    """Сводка по списку длительностей в секундах, результат в мс."""
+    row = dict(extra)
+    row.update(
+        {
+            "runs": len(timings),
+            "mean_ms": round(mean(timings) * 1000, 3) if timings else 0.0,
+            "p50_ms": round(percentile(timings, 50) * 1000, 3),
+            "p95_ms": round(percentile(timings, 95) * 1000, 3),
+            "p99_ms": round(percentile(timings, 99) * 1000, 3),
+        }
+    )
+    return row
+
+
+def require_constant_queries(rows, by="lines"):
+    """Завершает сценарий ошибкой, если число SQL-запросов в строках
+    rows зависит от значения row[by]."""
+    if len({row["queries"] for row in rows}) > 1:
+        raise CommandError(
+            f"Query count depends on {by}: "
+            + ", ".join(f"{row[by]}={row['queries']}" for row in rows)
+        )
+
+
+def measure(func, repeat):
+    """Вызывает func repeat раз.
+    Возвращает длительности вызовов и число SQL-запросов последнего."""
+
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        queries = len(ctx.captured_queries)
+    return timings, queries
+
+
+class Scenario:
+    """Базовый класс сценария нагрузочного теста."""
+
+    name = None
+    help = ""
+    uses_database = True
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=50)
+
+    def run(self, options):
+        """Возвращает список строк-словарей с результатами."""
+        raise NotImplementedError
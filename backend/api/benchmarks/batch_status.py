@@ -0,0 +1,97 @@
+import time
+import uuid
+
+from django.core.management.base import CommandError
+from rest_framework.test import APIClient
+
+from items.models import Order
+from users.models import User
+
+from .base import Scenario, register
+
+
+@register
+class BatchStatusScenario(Scenario):
+    """Закрытие смены: N заказов переводятся в collected по одному
+    через PATCH /api/order/collected/ и одним запросом
+    PATCH /api/order/batch-status/. Среди ключей пакета есть
+    несуществующие и заказы в статусе forming; сценарий проверяет
+    результат по каждому."""
+
+    name = "batch_status"
+    help = "Поштучная и пакетная смена статуса N заказов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", type=int, nargs="+", default=[100, 1000]
+        )
+
+    def run(self, options):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username="bench"))
+        rows = []
+        for size in options["sizes"]:
+            single = self._orders(size)
+            started = time.perf_counter()
+            for orderkey in single:
+                response = client.patch(
+                    "/api/order/collected/",
+                    {"orderkey": orderkey, "status": "collected"},
+                    format="json",
+                )
+                if response.status_code != 200:
+                    raise CommandError(f"collected: {response.status_code}")
+            rows.append(
+                self._row("single", size, time.perf_counter() - started)
+            )
+
+            batch = self._orders(size)
+            wrong_state = [
+                str(order.pk)
+                for order in Order.objects.bulk_create(
+                    Order(status="forming") for _ in range(size // 20)
+                )
+            ]
+            not_found = [str(uuid.uuid4()) for _ in range(size // 20)]
+            started = time.perf_counter()
+            response = client.patch(
+                "/api/order/batch-status/",
+                {
+                    "orderkeys": batch + wrong_state + not_found,
+                    "status": "collected",
+                },
+                format="json",
+            )
+            elapsed = time.perf_counter() - started
+            expected = {
+                "ok": len(batch),
+                "wrong_state": len(wrong_state),
+                "not_found": len(not_found),
+            }
+            counts = {
+                key: value for key, value in response.data["counts"].items()
+            }
+            if response.status_code != 200 or counts != expected:
+                raise CommandError(
+                    f"batch-status: {response.status_code} {counts}"
+                )
+            rows.append(self._row("batch", size, elapsed))
+        return rows
+
+    @staticmethod
+    def _orders(size):
+        return [
+            str(order.pk)
+            for order in Order.objects.bulk_create(
+                Order(status="collecting") for _ in range(size)
+            )
+        ]
+
+    @staticmethod
+    def _row(mode, size, elapsed):
+        return {
+            "mode": mode,
+            "orders": size,
+            "seconds": round(elapsed, 3),
+            "orders_per_s": round(size / elapsed, 1),
+        }
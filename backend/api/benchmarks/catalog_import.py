@@ -0,0 +1,97 @@
+import csv
+import os
+import random
+import tempfile
+import time
+import uuid
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+
+from items.models import Sku
+
+from .base import Scenario, register
+from .fixtures import make_cargotypes
+
+
+def write_sku_csv(path, count, codes, seed=0):
+    rnd = random.Random(seed)
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(
+            [
+                "sku",
+                "name",
+                "length",
+                "width",
+                "height",
+                "goods_wght",
+                "quantity",
+                "cargotypes",
+            ]
+        )
+        for index in range(count):
+            writer.writerow(
+                [
+                    uuid.UUID(int=rnd.getrandbits(128), version=4),
+                    f"sku-{index}",
+                    round(rnd.uniform(1, 40), 1),
+                    round(rnd.uniform(1, 30), 1),
+                    round(rnd.uniform(1, 20), 1),
+                    round(rnd.uniform(0.05, 5), 2),
+                    rnd.randint(0, 1000),
+                    " ".join(
+                        str(code)
+                        for code in rnd.sample(codes, rnd.randint(0, 2))
+                    ),
+                ]
+            )
+
+
+@register
+class CatalogImportScenario(Scenario):
+    """Загрузка справочника товаров командой import_catalog: первая
+    загрузка (вставка) и повторная (обновление тех же товаров). На
+    PostgreSQL сравнивает COPY и bulk_create."""
+
+    name = "catalog_import"
+    help = "manage.py import_catalog sku для CSV заданного размера"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100000)
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    def run(self, options):
+        codes = [cargotype.cargotype for cargotype in make_cargotypes()]
+        modes = {"bulk_create": True}
+        if connection.vendor == "postgresql":
+            modes = {"copy": False, **modes}
+        rows = []
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "skus.csv")
+            write_sku_csv(path, options["rows"], codes)
+            for mode, no_copy in modes.items():
+                Sku.objects.all().delete()
+                for phase in ("insert", "update"):
+                    started = time.perf_counter()
+                    call_command(
+                        "import_catalog",
+                        "sku",
+                        path,
+                        batch_size=options["batch_size"],
+                        no_copy=no_copy,
+                        verbosity=0,
+                        stdout=StringIO(),
+                    )
+                    elapsed = time.perf_counter() - started
+                    rows.append(
+                        {
+                            "mode": mode,
+                            "phase": phase,
+                            "rows": options["rows"],
+                            "seconds": round(elapsed, 3),
+                            "rows_per_s": round(options["rows"] / elapsed),
+                        }
+                    )
+        return rows
@@ -0,0 +1,85 @@
+import math
+
+from django.db import connection
+from rest_framework.test import APIClient
+
+from items.models import Cell, CellOrderSku
+from users.models import Table
+
+from .base import (
+    Scenario,
+    measure,
+    register,
+    require_constant_queries,
+    summarize,
+)
+from .fixtures import make_order, make_skus
+
+
+@register
+class CellLoadScenario(Scenario):
+    """Раскладка товаров заказа по ячейке: число запросов не должно
+    зависеть от числа строк, иначе сценарий завершается ошибкой. Лишние
+    INSERT, на которые bulk_create делит строки из-за ограничения СУБД
+    на число параметров запроса (SQLite), в проверке не учитываются."""
+
+    name = "cell_load"
+    help = "POST /api/upload-to-cell/ для разного числа строк"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--sizes", type=int, nargs="+", default=[1, 50, 300]
+        )
+
+    def run(self, options):
+        skus = make_skus(max(options["sizes"]))
+        table = Table.objects.create(name="bench", description="bench")
+        client = APIClient()
+        rows = []
+        for size in options["sizes"]:
+            order = make_order(skus[:size])
+            cell = Cell.objects.create(name=str(size)[:4], table=table)
+            payload = {
+                "cell_barcode": str(cell.pk),
+                "order": str(order.pk),
+                "table_name": table.name,
+                "skus": [
+                    {"sku": str(sku.pk), "quantity": 1} for sku in skus[:size]
+                ],
+            }
+
+            def load():
+                response = client.post(
+                    "/api/upload-to-cell/", payload, format="json"
+                )
+                assert response.status_code == 201, response.data
+
+            timings, queries = measure(load, options["repeat"])
+            rows.append(
+                summarize(
+                    timings,
+                    lines=size,
+                    queries=queries,
+                    inserts=insert_batches(size),
+                )
+            )
+
+        require_constant_queries(
+            [
+                dict(row, queries=row["queries"] - row["inserts"] + 1)
+                for row in rows
+            ]
+        )
+        return rows
+
+
+def insert_batches(size):
+    """Число INSERT в bulk_create для size строк CellOrderSku."""
+    fields = [
+        field
+        for field in CellOrderSku._meta.concrete_fields
+        if not field.primary_key
+    ]
+    batch = connection.ops.bulk_batch_size(fields, [None] * size)
+    return math.ceil(size / batch)
@@ -0,0 +1,64 @@
+import time
+
+from api.ds_client import CircuitBreaker, DSClient, DSUnavailable
+
+from .base import Scenario, register, summarize
+from .ds_stub import StubDS
+
+
+@register
+class DSClientScenario(Scenario):
+    """Клиент DS на заглушке: задержка запросов в здоровом, сбойном и
+    восстановленном состоянии DS. Переходы circuit breaker проверяют
+    тесты в api/tests.py."""
+
+    name = "ds_client"
+    help = "Клиент DS и circuit breaker на локальной заглушке"
+    uses_database = False
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--latency", type=float, default=0.0)
+        parser.add_argument("--failure-threshold", type=int, default=5)
+        parser.add_argument("--reset-timeout", type=float, default=0.5)
+
+    def run(self, options):
+        with StubDS(latency=options["latency"]) as stub:
+            client = DSClient(
+                pack_url=stub.pack_url,
+                connect_timeout=1.0,
+                read_timeout=options["latency"] + 1.0,
+                breaker=CircuitBreaker(
+                    failure_threshold=options["failure_threshold"],
+                    reset_timeout=options["reset_timeout"],
+                ),
+            )
+            payload = {"orderId": "bench", "items": []}
+            rows = [self._phase("healthy", client, payload, options)]
+
+            stub.set(failing=True)
+            rows.append(self._phase("failing", client, payload, options))
+
+            stub.set(failing=False)
+            time.sleep(options["reset_timeout"])
+            rows.append(
+                {"phase": "after_reset", "state": client.breaker.state}
+            )
+            rows.append(self._phase("recovered", client, payload, options))
+            rows.append(dict(phase="total", **client.stats()))
+        return rows
+
+    @staticmethod
+    def _phase(phase, client, payload, options):
+        timings = []
+        errors = 0
+        for _ in range(options["repeat"]):
+            started = time.perf_counter()
+            try:
+                client.pack(payload)
+            except DSUnavailable:
+                errors += 1
+            timings.append(time.perf_counter() - started)
+        return summarize(
+            timings, phase=phase, state=client.breaker.state, errors=errors
+        )
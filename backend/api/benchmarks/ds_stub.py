@@ -0,0 +1,71 @@
+"""Локальная заглушка DS для сценариев нагрузочного тестирования."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._reply({"status": "ok"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self._reply({"package": self.server.package})
+
+    def _reply(self, body):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.failing:
+            status, body = 503, {"error": "unavailable"}
+        else:
+            status = 200
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except ConnectionError:
+            # Клиент не дождался ответа (таймаут запроса к DS).
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubDS:
+    """HTTP-сервер, отвечающий как DS.
+    Задержку, код упаковки и режим отказа можно менять на лету."""
+
+    def __init__(self, package="YMA", latency=0.0):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.daemon_threads = True
+        self.server.package = package
+        self.server.latency = latency
+        self.server.failing = False
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+
+    @property
+    def pack_url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/pack"
+
+    def set(self, **attrs):
+        for name, value in attrs.items():
+            setattr(self.server, name, value)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,62 @@
+"""Генерация синтетических данных для сценариев."""
+import random
+
+from items.models import CargoType, CartonType, Order, OrderSku, Sku
+
+
+def make_skus(count, quantity=10**9, seed=0):
+    rnd = random.Random(seed)
+    return Sku.objects.bulk_create(
+        Sku(
+            name=f"sku-{index}",
+            length=round(rnd.uniform(1, 40), 1),
+            width=round(rnd.uniform(1, 30), 1),
+            height=round(rnd.uniform(1, 20), 1),
+            goods_wght=round(rnd.uniform(0.05, 5), 2),
+            quantity=quantity,
+        )
+        for index in range(count)
+    )
+
+
+def make_cartontypes(count, seed=0):
+    rnd = random.Random(seed)
+    return CartonType.objects.bulk_create(
+        CartonType(
+            cartontype=f"BOX{index}",
+            length=round(rnd.uniform(10, 80), 1),
+            width=round(rnd.uniform(10, 60), 1),
+            height=round(rnd.uniform(5, 50), 1),
+        )
+        for index in range(count)
+    )
+
+
+def order_payload(skus, amount=1):
+    return {"skus": [{"sku": str(sku.pk), "amount": amount} for sku in skus]}
+
+
+def make_cargotypes(codes=(910, 900, 520, 300, 10)):
+    return CargoType.objects.bulk_create(
+        CargoType(cargotype=code, description=f"cargotype {code}")
+        for code in codes
+    )
+
+
+def link_cargotypes(skus, cargotypes, seed=0):
+    rnd = random.Random(seed)
+    through = Sku.cargotypes.through
+    through.objects.bulk_create(
+        through(sku_id=sku.pk, cargotype_id=cargotype.pk)
+        for sku in skus
+        for cargotype in rnd.sample(cargotypes, rnd.randint(0, 2))
+    )
+    Sku.refresh_packaging_hints([sku.pk for sku in skus])
+
+
+def make_order(skus, amount=1, status="forming"):
+    order = Order.objects.create(status=status)
+    OrderSku.objects.bulk_create(
+        OrderSku(order=order, sku=sku, amount=amount) for sku in skus
+    )
+    return order
@@ -0,0 +1,151 @@
+import random
+import time
+
+from django.core.management.base import CommandError
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from items.models import (
+    Cell,
+    CellOrderSku,
+    CellOrderSkuArchive,
+    Order,
+    OrderArchive,
+    OrderSku,
+)
+from users.models import Table, User
+
+from .base import Scenario, register
+from .fixtures import make_cartontypes, make_skus
+
+
+@register
+class OrderArchiveScenario(Scenario):
+    """Перенос собранных заказов в архив пачками по --batch-size.
+    Половина заказов собрана и уходит в архив, остальные остаются в
+    рабочих таблицах. Сценарий проверяет, что детали архивных заказов
+    отдаются с тем же телом и ETag, что и до переноса, что повторный
+    запуск ничего не переносит, и завершается ошибкой при расхождении."""
+
+    name = "order_archive"
+    help = "Перенос собранных заказов в архив и детали архивных заказов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=20000)
+        parser.add_argument("--lines", type=int, default=5)
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--samples", type=int, default=50)
+
+    def run(self, options):
+        orders = self._seed(options)
+        collected = [order for order in orders if order.status == "collected"]
+        samples = random.Random(0).sample(
+            collected, min(options["samples"], len(collected))
+        )
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username="bench"))
+        before = {
+            order.pk: self._details(client, order.pk) for order in samples
+        }
+
+        cutoff = timezone.now()
+        timings = []
+        while True:
+            started = time.perf_counter()
+            count = OrderArchive.objects.archive_batch(
+                cutoff, batch_size=options["batch_size"]
+            )
+            if not count:
+                break
+            timings.append(time.perf_counter() - started)
+        elapsed = sum(timings)
+
+        problems = []
+        if OrderArchive.objects.archive_batch(cutoff):
+            problems.append("second run archived orders")
+        if Order.objects.filter(status="collected").exists():
+            problems.append("collected orders left in Order")
+        if Order.objects.count() != len(orders) - len(collected):
+            problems.append("active orders were archived")
+        if OrderArchive.objects.count() != len(collected):
+            problems.append("archive size differs")
+        if CellOrderSkuArchive.objects.count() != len(collected) * (
+            options["lines"]
+        ):
+            problems.append("cell placements were not archived")
+        selected = OrderArchive.selected_cartontypes.through.objects.count()
+        if selected != len(collected):
+            problems.append("selected carton types were not archived")
+        for orderkey, expected in before.items():
+            if self._details(client, orderkey) != expected:
+                problems.append(f"details of {orderkey} changed")
+                break
+        if problems:
+            raise CommandError("; ".join(problems))
+
+        return [
+            {
+                "orders": len(orders),
+                "archived": len(collected),
+                "batch_size": options["batch_size"],
+                "batches": len(timings),
+                "seconds": round(elapsed, 3),
+                "orders_per_s": round(len(collected) / elapsed, 1),
+                "max_batch_ms": round(max(timings) * 1000, 1),
+                "active_orders": Order.objects.count(),
+                "active_order_skus": OrderSku.objects.count(),
+            }
+        ]
+
+    @staticmethod
+    def _details(client, orderkey):
+        response = client.get(f"/api/order/details/?orderkey={orderkey}")
+        if response.status_code != 200:
+            raise CommandError(f"details: {response.status_code}")
+        return response.json(), response["ETag"]
+
+    @staticmethod
+    def _seed(options, seed=0):
+        rnd = random.Random(seed)
+        skus = make_skus(max(options["lines"] * 20, 100))
+        cartontypes = make_cartontypes(5)
+        table = Table.objects.create(name="archive", description="bench")
+        cells = Cell.objects.bulk_create(
+            Cell(name=str(index), table=table) for index in range(20)
+        )
+        orders = Order.objects.bulk_create(
+            Order(
+                status=rnd.choice(("forming", "collected")),
+                recommended_cartontype=rnd.choice(cartontypes),
+                total_packages=1,
+            )
+            for _ in range(options["orders"])
+        )
+        order_skus = []
+        cell_order_skus = []
+        selected = []
+        through = Order.selected_cartontypes.through
+        for order in orders:
+            cell = rnd.choice(cells)
+            for number, sku in enumerate(rnd.sample(skus, options["lines"])):
+                order_skus.append(
+                    OrderSku(
+                        order=order,
+                        sku=sku,
+                        amount=rnd.randint(1, 3),
+                        packaging_number=number % 2 + 1,
+                    )
+                )
+                cell_order_skus.append(
+                    CellOrderSku(cell=cell, sku=sku, order=order, quantity=1)
+                )
+            selected.append(
+                through(
+                    order_id=order.pk,
+                    cartontype_id=rnd.choice(cartontypes).pk,
+                )
+            )
+        OrderSku.objects.bulk_create(order_skus, batch_size=5000)
+        CellOrderSku.objects.bulk_create(cell_order_skus, batch_size=5000)
+        through.objects.bulk_create(selected, batch_size=5000)
+        return orders
@@ -0,0 +1,39 @@
+from unittest import mock
+
+from rest_framework.test import APIClient
+
+from .base import Scenario, measure, register, summarize
+from .fixtures import make_skus, order_payload
+
+
+@register
+class OrderCreateScenario(Scenario):
+    """Создание заказа: число запросов и задержка от размера заказа.
+    Отложенный расчёт упаковки не запускается."""
+
+    name = "order_create"
+    help = "POST /api/order/create/ для заказов разного размера"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--sizes", type=int, nargs="+", default=[1, 10, 40, 100]
+        )
+
+    def run(self, options):
+        skus = make_skus(max(options["sizes"]))
+        client = APIClient()
+        rows = []
+        with mock.patch("api.recommendations.schedule"):
+            for size in options["sizes"]:
+                payload = order_payload(skus[:size])
+
+                def create_order():
+                    response = client.post(
+                        "/api/order/create/", payload, format="json"
+                    )
+                    assert response.status_code == 201, response.data
+
+                timings, queries = measure(create_order, options["repeat"])
+                rows.append(summarize(timings, lines=size, queries=queries))
+        return rows
@@ -0,0 +1,132 @@
+import os
+import random
+import tempfile
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from items.renditions import rendition_name
+
+from .base import (
+    Scenario,
+    measure,
+    register,
+    require_constant_queries,
+    summarize,
+)
+from .fixtures import link_cargotypes, make_cargotypes, make_order, make_skus
+
+
+def attach_images(skus, size, seed=0):
+    """Загружает товарам изображения size x size из шума (плохо
+    сжимаются, как фотографии)."""
+
+    rnd = random.Random(seed)
+    for sku in skus:
+        image = Image.frombytes(
+            "RGB", (size, size), rnd.randbytes(size * size * 3)
+        )
+        buffer = BytesIO()
+        image.save(buffer, "PNG")
+        sku.image.save(f"{sku.pk}.png", ContentFile(buffer.getvalue()))
+
+
+@register
+class OrderDetailsScenario(Scenario):
+    """Детали заказа: число запросов не должно зависеть от числа
+    позиций, иначе сценарий завершается ошибкой. С --images
+    сравнивает ответ со ссылками на миниатюры и ответ с миниатюрами
+    в base64. Строки с revalidated=True — повторный запрос с
+    If-None-Match, на который ожидается 304."""
+
+    name = "order_details"
+    help = "GET /api/order/details/ для заказов разного размера"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--sizes", type=int, nargs="+", default=[1, 10, 50]
+        )
+        parser.add_argument(
+            "--images",
+            type=int,
+            default=0,
+            help="Размер стороны изображений товаров в пикселях.",
+        )
+
+    def run(self, options):
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                return self._run(options, media_root)
+
+    def _run(self, options, media_root):
+        skus = make_skus(max(options["sizes"]))
+        link_cargotypes(skus, make_cargotypes())
+        modes = {"url": ""}
+        if options["images"]:
+            attach_images(skus, options["images"])
+            modes["inline"] = "&inline_images=1"
+        client = APIClient()
+        rows = []
+        for size in options["sizes"]:
+            order = make_order(skus[:size])
+            for mode, query in modes.items():
+                url = f"/api/order/details/?orderkey={order.pk}{query}"
+                sizes = []
+
+                etags = []
+
+                def get_details():
+                    response = client.get(url)
+                    assert response.status_code == 200, response.data
+                    sizes.append(len(response.content))
+                    etags.append(response["ETag"])
+
+                def revalidate():
+                    response = client.get(url, HTTP_IF_NONE_MATCH=etags[-1])
+                    assert response.status_code == 304, response.status_code
+
+                for func, revalidated in (
+                    (get_details, False),
+                    (revalidate, True),
+                ):
+                    timings, queries = measure(func, options["repeat"])
+                    rows.append(
+                        summarize(
+                            timings,
+                            lines=size,
+                            mode=mode,
+                            revalidated=revalidated,
+                            queries=queries,
+                            bytes=0 if revalidated else sizes[-1],
+                        )
+                    )
+
+        for revalidated in (False, True):
+            require_constant_queries(
+                [row for row in rows if row["revalidated"] is revalidated]
+            )
+        if options["images"]:
+            rows.append(self._image_sizes(skus, media_root))
+        return rows
+
+    @staticmethod
+    def _image_sizes(skus, media_root):
+        row = {"mode": "files", "original_avg_bytes": 0}
+        for sku in skus:
+            sku.refresh_from_db(fields=["image", "image_hash"])
+            row["original_avg_bytes"] += sku.image.size
+            for size in (64, 256):
+                key = f"rendition_{size}_avg_bytes"
+                row[key] = row.get(key, 0) + os.path.getsize(
+                    os.path.join(
+                        media_root, rendition_name(sku.image_hash, size)
+                    )
+                )
+        for key in list(row):
+            if key.endswith("_bytes"):
+                row[key] //= len(skus)
+        return row
@@ -0,0 +1,158 @@
+import json
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from items.models import Cell, CellOrderSku, Order, TableOrderQueue
+from users.models import Table, User
+
+from api import prefetch
+from api.serializers import GetOrderSerializer
+
+from .base import Scenario, register, summarize
+from .fixtures import make_order, make_skus
+
+
+@register
+class OrderPrefetchScenario(Scenario):
+    """Упаковщик раз за разом проходит order/find → order/details →
+    order/collected без подготовки следующего заказа и с ней. Между
+    сборкой и следующим поиском он упаковывает заказ --think-time
+    секунд, за это время в фоне готовится следующий заказ. Каждые
+    --reload-every заказов следующий заказ дораскладывается в новую
+    ячейку уже после подготовки. Каждый ответ сверяется с построенным
+    из базы; при расхождении сценарий завершается ошибкой."""
+
+    name = "order_prefetch"
+    help = "order/find и order/details с подготовкой следующего заказа"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=200)
+        parser.add_argument("--lines", type=int, default=10)
+        parser.add_argument("--think-time", type=float, default=0.02)
+        parser.add_argument("--reload-every", type=int, default=10)
+
+    def run(self, options):
+        skus = make_skus(options["lines"])
+        rows = []
+        for mode, enabled in (("cold", False), ("prefetch", True)):
+            cache.clear()
+            with override_settings(ORDER_PREFETCH=enabled):
+                rows.extend(self._packer(mode, skus, options))
+        return rows
+
+    def _packer(self, mode, skus, options):
+        table = Table.objects.create(name=f"prefetch-{mode}")
+        user = User.objects.create(username=f"packer-{mode}", table=table)
+        cells = Cell.objects.bulk_create(
+            Cell(name=str(index), table=table) for index in range(3)
+        )
+        for index in range(options["orders"]):
+            order = make_order(skus)
+            CellOrderSku.objects.bulk_create(
+                CellOrderSku(
+                    cell=cells[(index + line) % len(cells)],
+                    sku=sku,
+                    order=order,
+                    quantity=1,
+                )
+                for line, sku in enumerate(skus)
+            )
+            TableOrderQueue.objects.enqueue(table.pk, order.pk)
+
+        client = APIClient()
+        client.force_authenticate(user)
+        timings = defaultdict(list)
+        queries = defaultdict(list)
+
+        def call(endpoint, method, path, **kwargs):
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                response = getattr(client, method)(
+                    path, format="json", **kwargs
+                )
+                timings[endpoint].append(time.perf_counter() - started)
+            queries[endpoint].append(len(ctx.captured_queries))
+            if response.status_code != 200:
+                raise CommandError(f"{endpoint}: {response.status_code}")
+            return json.loads(response.content)
+
+        for index in range(options["orders"]):
+            found = call("order/find", "get", "/api/order/find/")
+            orderkey = found["oldest_order"]
+            details = call(
+                "order/details",
+                "get",
+                f"/api/order/details/?orderkey={orderkey}",
+            )
+            call(
+                "order/collected",
+                "patch",
+                "/api/order/collected/",
+                data={"orderkey": orderkey, "status": "collected"},
+            )
+            self._check(orderkey, found, details)
+            time.sleep(options["think_time"])
+            if (index + 1) % options["reload_every"] == 0:
+                self._reload(client, table, skus)
+
+        return [
+            summarize(
+                timings[endpoint],
+                mode=mode,
+                endpoint=endpoint,
+                queries_mean=round(
+                    sum(queries[endpoint]) / len(queries[endpoint]), 2
+                ),
+            )
+            for endpoint in ("order/find", "order/details")
+        ]
+
+    @staticmethod
+    def _reload(client, table, skus):
+        """Дораскладывает первый заказ очереди в новую ячейку."""
+        orderkey = (
+            TableOrderQueue.objects.filter(table=table)
+            .order_by("order_created_at", "id")
+            .values_list("order_id", flat=True)
+            .first()
+        )
+        if orderkey is None:
+            return
+        cell = Cell.objects.create(
+            name=str(Cell.objects.filter(table=table).count()), table=table
+        )
+        response = client.post(
+            "/api/upload-to-cell/",
+            {
+                "cell_barcode": str(cell.pk),
+                "order": str(orderkey),
+                "table_name": table.name,
+                "skus": [{"sku": str(skus[0].pk), "quantity": 1}],
+            },
+            format="json",
+        )
+        if response.status_code != 201:
+            raise CommandError(f"upload-to-cell: {response.status_code}")
+
+    @staticmethod
+    def _check(orderkey, found, details):
+        order = Order.objects.with_details().get(pk=orderkey)
+        expected = json.loads(
+            JSONRenderer().render(
+                GetOrderSerializer(
+                    order, context={"inline_images": False}
+                ).data
+            )
+        )
+        cells = json.loads(
+            JSONRenderer().render(prefetch.order_cells(orderkey))
+        )
+        if details != expected or found["cells"] != cells:
+            raise CommandError(f"Stale response for order {orderkey}")
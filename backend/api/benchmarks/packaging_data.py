@@ -0,0 +1,66 @@
+from itertools import count
+
+from rest_framework.test import APIClient
+
+from .base import (
+    Scenario,
+    measure,
+    register,
+    require_constant_queries,
+    summarize,
+)
+from .fixtures import make_cartontypes, make_order, make_skus
+
+
+@register
+class PackagingDataScenario(Scenario):
+    """Запись данных об упаковке заказа. Запросы чередуют два набора
+    данных, чтобы каждый из них действительно что-то менял. Число
+    SQL-запросов не должно зависеть от числа строк."""
+
+    name = "packaging_data"
+    help = "PATCH /api/order/add-packaging-data/ для разного числа строк"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--sizes", type=int, nargs="+", default=[1, 10, 50, 200]
+        )
+
+    def run(self, options):
+        skus = make_skus(max(options["sizes"]))
+        cartontypes = make_cartontypes(4)
+        client = APIClient()
+        rows = []
+        for size in options["sizes"]:
+            order = make_order(skus[:size])
+            payloads = [
+                {
+                    "orderkey": str(order.pk),
+                    "selected_cartontypes": [
+                        str(cartontype.pk)
+                        for cartontype in cartontypes[variant : variant + 2]
+                    ],
+                    "total_packages": variant + 1,
+                    "skus": [
+                        {"sku": str(sku.pk), "packaging_number": variant + 1}
+                        for sku in skus[:size]
+                    ],
+                }
+                for variant in range(2)
+            ]
+            runs = count()
+
+            def patch():
+                response = client.patch(
+                    "/api/order/add-packaging-data/",
+                    payloads[next(runs) % 2],
+                    format="json",
+                )
+                assert response.status_code == 200, response.data
+
+            timings, queries = measure(patch, options["repeat"])
+            rows.append(summarize(timings, lines=size, queries=queries))
+
+        require_constant_queries(rows)
+        return rows
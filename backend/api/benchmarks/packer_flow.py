@@ -0,0 +1,256 @@
+import threading
+import time
+from collections import defaultdict
+from unittest import mock
+
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.db.models import Count
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from items.models import Cell, Order
+from users.models import Printer, Table, User
+
+from .base import Scenario, register, summarize
+from .ds_stub import StubDS
+from .fixtures import make_cartontypes, make_skus, order_payload
+
+ENDPOINTS = (
+    "order/create",
+    "upload-to-cell",
+    "order/find",
+    "order/details",
+    "order/add-packaging-data",
+    "order/collected",
+)
+
+
+class Packer:
+    """Упаковщик со своим столом, принтером и ячейкой. Проходит
+    цикл от создания заказа до его сборки, собирая длительность и
+    число SQL-запросов каждого запроса к API."""
+
+    def __init__(self, index, skus, cartontypes, lines):
+        table = Table.objects.create(
+            name=f"bench-{index}", description="bench"
+        )
+        self.user = User.objects.create(
+            username=f"packer-{index}",
+            table=table,
+            printer=Printer.objects.create(),
+        )
+        self.table = table
+        self.cell = Cell.objects.create(name=str(index)[:4], table=table)
+        self.skus = skus[index * lines : (index + 1) * lines]
+        self.cartontypes = [str(cartontype.pk) for cartontype in cartontypes]
+        self.timings = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.error = None
+
+    def run(self, iterations, barrier):
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        try:
+            barrier.wait()
+            for _ in range(iterations):
+                self.flow(client)
+        except Exception as exc:
+            self.error = exc
+        finally:
+            connections.close_all()
+
+    def call(self, client, endpoint, method, path, expected, **kwargs):
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            response = getattr(client, method)(path, format="json", **kwargs)
+            self.timings[endpoint].append(time.perf_counter() - started)
+        self.queries[endpoint].append(len(ctx.captured_queries))
+        if response.status_code != expected:
+            raise AssertionError(
+                f"{endpoint}: {response.status_code} {response.data}"
+            )
+        return response.data
+
+    def flow(self, client):
+        orderkey = str(
+            self.call(
+                client,
+                "order/create",
+                "post",
+                "/api/order/create/",
+                201,
+                data=order_payload(self.skus),
+            )["orderkey"]
+        )
+        self.call(
+            client,
+            "upload-to-cell",
+            "post",
+            "/api/upload-to-cell/",
+            201,
+            data={
+                "cell_barcode": str(self.cell.pk),
+                "order": orderkey,
+                "table_name": self.table.name,
+                "skus": [
+                    {"sku": str(sku.pk), "quantity": 1} for sku in self.skus
+                ],
+            },
+        )
+        found = self.call(client, "order/find", "get", "/api/order/find/", 200)
+        if str(found["oldest_order"]) != orderkey:
+            raise AssertionError(f"order/find returned {found}")
+        self.call(
+            client,
+            "order/details",
+            "get",
+            f"/api/order/details/?orderkey={orderkey}",
+            200,
+        )
+        self.call(
+            client,
+            "order/add-packaging-data",
+            "patch",
+            "/api/order/add-packaging-data/",
+            200,
+            data={
+                "orderkey": orderkey,
+                "selected_cartontypes": self.cartontypes[:1],
+                "total_packages": 1,
+                "skus": [
+                    {"sku": str(sku.pk), "packaging_number": 1}
+                    for sku in self.skus
+                ],
+            },
+        )
+        self.call(
+            client,
+            "order/collected",
+            "patch",
+            "/api/order/collected/",
+            200,
+            data={"orderkey": orderkey, "status": "collected"},
+        )
+
+
+@register
+class PackerFlowScenario(Scenario):
+    """Полный цикл работы упаковщиков: создание заказа, раскладка по
+    ячейке, поиск, детали, данные об упаковке, сборка. Упаковщики
+    работают в параллельных потоках со своими соединениями с базой,
+    упаковку рассчитывает DS-заглушка. Для честной конкуренции нужен
+    PostgreSQL: SQLite сериализует запись."""
+
+    name = "packer_flow"
+    help = "Сквозной сценарий упаковщиков в N потоках"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--packers", type=int, default=4)
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=25,
+            help="Число заказов на упаковщика.",
+        )
+        parser.add_argument(
+            "--lines", type=int, default=10, help="Позиций в заказе."
+        )
+        parser.add_argument(
+            "--ds-latency",
+            type=float,
+            default=0.05,
+            help="Задержка ответа DS-заглушки в секундах.",
+        )
+
+    def run(self, options):
+        skus = make_skus(options["packers"] * options["lines"])
+        cartontypes = make_cartontypes(10)
+        packers = [
+            Packer(index, skus, cartontypes, options["lines"])
+            for index in range(options["packers"])
+        ]
+        barrier = threading.Barrier(len(packers) + 1)
+        threads = [
+            threading.Thread(
+                target=packer.run, args=(options["iterations"], barrier)
+            )
+            for packer in packers
+        ]
+
+        with StubDS(
+            package=cartontypes[0].cartontype, latency=options["ds_latency"]
+        ) as stub, override_settings(
+            DATA_SCIENTIST_PACK=stub.pack_url
+        ), mock.patch(
+            "api.ds_client._client", None
+        ):
+            for thread in threads:
+                thread.start()
+            barrier.wait()
+            started = time.perf_counter()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            recommendations = self._wait_for_recommendations()
+
+        failed = [packer.error for packer in packers if packer.error]
+        if failed:
+            raise CommandError(f"Packer failed: {failed[0]}")
+
+        rows = []
+        for endpoint in ENDPOINTS:
+            timings = [
+                value
+                for packer in packers
+                for value in packer.timings[endpoint]
+            ]
+            queries = [
+                value
+                for packer in packers
+                for value in packer.queries[endpoint]
+            ]
+            rows.append(
+                summarize(
+                    timings,
+                    endpoint=endpoint,
+                    rps=round(len(timings) / elapsed, 1),
+                    queries_max=max(queries),
+                    queries_mean=round(sum(queries) / len(queries), 2),
+                )
+            )
+        flows = options["packers"] * options["iterations"]
+        rows.append(
+            {
+                "endpoint": "total",
+                "packers": options["packers"],
+                "orders": flows,
+                "seconds": round(elapsed, 3),
+                "orders_per_s": round(flows / elapsed, 2),
+                **recommendations,
+            }
+        )
+        return rows
+
+    @staticmethod
+    def _wait_for_recommendations(timeout=30.0):
+        """Ждёт отложенный расчёт упаковки, чтобы его потоки не
+        обращались к базе после её удаления."""
+
+        deadline = time.monotonic() + timeout
+        pending = Order.objects.filter(recommendation_status="pending")
+        while pending.exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return {
+            f"recommendation_{status}": count
+            for status, count in Order.objects.values_list(
+                "recommendation_status"
+            )
+            .annotate(count=Count("pk"))
+            .order_by("recommendation_status")
+        }
@@ -0,0 +1,71 @@
+import random
+import time
+
+from api.packing import CartonCatalog
+
+from .base import Scenario, register
+
+
+@register
+class PackingScenario(Scenario):
+    """Пропускная способность локального подбора упаковки
+    на синтетическом каталоге коробок."""
+
+    name = "packing"
+    help = "Локальный подбор упаковки (api/packing.py)"
+    uses_database = False
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=20000)
+        parser.add_argument("--cartons", type=int, nargs="+", default=[30])
+        parser.add_argument("--lines", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def run(self, options):
+        rnd = random.Random(options["seed"])
+        orders = [
+            [
+                (
+                    rnd.uniform(1, 40),
+                    rnd.uniform(1, 30),
+                    rnd.uniform(1, 20),
+                    rnd.randint(1, 3),
+                )
+                for _ in range(rnd.randint(1, options["lines"] * 2 - 1))
+            ]
+            for _ in range(options["orders"])
+        ]
+        rows = []
+        for cartons in options["cartons"]:
+            catalog = CartonCatalog(
+                [f"BOX{index}" for index in range(cartons)],
+                [
+                    (
+                        rnd.uniform(10, 120),
+                        rnd.uniform(10, 80),
+                        rnd.uniform(5, 60),
+                    )
+                    for _ in range(cartons)
+                ],
+                fill_ratio=0.85,
+            )
+
+            started = time.perf_counter()
+            single = [catalog.recommend(items) for items in orders]
+            single_elapsed = time.perf_counter() - started
+
+            started = time.perf_counter()
+            batch = catalog.recommend_many(orders)
+            batch_elapsed = time.perf_counter() - started
+
+            assert single == batch
+            rows.append(
+                {
+                    "cartons": cartons,
+                    "orders": len(orders),
+                    "feasible": sum(code is not None for code in single),
+                    "single_orders_per_s": round(len(orders) / single_elapsed),
+                    "batch_orders_per_s": round(len(orders) / batch_elapsed),
+                }
+            )
+        return rows
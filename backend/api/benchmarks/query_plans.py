@@ -0,0 +1,193 @@
+import json
+import random
+
+from django.core.management.base import CommandError
+from django.db import connection
+from django.utils import timezone
+
+from items.models import Cell, CellOrderSku, Order, OrderSku, TableOrderQueue
+from users.models import Table
+
+from .base import Scenario, register
+from .fixtures import make_skus
+
+
+def hot_queries(table_id, orderkey, sku_ids):
+    """Запросы API на горячем пути и выборка пачки для архива, в том
+    виде, в каком их строит код."""
+    return {
+        "queue_pop": TableOrderQueue.objects.filter(table_id=table_id)
+        .order_by("order_created_at", "id")
+        .values("pk")[:1],
+        "order_version": Order.objects.filter(pk=orderkey).values_list(
+            "version"
+        ),
+        "order_details_skus": OrderSku.objects.filter(order_id__in=[orderkey])
+        .select_related("sku")
+        .order_by("sku"),
+        "order_sku_lookup": OrderSku.objects.filter(
+            order_id=orderkey, sku_id__in=sku_ids
+        ).values_list("sku_id"),
+        "order_cells": Cell.objects.filter(
+            pk__in=CellOrderSku.objects.filter(order_id=orderkey).values(
+                "cell_id"
+            )
+        ),
+        "archive_batch": Order.objects.filter(
+            status="collected", created_at__lt=timezone.now()
+        )
+        .order_by("created_at")
+        .values("pk")[:1000],
+    }
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from plan_nodes(child)
+
+
+def explain(queryset):
+    """План EXPLAIN ANALYZE в формате JSON и список его узлов."""
+    plan = json.loads(queryset.explain(format="json", analyze=True))[0]
+    return plan, list(plan_nodes(plan["Plan"]))
+
+
+def seq_scans(nodes):
+    """Таблицы, которые план читает полным просмотром."""
+    return {
+        node["Relation Name"]
+        for node in nodes
+        if node["Node Type"] == "Seq Scan"
+    }
+
+
+def seed_orders(orders, tables, cells, lines, skus, seed=0):
+    """Заказы разложены по ячейкам случайных столов; половина уже
+    собрана, остальные ждут упаковщика."""
+
+    rnd = random.Random(seed)
+    skus = make_skus(skus)
+    tables = Table.objects.bulk_create(
+        Table(name=f"plan-{index}", description="bench")
+        for index in range(tables)
+    )
+    cells = Cell.objects.bulk_create(
+        Cell(name=str(index), table=table)
+        for table in tables
+        for index in range(cells)
+    )
+    orders = Order.objects.bulk_create(
+        Order(status=rnd.choice(("forming", "collected")))
+        for _ in range(orders)
+    )
+    order_skus = []
+    cell_order_skus = []
+    order_cells = []
+    for order in orders:
+        cell = rnd.choice(cells)
+        order_cells.append(cell)
+        for sku in rnd.sample(skus, lines):
+            order_skus.append(OrderSku(order=order, sku=sku, amount=1))
+            cell_order_skus.append(
+                CellOrderSku(cell=cell, sku=sku, order=order, quantity=1)
+            )
+    OrderSku.objects.bulk_create(order_skus, batch_size=5000)
+    CellOrderSku.objects.bulk_create(cell_order_skus, batch_size=5000)
+    TableOrderQueue.objects.bulk_create(
+        (
+            TableOrderQueue(
+                table_id=cell.table_id,
+                order_id=order.pk,
+                order_created_at=order.created_at,
+            )
+            for order, cell in zip(orders, order_cells)
+            if order.status == "forming"
+        ),
+        batch_size=5000,
+    )
+    return orders
+
+
+@register
+class QueryPlansScenario(Scenario):
+    """EXPLAIN ANALYZE горячих запросов на заполненной базе. Сценарий
+    завершается ошибкой, если хотя бы один план читает полным
+    просмотром (Seq Scan) таблицу не меньше --min-rows строк: для
+    маленьких справочников вроде ячеек такой план бывает дешевле
+    индекса. Только для PostgreSQL."""
+
+    name = "query_plans"
+    help = "Проверка планов горячих запросов на отсутствие Seq Scan"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=20000)
+        parser.add_argument("--tables", type=int, default=50)
+        parser.add_argument("--cells", type=int, default=20)
+        parser.add_argument("--lines", type=int, default=5)
+        parser.add_argument("--skus", type=int, default=2000)
+        parser.add_argument("--min-rows", type=int, default=10000)
+
+    def run(self, options):
+        if connection.vendor != "postgresql":
+            raise CommandError("query_plans requires PostgreSQL")
+
+        orders = seed_orders(
+            options["orders"],
+            options["tables"],
+            options["cells"],
+            options["lines"],
+            options["skus"],
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+            cursor.execute(
+                "SELECT relname FROM pg_class "
+                "WHERE relkind = 'r' AND reltuples >= %s",
+                [options["min_rows"]],
+            )
+            large_tables = {relname for relname, in cursor.fetchall()}
+
+        order = orders[len(orders) // 2]
+        cell = CellOrderSku.objects.filter(order=order).first().cell
+        sku_ids = list(
+            OrderSku.objects.filter(order=order).values_list(
+                "sku_id", flat=True
+            )
+        )
+        rows = []
+        regressions = []
+        for name, queryset in hot_queries(
+            cell.table_id, order.pk, sku_ids
+        ).items():
+            plan, nodes = explain(queryset)
+            scanned = sorted(seq_scans(nodes) & large_tables)
+            if scanned:
+                regressions.append(f"{name}: {', '.join(scanned)}")
+            rows.append(
+                {
+                    "query": name,
+                    "scans": ", ".join(
+                        sorted(
+                            {
+                                "{}({})".format(
+                                    node["Node Type"],
+                                    node.get("Index Name")
+                                    or node["Relation Name"],
+                                )
+                                for node in nodes
+                                if "Index Name" in node
+                                or "Relation Name" in node
+                            }
+                        )
+                    ),
+                    "cost": plan["Plan"]["Total Cost"],
+                    "execution_ms": plan["Execution Time"],
+                }
+            )
+
+        if regressions:
+            raise CommandError(
+                "Sequential scan on hot path: " + "; ".join(regressions)
+            )
+        return rows
@@ -0,0 +1,128 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from items.models import Cell, TableOrderQueue
+from users.models import Table, User
+
+from api.db_routing import PIN_COOKIE, pin_key
+
+from .base import Scenario, register
+from .fixtures import make_cartontypes, make_order, make_skus
+
+
+@register
+class ReplicaRoutingScenario(Scenario):
+    """Проверка маршрутизации чтения: какие запросы API уходят на
+    реплику, а какие на основную базу, в том числе сразу после записи и
+    после order/find. Пользователь для аутентификации всегда читается с
+    основной базы, такие запросы считаются отдельно (auth). Нужна хотя бы одна реплика, для локальной
+    проверки подойдёт тот же сервер: DB_REPLICA_HOSTS=$DB_HOST.
+    Сценарий завершается ошибкой, если запрос попал не в ту базу."""
+
+    name = "replica_routing"
+    help = "Проверка чтения с реплик и закрепления после записи"
+
+    def run(self, options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("No replicas configured, see DB_REPLICA_HOSTS")
+
+        table = Table.objects.create(name="bench", description="bench")
+        user = User.objects.create(username="packer", table=table)
+        skus = make_skus(3)
+        cartontypes = make_cartontypes(1)
+        orders = [make_order(skus) for _ in range(3)]
+        cell = Cell.objects.create(name="1", table=table)
+        TableOrderQueue.objects.enqueue(table.pk, orders[2].pk)
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}"
+        )
+        details = f"/api/order/details/?orderkey={orders[0].pk}"
+        packaging = {
+            "orderkey": str(orders[0].pk),
+            "selected_cartontypes": [str(cartontypes[0].pk)],
+            "total_packages": 1,
+            "skus": [
+                {"sku": str(sku.pk), "packaging_number": 1} for sku in skus
+            ],
+        }
+        upload = {
+            "cell_barcode": str(cell.pk),
+            "order": str(orders[1].pk),
+            "table_name": table.name,
+            "skus": [{"sku": str(sku.pk), "quantity": 1} for sku in skus],
+        }
+
+        steps = (
+            ("tables", "replica", "get", "/api/tables/", None),
+            ("details", "replica", "get", details, None),
+            (
+                "upload-to-cell",
+                "default",
+                "post",
+                "/api/upload-to-cell/",
+                upload,
+            ),
+            ("find after write", "default", "get", "/api/order/find/", None),
+            ("details after write", "default", "get", details, None),
+            ("pin expired", None, "expire", None, None),
+            ("details", "replica", "get", details, None),
+            # GET order/find забирает заказ и тоже закрепляет клиента.
+            ("find", "default", "get", "/api/order/find/", None),
+            ("details after find", "default", "get", details, None),
+            ("pin expired", None, "expire", None, None),
+            (
+                "add-packaging-data",
+                "default",
+                "patch",
+                "/api/order/add-packaging-data/",
+                packaging,
+            ),
+            ("tables after write", "default", "get", "/api/tables/", None),
+        )
+        rows = []
+        for step, expected, method, path, data in steps:
+            if method == "expire":
+                client.cookies[PIN_COOKIE] = "0"
+                cache.delete(pin_key(user.pk))
+                continue
+            counts = self._call(client, method, path, data)
+            rows.append({"request": step, "expected": expected, **counts})
+            other = "replica" if expected == "default" else "default"
+            if not counts[expected] or counts[other]:
+                raise CommandError(f"{step}: unexpected routing {counts}")
+        return rows
+
+    @staticmethod
+    def _call(client, method, path, data):
+        replicas = [
+            CaptureQueriesContext(connections[alias])
+            for alias in settings.DATABASE_REPLICAS
+        ]
+        primary = CaptureQueriesContext(connections["default"])
+        for context in (primary, *replicas):
+            context.__enter__()
+        try:
+            response = getattr(client, method)(path, data, format="json")
+        finally:
+            for context in (primary, *replicas):
+                context.__exit__(None, None, None)
+        if response.status_code >= 400:
+            raise CommandError(f"{path}: {response.status_code}")
+        auth = sum(
+            'FROM "users_user"' in query["sql"]
+            for query in primary.captured_queries
+        )
+        return {
+            "status": response.status_code,
+            "auth": auth,
+            "default": len(primary.captured_queries) - auth,
+            "replica": sum(
+                len(context.captured_queries) for context in replicas
+            ),
+        }
@@ -0,0 +1,183 @@
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import connection
+
+from items.models import Order
+
+from .base import Scenario, register, summarize
+from .ds_stub import StubDS
+from .fixtures import make_cartontypes, make_skus
+
+SERVERS = {
+    "wsgi": ["config.wsgi:application"],
+    "asgi": [
+        "config.asgi:application",
+        "--worker-class",
+        "uvicorn.workers.UvicornWorker",
+    ],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Server:
+    """gunicorn с одним воркером на тестовой базе сценария."""
+
+    def __init__(self, mode, env):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "gunicorn",
+                *SERVERS[mode],
+                "--bind",
+                f"127.0.0.1:{self.port}",
+            ],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def __enter__(self):
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError("Server exited on startup")
+            try:
+                requests.get(f"{self.url}/metrics", timeout=1)
+                return self
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        self.__exit__()
+        raise CommandError("Server did not start")
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        self.process.wait(timeout=30)
+
+
+@register
+class ServingModesScenario(Scenario):
+    """Создание заказов при медленном DS в режимах WSGI (синхронный
+    воркер gunicorn) и ASGI (UvicornWorker), по одному процессу. В WSGI
+    упаковку считает пул потоков процесса, в ASGI — обработчик запроса,
+    не занимая поток на время ожидания DS. Сравниваются задержка и
+    пропускная способность создания и время, за которое все заказы
+    получили рекомендацию."""
+
+    name = "serving_modes"
+    help = "POST /api/order/create/ в режимах WSGI и ASGI"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--modes",
+            nargs="+",
+            choices=sorted(SERVERS),
+            default=["wsgi", "asgi"],
+        )
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--lines", type=int, default=5)
+        parser.add_argument("--ds-latency", type=float, default=0.2)
+        parser.add_argument(
+            "--inline-timeout",
+            type=float,
+            default=1.0,
+            help="RECOMMENDATION_INLINE_TIMEOUT сервера в режиме ASGI.",
+        )
+
+    def run(self, options):
+        skus = make_skus(options["lines"])
+        cartontypes = make_cartontypes(3)
+        rows = []
+        with StubDS(
+            package=cartontypes[0].cartontype, latency=options["ds_latency"]
+        ) as stub, tempfile.TemporaryDirectory() as metrics_dir:
+            env = {
+                **os.environ,
+                "DB_NAME": connection.settings_dict["NAME"],
+                "DATA_SCIENTIST_PACK": stub.pack_url,
+                "RECOMMENDATION_INLINE_TIMEOUT": str(
+                    options["inline_timeout"]
+                ),
+                "PROMETHEUS_MULTIPROC_DIR": metrics_dir,
+                "GUNICORN_WORKERS": "1",
+            }
+            for index, mode in enumerate(options["modes"]):
+                with Server(mode, env) as server:
+                    rows.append(
+                        self._load(mode, server.url, skus, index, options)
+                    )
+        return rows
+
+    @staticmethod
+    def _load(mode, url, skus, mode_index, options):
+        local = threading.local()
+
+        def create(number):
+            # Состав каждого заказа уникален, чтобы не попадать в кэш
+            # рекомендаций.
+            payload = {
+                "skus": [
+                    {
+                        "sku": str(sku.pk),
+                        "amount": number + 1 if line == 0 else mode_index + 1,
+                    }
+                    for line, sku in enumerate(skus)
+                ]
+            }
+            session = getattr(local, "session", None)
+            if session is None:
+                session = local.session = requests.Session()
+            started = time.perf_counter()
+            response = session.post(
+                f"{url}/api/order/create/", json=payload, timeout=30
+            )
+            elapsed = time.perf_counter() - started
+            if response.status_code != 201:
+                raise CommandError(
+                    f"{mode}: {response.status_code} {response.text[:200]}"
+                )
+            return elapsed, response.json()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options["concurrency"]) as pool:
+            results = list(pool.map(create, range(options["requests"])))
+        elapsed = time.perf_counter() - started
+
+        orderkeys = [body["orderkey"] for _, body in results]
+        pending = Order.objects.filter(
+            pk__in=orderkeys, recommendation_status="pending"
+        )
+        while pending.exists() and time.perf_counter() - started < 120:
+            time.sleep(0.05)
+        all_ready = time.perf_counter() - started
+
+        return summarize(
+            [timing for timing, _ in results],
+            mode=mode,
+            concurrency=options["concurrency"],
+            rps=round(len(results) / elapsed, 1),
+            ready_in_response=sum(
+                body["recommendation_status"] == "ready" for _, body in results
+            ),
+            all_ready_s=round(all_ready, 3),
+            recommendations_per_s=round(len(results) / all_ready, 1),
+        )
@@ -0,0 +1,104 @@
+import random
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import CommandError
+from django.db import connections
+from rest_framework.test import APIClient
+
+from items.models import Order
+
+from .base import Scenario, register, summarize
+from .fixtures import make_order, make_skus
+
+
+@register
+class StatusContentionScenario(Scenario):
+    """Параллельная сборка одних и тех же заказов: каждый поток
+    отправляет PATCH /api/order/collected/ для всех заказов в своём
+    порядке. Ровно один запрос на заказ должен получить 200, остальные —
+    409; иначе сценарий завершается ошибкой. Для честной конкуренции
+    нужен PostgreSQL."""
+
+    name = "status_contention"
+    help = "PATCH /api/order/collected/ для одних заказов из N потоков"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--orders", type=int, default=200)
+
+    def run(self, options):
+        skus = make_skus(1)
+        orderkeys = [
+            str(make_order(skus, status="collecting").pk)
+            for _ in range(options["orders"])
+        ]
+        barrier = threading.Barrier(options["threads"] + 1)
+        results = []
+        lock = threading.Lock()
+
+        def worker(seed):
+            client = APIClient()
+            keys = orderkeys[:]
+            random.Random(seed).shuffle(keys)
+            local = []
+            try:
+                barrier.wait()
+                for orderkey in keys:
+                    started = time.perf_counter()
+                    response = client.patch(
+                        "/api/order/collected/",
+                        {"orderkey": orderkey, "status": "collected"},
+                        format="json",
+                    )
+                    local.append(
+                        (
+                            orderkey,
+                            response.status_code,
+                            time.perf_counter() - started,
+                        )
+                    )
+            finally:
+                connections.close_all()
+                with lock:
+                    results.extend(local)
+
+        threads = [
+            threading.Thread(target=worker, args=(seed,))
+            for seed in range(options["threads"])
+        ]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        statuses = Counter(code for _, code, _ in results)
+        winners = Counter(key for key, code, _ in results if code == 200)
+        collected = Order.objects.filter(
+            pk__in=orderkeys, status="collected"
+        ).count()
+        if (
+            len(results) != len(orderkeys) * options["threads"]
+            or set(statuses) - {200, 409}
+            or any(count != 1 for count in winners.values())
+            or len(winners) != len(orderkeys)
+            or collected != len(orderkeys)
+        ):
+            raise CommandError(
+                f"Unexpected outcome: {dict(statuses)}, "
+                f"{len(winners)} orders collected by API, {collected} in DB"
+            )
+        return [
+            summarize(
+                [timing for _, _, timing in results],
+                threads=options["threads"],
+                orders=len(orderkeys),
+                rps=round(len(results) / elapsed, 1),
+                ok=statuses[200],
+                conflict=statuses[409],
+            )
+        ]
@@ -0,0 +1,116 @@
+import io
+import json
+import time
+
+from django.core.management.base import CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from items.models import Cell, CellOrderSku, Order
+from users.models import Table
+
+from api import prefetch
+from api.parsers import MessagePackParser, ORJSONParser
+from api.renderers import MessagePackRenderer, ORJSONRenderer
+from api.serializers import FindOrderSerializer, GetOrderSerializer
+
+from .base import Scenario, register
+from .fixtures import make_cartontypes, make_order, make_skus
+
+FORMATS = (
+    ("json", JSONRenderer, JSONParser),
+    ("orjson", ORJSONRenderer, ORJSONParser),
+    ("msgpack", MessagePackRenderer, MessagePackParser),
+)
+
+
+@register
+class WireFormatsScenario(Scenario):
+    """Кодирование и разбор ответов order/details и order/find
+    рендерером DRF, orjson и MessagePack: размер тела и среднее время
+    в микросекундах. Разобранное тело каждого формата сверяется с
+    ответом DRF; при расхождении сценарий завершается ошибкой."""
+
+    name = "wire_formats"
+    help = "Размер и скорость JSON (DRF, orjson) и MessagePack"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--sizes", type=int, nargs="+", default=[1, 10, 40, 100]
+        )
+
+    def run(self, options):
+        skus = make_skus(max(options["sizes"]))
+        cartontype = make_cartontypes(1)[0]
+        table = Table.objects.create(name="wire", description="bench")
+        cells = Cell.objects.bulk_create(
+            Cell(name=str(index), table=table) for index in range(4)
+        )
+        rows = []
+        for size in options["sizes"]:
+            order = make_order(skus[:size])
+            Order.objects.filter(pk=order.pk).update(
+                recommended_cartontype=cartontype
+            )
+            CellOrderSku.objects.bulk_create(
+                CellOrderSku(
+                    cell=cells[index % len(cells)],
+                    sku=sku,
+                    order=order,
+                    quantity=1,
+                )
+                for index, sku in enumerate(skus[:size])
+            )
+            payloads = {
+                "order/details": GetOrderSerializer(
+                    Order.objects.with_details().get(pk=order.pk)
+                ).data,
+                "order/find": FindOrderSerializer(
+                    {
+                        "oldest_order": order.pk,
+                        "cells": prefetch.order_cells(order.pk),
+                    }
+                ).data,
+            }
+            for endpoint, data in payloads.items():
+                expected = json.loads(JSONRenderer().render(data))
+                for name, renderer_class, parser_class in FORMATS:
+                    rows.append(
+                        self._measure(
+                            endpoint,
+                            size,
+                            name,
+                            renderer_class(),
+                            parser_class(),
+                            data,
+                            expected,
+                            options["repeat"],
+                        )
+                    )
+        return rows
+
+    @staticmethod
+    def _measure(
+        endpoint, size, name, renderer, parser, data, expected, repeat
+    ):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            body = renderer.render(data, renderer.media_type)
+        encode = (time.perf_counter() - started) / repeat
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            parsed = parser.parse(io.BytesIO(body), parser.media_type)
+        decode = (time.perf_counter() - started) / repeat
+
+        if parsed != expected:
+            raise CommandError(f"{name}: {endpoint} does not round-trip")
+        return {
+            "endpoint": endpoint,
+            "lines": size,
+            "format": name,
+            "bytes": len(body),
+            "encode_us": round(encode * 10**6, 1),
+            "decode_us": round(decode * 10**6, 1),
+        }
@@ -0,0 +1,167 @@
+"""Кэши в памяти процесса."""
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+
+MISSING = object()
+
+
+class TTLCache:
+    """LRU-кэш с временем жизни записей и счётчиками попаданий."""
+
+    def __init__(self, maxsize, ttl, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (self.clock() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._data):
+                self._remove(key)
+
+    def _remove(self, key):
+        del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class BasketCache(TTLCache):
+    """Кэш рекомендаций по составу заказа.
+    Ключ — хэш отсортированного набора пар (sku, количество); для
+    инвалидации по товару хранится обратный индекс sku -> ключи.
+
+    Записи лежат в памяти процесса. Чтобы инвалидация доходила до всех
+    процессов, в ключ входят версии каталога и товаров корзины из
+    общего кэша shared (кэш Django): clear и invalidate_sku меняют их,
+    и старые записи других процессов больше не находятся."""
+
+    CATALOG_VERSION = "basket:version"
+
+    def __init__(self, maxsize, ttl, clock=time.monotonic, shared=None):
+        super().__init__(maxsize, ttl, clock)
+        self.shared = shared
+        self._keys_by_sku = defaultdict(set)
+        self._skus_by_key = {}
+
+    @staticmethod
+    def sku_version_key(sku):
+        return f"basket:version:{sku}"
+
+    def _versions(self, skus):
+        """Версии каталога и товаров из общего кэша. Отсутствующая
+        версия создаётся: иначе после её вытеснения из общего кэша
+        нашлись бы записи, сохранённые до инвалидации."""
+
+        if self.shared is None:
+            return ""
+        keys = [self.CATALOG_VERSION] + [
+            self.sku_version_key(sku) for sku in skus
+        ]
+        versions = self.shared.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                self.shared.add(key, uuid.uuid4().hex, timeout=None)
+                versions[key] = self.shared.get(key)
+        return ";".join(str(versions[key]) for key in keys)
+
+    def _bump(self, key):
+        if self.shared is not None:
+            self.shared.set(key, uuid.uuid4().hex, timeout=None)
+
+    @staticmethod
+    def basket_key(lines):
+        """Ключ для набора пар (sku, количество); порядок строк и
+        дубли одного sku на ключ не влияют."""
+
+        amounts = defaultdict(int)
+        for sku, count in lines:
+            amounts[str(sku)] += count
+        basket = sorted(amounts.items())
+        canonical = ";".join(f"{sku}:{count}" for sku, count in basket)
+        return (
+            hashlib.sha256(canonical.encode()).hexdigest(),
+            tuple(sku for sku, _ in basket),
+        )
+
+    def versioned_key(self, lines):
+        key, skus = self.basket_key(lines)
+        versions = self._versions(skus)
+        if versions:
+            key = hashlib.sha256(f"{key};{versions}".encode()).hexdigest()
+        return key, skus
+
+    def get_basket(self, lines, default=MISSING):
+        key, _ = self.versioned_key(lines)
+        return self.get(key, default)
+
+    def set_basket(self, lines, value):
+        key, skus = self.versioned_key(lines)
+        with self._lock:
+            self.set(key, value)
+            if key in self._data:
+                self._skus_by_key[key] = skus
+                for sku in skus:
+                    self._keys_by_sku[sku].add(key)
+
+    def invalidate_sku(self, sku):
+        self._bump(self.sku_version_key(sku))
+        with self._lock:
+            for key in list(self._keys_by_sku.get(str(sku), ())):
+                self.delete(key)
+
+    def clear(self):
+        self._bump(self.CATALOG_VERSION)
+        super().clear()
+
+    def _remove(self, key):
+        super()._remove(key)
+        for sku in self._skus_by_key.pop(key, ()):
+            keys = self._keys_by_sku.get(sku)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_sku[sku]
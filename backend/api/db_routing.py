@@ -0,0 +1,200 @@
+"""Чтение с реплик базы.
+
+GET и HEAD к представлениям с read_only = True и к спискам объектов в
+админке читают с реплики из DATABASE_REPLICAS, всё остальное — с
+основной базы. Пользователь для аутентификации всегда читается с
+основной базы. После любого другого успешного запроса клиент
+REPLICA_PIN_SECONDS секунд читает с основной базы: так он видит свои
+изменения, пока реплика догоняет. Закрепление хранится в cookie и, для
+клиентов с JWT, по id пользователя в кэше Django (при нескольких
+воркерах нужен общий кэш). Закрепляет и GET без read_only: order/find,
+например, забирает заказ. Реплика, отставшая на REPLICA_PIN_SECONDS и
+больше, не используется, пока не догонит.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import (
+    iscoroutinefunction,
+    markcoroutinefunction,
+    sync_to_async,
+)
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections
+from django.urls import Resolver404, resolve
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+PIN_COOKIE = "db_primary_until"
+SAFE_METHODS = ("GET", "HEAD")
+# Как часто проверять отставание реплики, секунд
+LAG_CHECK_INTERVAL = 1
+# Отставание реплики PostgreSQL в секундах; 0, если она применила всё
+# полученное или это не реплика.
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+# Псевдоним реплики для чтения в текущем запросе, None — основная база.
+# Контекст копируется в потоки sync_to_async.
+_read_alias = ContextVar("read_alias", default=None)
+# Псевдоним реплики -> (время проверки, реплика не отстала)
+_lag_checks = {}
+
+
+def pin_key(user_id):
+    return f"replica:pin:{user_id}"
+
+
+def replica_fresh(alias):
+    """Отставание реплики меньше REPLICA_PIN_SECONDS. Проверяется не
+    чаще раза в LAG_CHECK_INTERVAL секунд."""
+    now = time.monotonic()
+    checked_at, fresh = _lag_checks.get(alias, (None, True))
+    if checked_at is not None and now - checked_at < LAG_CHECK_INTERVAL:
+        return fresh
+    connection = connections[alias]
+    if connection.vendor == "postgresql":
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(REPLICA_LAG_SQL)
+                (lag,) = cursor.fetchone()
+        except DatabaseError:
+            fresh = False
+        else:
+            fresh = (lag or 0) < settings.REPLICA_PIN_SECONDS
+    _lag_checks[alias] = (now, fresh)
+    return fresh
+
+
+def token_user_id(request):
+    """id пользователя из заголовка Authorization или None."""
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = header and authentication.get_raw_token(header)
+    if not raw_token:
+        return None
+    try:
+        token = authentication.get_validated_token(raw_token)
+        return token[api_settings.USER_ID_CLAIM]
+    except (InvalidToken, TokenError, KeyError):
+        return None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Пользователь с реплики мог ещё не увидеть смену пароля,
+        # блокировку или выбор стола.
+        if model._meta.label == settings.AUTH_USER_MODEL:
+            return "default"
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        # Объект, прочитанный с реплики, сохраняется в основную базу.
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
+
+
+def is_read_only(path):
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return False
+    view_class = getattr(match.func, "view_class", None)
+    if view_class is not None:
+        return getattr(view_class, "read_only", False)
+    return (
+        match.app_name == "admin"
+        and match.url_name is not None
+        and match.url_name.endswith("_changelist")
+    )
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        reads_only = self.reads_only(request)
+        token = _read_alias.set(self.read_alias(request, reads_only))
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        return self.pin(request, response, reads_only)
+
+    async def __acall__(self, request):
+        reads_only = self.reads_only(request)
+        # Проверка отставания реплики обращается к базе.
+        alias = await sync_to_async(self.read_alias)(request, reads_only)
+        token = _read_alias.set(alias)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        return self.pin(request, response, reads_only)
+
+    @staticmethod
+    def reads_only(request):
+        """Запрос только читает: GET или HEAD к представлению, которое
+        не пишет в базу."""
+        return request.method in SAFE_METHODS and is_read_only(
+            request.path_info
+        )
+
+    @staticmethod
+    def read_alias(request, reads_only):
+        if not reads_only:
+            return None
+        try:
+            pinned = float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        if not pinned:
+            user_id = token_user_id(request)
+            pinned = user_id is not None and cache.get(pin_key(user_id))
+        if pinned:
+            return None
+        replicas = [
+            alias
+            for alias in settings.DATABASE_REPLICAS
+            if replica_fresh(alias)
+        ]
+        return random.choice(replicas) if replicas else None
+
+    @staticmethod
+    def pin(request, response, reads_only):
+        if not reads_only and response.status_code < 400:
+            # Сканеры не хранят cookie, закрепляем и по токену.
+            user_id = token_user_id(request)
+            if user_id is not None:
+                cache.set(pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+            response.set_cookie(
+                PIN_COOKIE,
+                str(time.time() + settings.REPLICA_PIN_SECONDS),
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
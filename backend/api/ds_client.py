@@ -0,0 +1,246 @@
+"""Клиент сервиса DS.
+
+Каждый поток держит свою requests.Session с keep-alive соединением,
+у запросов есть таймауты на подключение и чтение. Вместо проверки
+/health перед каждым запросом используется circuit breaker: после
+серии сбоев запросы к DS не отправляются, пока не истечёт пауза.
+Для async-представлений (режим ASGI) есть apack на httpx.AsyncClient
+с тем же circuit breaker и счётчиками.
+"""
+import asyncio
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class DSUnavailable(Exception):
+    """DS не ответил или ответил ошибкой."""
+
+
+class CircuitOpen(DSUnavailable):
+    """Запрос не отправлен: circuit breaker разомкнут."""
+
+
+class CircuitBreaker:
+    """Circuit breaker с состояниями closed, open и half_open.
+
+    В состоянии half_open пропускается один пробный запрос: успех
+    замыкает цепь, сбой снова размыкает её на reset_timeout секунд.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        if (
+            self._state == self.OPEN
+            and self.clock() - self._opened_at >= self.reset_timeout
+        ):
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+
+    def allow_request(self):
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def release(self):
+        """Пробный запрос отменён без результата: следующий запрос
+        снова может стать пробным."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if (
+                self._state == self.HALF_OPEN
+                or self._failures >= self.failure_threshold
+            ):
+                self._state = self.OPEN
+                self._opened_at = self.clock()
+                self._trial_in_flight = False
+
+
+def _package(response):
+    """Код упаковки из ответа DS; тело не-объект считается ошибкой."""
+    body = response.json()
+    if not isinstance(body, dict):
+        raise ValueError(f"Unexpected DS response body: {body!r:.100}")
+    return body.get("package")
+
+
+class DSClient:
+    """HTTP-клиент DS со счётчиками запросов, ошибок и задержки."""
+
+    def __init__(self, pack_url, connect_timeout, read_timeout, breaker):
+        self.pack_url = pack_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = breaker
+        self._local = threading.local()
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._rejected = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    @property
+    def session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+        return session
+
+    @property
+    def async_client(self):
+        """httpx.AsyncClient текущего цикла событий."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0])
+            )
+            self._async_clients[loop] = client
+        return client
+
+    def _allow(self):
+        if not self.breaker.allow_request():
+            with self._stats_lock:
+                self._rejected += 1
+            metrics.DS_REQUESTS_REJECTED.inc()
+            raise CircuitOpen("DS circuit is open")
+
+    def pack(self, payload):
+        """Возвращает код рекомендуемой упаковки (или None)."""
+        self._allow()
+
+        started = time.perf_counter()
+        try:
+            response = self.session.post(
+                self.pack_url, json=payload, timeout=self.timeout
+            )
+            response.raise_for_status()
+            package = _package(response)
+        except (requests.RequestException, ValueError) as exc:
+            self.breaker.record_failure()
+            self._observe(time.perf_counter() - started, error=True)
+            raise DSUnavailable(str(exc)) from exc
+        except BaseException:
+            # Непредвиденная ошибка не должна навсегда занять пробный
+            # запрос в состоянии half_open.
+            self.breaker.release()
+            raise
+
+        self.breaker.record_success()
+        self._observe(time.perf_counter() - started, error=False)
+        return package
+
+    async def apack(self, payload):
+        """Асинхронный pack. Отмена (например, по asyncio.wait_for)
+        не считается сбоем DS."""
+        self._allow()
+        started = time.perf_counter()
+        try:
+            response = await self.async_client.post(
+                self.pack_url, json=payload
+            )
+            response.raise_for_status()
+            package = _package(response)
+        except (httpx.HTTPError, ValueError) as exc:
+            self.breaker.record_failure()
+            self._observe(time.perf_counter() - started, error=True)
+            raise DSUnavailable(str(exc)) from exc
+        except BaseException:
+            # Отмена и непредвиденные ошибки освобождают пробный запрос.
+            self.breaker.release()
+            raise
+
+        self.breaker.record_success()
+        self._observe(time.perf_counter() - started, error=False)
+        return package
+
+    def _observe(self, latency, error):
+        metrics.DS_REQUEST_LATENCY.labels("error" if error else "ok").observe(
+            latency
+        )
+        with self._stats_lock:
+            self._requests += 1
+            self._errors += error
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "state": self.breaker.state,
+                "requests": self._requests,
+                "errors": self._errors,
+                "rejected": self._rejected,
+                "latency_avg_ms": round(
+                    self._latency_total / self._requests * 1000, 3
+                )
+                if self._requests
+                else 0.0,
+                "latency_max_ms": round(self._latency_max * 1000, 3),
+            }
+
+
+def get_client():
+    """Клиент DS процесса, создаётся при первом обращении."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = DSClient(
+                pack_url=settings.DATA_SCIENTIST_PACK,
+                connect_timeout=settings.DS_CONNECT_TIMEOUT,
+                read_timeout=settings.DS_READ_TIMEOUT,
+                breaker=CircuitBreaker(
+                    failure_threshold=settings.DS_CIRCUIT_FAILURE_THRESHOLD,
+                    reset_timeout=settings.DS_CIRCUIT_RESET_TIMEOUT,
+                ),
+            )
+    return _client
@@ -0,0 +1,133 @@
+import json
+import subprocess
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import setup_databases, teardown_databases
+
+from api.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = "Запускает сценарий нагрузочного теста на временной тестовой базе."
+    # Общие опции команды не попадают в описание прогона.
+    _common_options = {
+        "output",
+        "compare",
+        "keepdb",
+        "verbosity",
+        "settings",
+        "pythonpath",
+        "traceback",
+        "no_color",
+        "force_color",
+        "skip_checks",
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", help="Сохранить результаты в JSON-файл."
+        )
+        parser.add_argument(
+            "--compare",
+            help="JSON-файл прошлого прогона для сравнения задержек.",
+        )
+        parser.add_argument(
+            "--keepdb",
+            action="store_true",
+            help="Не удалять тестовую базу после прогона.",
+        )
+        subparsers = parser.add_subparsers(
+            dest="scenario", required=True, parser_class=type(parser)
+        )
+        for name, scenario_class in sorted(SCENARIOS.items()):
+            scenario_parser = subparsers.add_parser(
+                name, help=scenario_class.help, called_from_command_line=True
+            )
+            scenario_class().add_arguments(scenario_parser)
+
+    def handle(self, *args, **options):
+        scenario = SCENARIOS[options["scenario"]]()
+        started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        old_config = None
+        if scenario.uses_database:
+            old_config = setup_databases(
+                verbosity=0,
+                interactive=False,
+                keepdb=options["keepdb"],
+                aliases={"default"},
+            )
+        try:
+            rows = scenario.run(options)
+        finally:
+            if old_config is not None:
+                # Реплики смотрят в ту же тестовую базу, их соединения
+                # мешают её удалить.
+                connections.close_all()
+                teardown_databases(
+                    old_config, verbosity=0, keepdb=options["keepdb"]
+                )
+
+        for row in rows:
+            self.stdout.write(
+                "  ".join(f"{key}={value}" for key, value in row.items())
+            )
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(
+                    {
+                        "scenario": scenario.name,
+                        "commit": self._git_commit(),
+                        "started_at": started_at,
+                        "database": settings.DATABASES["default"]["ENGINE"],
+                        "options": {
+                            key: value
+                            for key, value in options.items()
+                            if key not in self._common_options
+                        },
+                        "results": rows,
+                    },
+                    file,
+                    ensure_ascii=False,
+                    indent=2,
+                )
+        if options["compare"]:
+            self._compare(options["compare"], rows)
+
+    def _compare(self, path, rows):
+        """Изменение задержек относительно прошлого прогона, строки
+        сопоставляются по порядку."""
+
+        with open(path, encoding="utf-8") as file:
+            baseline = json.load(file)
+        self.stdout.write(f"Compared with {baseline.get('commit')}:")
+        for old, new in zip(baseline["results"], rows):
+            label = "  ".join(
+                f"{key}={value}"
+                for key, value in new.items()
+                if isinstance(value, str)
+            )
+            changes = [
+                f"{key} {old[key]} -> {new[key]} "
+                f"({(new[key] - old[key]) / old[key]:+.1%})"
+                for key in new
+                if key.endswith("_ms") and old.get(key)
+            ]
+            if changes:
+                self.stdout.write(f"{label}  " + "  ".join(changes))
+
+    @staticmethod
+    def _git_commit():
+        """Коммит рабочей копии, чтобы сравнивать прогоны между собой."""
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "HEAD"],
+                capture_output=True,
+                check=True,
+                text=True,
+                cwd=settings.BASE_DIR,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from api.recommendations import recommend
+from items.models import Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Рассчитывает рекомендуемую упаковку для заказов, оставшихся "
+        "в статусе pending (например, после перезапуска сервиса)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--failed",
+            action="store_true",
+            help="Повторить расчёт и для заказов в статусе failed.",
+        )
+
+    def handle(self, *args, **options):
+        statuses = ["pending"]
+        if options["failed"]:
+            statuses.append("failed")
+        orderkeys = list(
+            Order.objects.filter(
+                recommendation_status__in=statuses
+            ).values_list("pk", flat=True)
+        )
+        for orderkey in orderkeys:
+            recommend(orderkey)
+        self.stdout.write(f"Processed {len(orderkeys)} orders")
@@ -0,0 +1,90 @@
+"""Метрики Prometheus.
+
+Под gunicorn каждый воркер пишет значения в файлы каталога
+PROMETHEUS_MULTIPROC_DIR (см. gunicorn.conf.py), /metrics собирает их
+по всем воркерам. Без этой переменной используется реестр процесса.
+"""
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.075,
+    0.1,
+    0.25,
+    0.5,
+    0.75,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Длительность обработки запроса.",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Число SQL-запросов на запрос.",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233),
+)
+REQUEST_DB_DURATION = Histogram(
+    "http_request_db_duration_seconds",
+    "Суммарное время SQL-запросов на запрос.",
+    ["route"],
+    buckets=LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "Размер тела ответа.",
+    ["route"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+DS_REQUEST_LATENCY = Histogram(
+    "ds_request_duration_seconds",
+    "Длительность запросов к DS.",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+DS_REQUESTS_REJECTED = Counter(
+    "ds_requests_rejected",
+    "Запросы к DS, не отправленные из-за разомкнутого circuit breaker.",
+)
+RECOMMENDATION_CACHE = Gauge(
+    "recommendation_cache",
+    "Счётчики кэша рекомендаций (size, hits, misses, evictions).",
+    ["stat"],
+    multiprocess_mode="livesum",
+)
+
+
+def update_cache_stats(stats):
+    for stat in ("size", "hits", "misses", "evictions"):
+        RECOMMENDATION_CACHE.labels(stat).set(stats[stat])
+
+
+def render():
+    """Текст метрик и его Content-Type."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
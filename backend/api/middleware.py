@@ -0,0 +1,91 @@
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import metrics
+from .recommendations import basket_cache
+
+# Счётчик SQL текущего запроса. Контекст копируется в потоки
+# sync_to_async, поэтому запросы ORM из async-представлений тоже
+# попадают в счётчик своего запроса.
+_query_timer = ContextVar("query_timer", default=None)
+
+
+class QueryTimer:
+    """Число и суммарная длительность SQL-запросов."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    """execute_wrapper всех соединений, см. signals.install_query_timer."""
+    timer = _query_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.duration += time.perf_counter() - started
+        timer.count += 1
+
+
+class MetricsMiddleware:
+    """Метрики запроса: длительность, SQL-запросы, размер ответа.
+    Маршрут берётся из шаблона URL, а не из пути, чтобы число рядов
+    метрик не зависело от ключей заказов в запросах. Работает и в
+    синхронной, и в асинхронной цепочке middleware."""
+
+    sync_capable = True
+    async_capable = True
+
+    CACHE_STATS_INTERVAL = 1.0
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._cache_stats_at = 0.0
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        token = _query_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_timer.reset(token)
+        self.observe(request, response, started, timer)
+        return response
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        token = _query_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_timer.reset(token)
+        self.observe(request, response, started, timer)
+        return response
+
+    def observe(self, request, response, started, timer):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        route = match.route if match else "unmatched"
+        metrics.REQUEST_LATENCY.labels(
+            request.method, route, response.status_code
+        ).observe(elapsed)
+        metrics.REQUEST_DB_QUERIES.labels(route).observe(timer.count)
+        metrics.REQUEST_DB_DURATION.labels(route).observe(timer.duration)
+        if not response.streaming:
+            metrics.RESPONSE_SIZE.labels(route).observe(len(response.content))
+
+        if started - self._cache_stats_at >= self.CACHE_STATS_INTERVAL:
+            self._cache_stats_at = started
+            metrics.update_cache_stats(basket_cache.stats())
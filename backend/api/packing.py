@@ -0,0 +1,130 @@
+"""Локальный расчёт рекомендуемой упаковки.
+
+Товар помещается в коробку хотя бы в одном повороте тогда и только
+тогда, когда его габариты, отсортированные по убыванию, поэлементно
+не больше так же отсортированных габаритов коробки. Поэтому для
+заказа достаточно поэлементного максимума отсортированных габаритов
+товаров и их суммарного объёма: проверка по всему каталогу коробок
+выполняется одной векторной операцией NumPy. Из подходящих коробок
+выбирается наименьшая по объёму.
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from items.models import CartonType
+
+_catalog = None
+_catalog_loaded_at = 0.0
+_catalog_lock = threading.Lock()
+
+
+class CartonCatalog:
+    """Каталог коробок в виде массивов, упорядоченных по объёму."""
+
+    def __init__(self, codes, dimensions, fill_ratio=1.0):
+        dimensions = np.asarray(dimensions, dtype=np.float64).reshape(-1, 3)
+        dimensions = -np.sort(-dimensions, axis=1)
+        volumes = dimensions.prod(axis=1)
+        order = np.argsort(volumes, kind="stable")
+        self.codes = [codes[index] for index in order]
+        self.dimensions = dimensions[order]
+        self.capacity = volumes[order] * fill_ratio
+
+    @classmethod
+    def from_db(cls):
+        rows = list(
+            CartonType.objects.values_list(
+                "cartontype", "length", "width", "height"
+            )
+        )
+        return cls(
+            [row[0] for row in rows],
+            [row[1:] for row in rows],
+            fill_ratio=settings.PACKING_FILL_RATIO,
+        )
+
+    @staticmethod
+    def requirements(items):
+        """Минимальные габариты коробки и объём товаров заказа.
+        items — последовательность (длина, ширина, высота, количество)."""
+
+        items = np.asarray(items, dtype=np.float64).reshape(-1, 4)
+        sizes = -np.sort(-items[:, :3], axis=1)
+        volume = (items[:, :3].prod(axis=1) * items[:, 3]).sum()
+        return sizes.max(axis=0, initial=0.0), volume
+
+    def recommend(self, items):
+        """Код наименьшей подходящей коробки или None; для пустого
+        заказа коробка не нужна."""
+        if not self.codes or not len(items):
+            return None
+        need, volume = self.requirements(items)
+        feasible = (self.dimensions >= need).all(axis=1) & (
+            self.capacity >= volume
+        )
+        index = int(feasible.argmax())
+        return self.codes[index] if feasible[index] else None
+
+    def recommend_many(self, orders):
+        """Подбор коробок сразу для нескольких заказов."""
+        if not orders:
+            return []
+        if not self.codes:
+            return [None] * len(orders)
+        needs, volumes = zip(*(self.requirements(items) for items in orders))
+        needs = np.asarray(needs)
+        volumes = np.asarray(volumes)
+        feasible = (
+            self.dimensions[np.newaxis, :, :] >= needs[:, np.newaxis, :]
+        ).all(axis=2) & (
+            self.capacity[np.newaxis, :] >= volumes[:, np.newaxis]
+        )
+        indexes = feasible.argmax(axis=1)
+        found = feasible[np.arange(len(orders)), indexes] & np.asarray(
+            [len(items) > 0 for items in orders]
+        )
+        return [
+            self.codes[index] if ok else None
+            for index, ok in zip(indexes.tolist(), found.tolist())
+        ]
+
+
+def get_catalog():
+    """Каталог коробок процесса.
+    Перечитывается после изменения CartonType и не реже чем раз
+    в PACKING_CATALOG_TTL секунд (изменения в других процессах)."""
+
+    global _catalog, _catalog_loaded_at
+    with _catalog_lock:
+        if (
+            _catalog is None
+            or time.monotonic() - _catalog_loaded_at
+            > settings.PACKING_CATALOG_TTL
+        ):
+            _catalog = CartonCatalog.from_db()
+            _catalog_loaded_at = time.monotonic()
+        return _catalog
+
+
+def invalidate_catalog(**kwargs):
+    global _catalog
+    with _catalog_lock:
+        _catalog = None
+
+
+def recommend_payload(payload):
+    """Подбор коробки по запросу в формате DS (см. build_payload)."""
+    return get_catalog().recommend(
+        [
+            (
+                float(item["size1"]),
+                float(item["size2"]),
+                float(item["size3"]),
+                item["count"],
+            )
+            for item in payload["items"]
+        ]
+    )
@@ -0,0 +1,155 @@
+"""Подготовка следующего заказа стола.
+
+Когда упаковщик забирает заказ или заканчивает его сборку, в фоне
+готовится заказ, стоящий первым в очереди его стола: ячейки для
+order/find и тело order/details записываются в слот стола в кэше
+Django. Заказ при этом остаётся в очереди, его по-прежнему забирает
+claim_next, поэтому слот не нужно освобождать: он просто истекает
+через ORDER_PREFETCH_TTL секунд, если упаковщик простаивает.
+
+Слот годен, только если заказ с момента подготовки изменился лишь
+тем, что его забрали (версия выросла ровно на единицу); любое другое
+изменение, включая раскладку по ячейкам, увеличивает версию, и ответ
+строится из базы как обычно.
+"""
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+
+from items.models import Cell, CellOrderSku, Order, TableOrderQueue
+
+from .serializers import CellSerializer, GetOrderSerializer
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ORDER_PREFETCH_WORKERS,
+                thread_name_prefix="prefetch",
+            )
+    return _executor
+
+
+def slot_key(table_id):
+    return f"prefetch:table:{table_id}"
+
+
+def details_key(orderkey):
+    return f"prefetch:details:{uuid.UUID(str(orderkey))}"
+
+
+def order_cells(orderkey):
+    """Ячейки с товарами заказа в виде ответа order/find."""
+    cells = Cell.objects.filter(
+        pk__in=CellOrderSku.objects.filter(order_id=orderkey).values("cell_id")
+    )
+    return CellSerializer(cells, many=True).data
+
+
+def schedule(table_id):
+    """Готовит следующий заказ стола после коммита текущей транзакции."""
+    if not settings.ORDER_PREFETCH or table_id is None:
+        return
+    transaction.on_commit(lambda: get_executor().submit(_work, table_id))
+
+
+def _work(table_id):
+    try:
+        refresh(table_id)
+    except Exception:
+        logger.exception("Prefetch for table %s failed", table_id)
+    finally:
+        connections.close_all()
+
+
+def refresh(table_id):
+    """Записывает в слот стола первый заказ его очереди. Если слот уже
+    хранит этот заказ в той же версии, только продлевает его."""
+
+    orderkey = (
+        TableOrderQueue.objects.filter(table_id=table_id)
+        .order_by("order_created_at", "id")
+        .values_list("order_id", flat=True)
+        .first()
+    )
+    if orderkey is None:
+        cache.delete(slot_key(table_id))
+        return
+    slot = cache.get(slot_key(table_id))
+    if slot is not None and slot["orderkey"] == str(orderkey):
+        version = (
+            Order.objects.filter(pk=orderkey)
+            .values_list("version", flat=True)
+            .first()
+        )
+        if version == slot["version"]:
+            cache.touch(slot_key(table_id), settings.ORDER_PREFETCH_TTL)
+            return
+
+    # Версия читается раньше ячеек: раскладка, закоммиченная между
+    # этими запросами, даст слот с новыми ячейками и старой версией,
+    # который просто не пройдёт проверку.
+    order = Order.objects.with_details().filter(pk=orderkey).first()
+    if order is None or order.status != "forming":
+        return
+    cache.set(
+        slot_key(table_id),
+        {
+            "orderkey": str(orderkey),
+            "version": order.version,
+            "cells": order_cells(orderkey),
+            "details": GetOrderSerializer(
+                order, context={"inline_images": False}
+            ).data,
+        },
+        settings.ORDER_PREFETCH_TTL,
+    )
+
+
+def take_cells(table_id, orderkey):
+    """Ячейки заказа из слота стола, если в слоте именно этот, только
+    что забранный заказ и с момента подготовки он не менялся; тело
+    деталей при этом откладывается для order/details. Иначе None."""
+
+    if not settings.ORDER_PREFETCH:
+        return None
+    slot = cache.get(slot_key(table_id))
+    if slot is None or slot["orderkey"] != str(orderkey):
+        return None
+    cache.delete(slot_key(table_id))
+    version = (
+        Order.objects.filter(pk=orderkey)
+        .values_list("version", flat=True)
+        .first()
+    )
+    if version != slot["version"] + 1:
+        return None
+    cache.set(
+        details_key(orderkey),
+        (version, slot["details"]),
+        settings.ORDER_PREFETCH_TTL,
+    )
+    return slot["cells"]
+
+
+def details(orderkey, version):
+    """Подготовленное тело order/details для заказа в версии version
+    или None."""
+    if not settings.ORDER_PREFETCH:
+        return None
+    entry = cache.get(details_key(orderkey))
+    if entry is None or entry[0] != version:
+        return None
+    return entry[1]
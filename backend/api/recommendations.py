@@ -0,0 +1,178 @@
+"""Отложенный расчёт рекомендуемой упаковки.
+
+Заказ создаётся без обращения к DS. После коммита транзакции расчёт
+ставится в пул потоков: воркер запрашивает DS, повторяет попытку при
+сбое, при недоступности DS подбирает коробку локально (см. packing)
+и записывает результат в заказ. В режиме ASGI создание заказа сначала
+ждёт ответ DS в обработчике запроса (recommend_inline) и ставит
+расчёт в пул, только если DS не успел ответить.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import F
+
+from items.models import CartonType, Order, OrderSku
+
+from . import packing
+from .cache import MISSING, BasketCache
+from .ds_client import CircuitOpen, DSUnavailable, get_client
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+basket_cache = BasketCache(
+    maxsize=settings.RECOMMENDATION_CACHE_SIZE,
+    ttl=settings.RECOMMENDATION_CACHE_TTL,
+    shared=cache,
+)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECOMMENDATION_WORKERS,
+                thread_name_prefix="recommendation",
+            )
+    return _executor
+
+
+def schedule(orderkey):
+    """Ставит расчёт в очередь после коммита текущей транзакции."""
+    transaction.on_commit(lambda: get_executor().submit(_work, orderkey))
+
+
+def _work(orderkey):
+    try:
+        recommend(orderkey)
+    except Exception:
+        logger.exception("Recommendation for order %s failed", orderkey)
+    finally:
+        connections.close_all()
+
+
+def build_payload(orderkey):
+    """Собирает запрос к DS по позициям заказа."""
+    order_skus = (
+        OrderSku.objects.filter(order_id=orderkey)
+        .select_related("sku")
+        .prefetch_related("sku__cargotypes")
+    )
+
+    items = []
+    for order_sku in order_skus:
+        product = order_sku.sku
+        items.append(
+            {
+                "sku": str(product.pk),
+                "count": order_sku.amount,
+                "size1": str(product.length),
+                "size2": str(product.width),
+                "size3": str(product.height),
+                "weight": str(product.goods_wght),
+                "type": [
+                    cargotype.cargotype
+                    for cargotype in product.cargotypes.all()
+                ],
+            }
+        )
+    return {"orderId": str(orderkey), "items": items}
+
+
+def request_to_DS(orderkey, payload):
+    """Запрашивает упаковку у DS с повторами и экспоненциальной задержкой.
+    При разомкнутом circuit breaker повторов не делает."""
+
+    for attempt in range(1, settings.RECOMMENDATION_MAX_ATTEMPTS + 1):
+        try:
+            return get_client().pack(payload)
+        except DSUnavailable as exc:
+            logger.warning(
+                "DS attempt %s for order %s failed: %s",
+                attempt,
+                orderkey,
+                exc,
+            )
+            if (
+                isinstance(exc, CircuitOpen)
+                or attempt == settings.RECOMMENDATION_MAX_ATTEMPTS
+            ):
+                raise
+            time.sleep(
+                settings.RECOMMENDATION_RETRY_DELAY * 2 ** (attempt - 1)
+            )
+
+
+def recommend(orderkey):
+    """Рассчитывает упаковку заказа и сохраняет результат.
+    Движок задаёт RECOMMENDATION_ENGINE: "ds" — DS с локальным расчётом
+    при его недоступности, "local" — только локальный расчёт.
+    Ответы движка кэшируются по составу заказа, см. basket_cache."""
+
+    payload = build_payload(orderkey)
+    lines = [(item["sku"], item["count"]) for item in payload["items"]]
+    package = basket_cache.get_basket(lines)
+    if package is MISSING:
+        if settings.RECOMMENDATION_ENGINE == "local":
+            package = packing.recommend_payload(payload)
+            basket_cache.set_basket(lines, package)
+        else:
+            try:
+                package = request_to_DS(orderkey, payload)
+                basket_cache.set_basket(lines, package)
+            except DSUnavailable:
+                package = packing.recommend_payload(payload)
+
+    store_recommendation(orderkey, package)
+
+
+def store_recommendation(orderkey, package):
+    """Записывает рекомендацию в заказ, возвращает её статус."""
+    cartontype = None
+    if package is not None:
+        cartontype = CartonType.objects.filter(cartontype=package).first()
+        if cartontype is None:
+            logger.error("Unknown cartontype %r recommended", package)
+            Order.objects.filter(pk=orderkey).update(
+                recommendation_status="failed", version=F("version") + 1
+            )
+            return "failed"
+    Order.objects.filter(pk=orderkey).update(
+        recommended_cartontype=cartontype,
+        recommendation_status="ready",
+        version=F("version") + 1,
+    )
+    return "ready"
+
+
+async def recommend_inline(orderkey, payload, timeout):
+    """Расчёт упаковки в async-обработчике запроса по готовому
+    build_payload: ответ DS ждётся не дольше timeout секунд и без
+    повторов. Возвращает статус рекомендации или None, если расчёт
+    нужно поставить в пул."""
+
+    lines = [(item["sku"], item["count"]) for item in payload["items"]]
+    package = basket_cache.get_basket(lines)
+    if package is MISSING:
+        if settings.RECOMMENDATION_ENGINE == "local":
+            package = await sync_to_async(packing.recommend_payload)(payload)
+        else:
+            try:
+                package = await asyncio.wait_for(
+                    get_client().apack(payload), timeout
+                )
+            except (DSUnavailable, asyncio.TimeoutError):
+                return None
+        basket_cache.set_basket(lines, package)
+    return await sync_to_async(store_recommendation)(orderkey, package)
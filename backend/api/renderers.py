@@ -0,0 +1,38 @@
+"""Рендереры ответов API.
+
+JSON кодируется orjson. Клиенты, приславшие Accept: application/msgpack
+(ручные сканеры), получают тот же ответ в MessagePack. Типы, которые
+не умеют кодировать сами библиотеки (Decimal, ленивые строки, QuerySet),
+приводятся энкодером DRF.
+"""
+import msgpack
+import orjson
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+_encode_default = JSONEncoder().default
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """JSONRenderer на orjson. Отступ из параметра indent заголовка Accept
+    поддерживается только в два пробела."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        option = orjson.OPT_NON_STR_KEYS
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_encode_default, option=option)
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=_encode_default, use_bin_type=True)
@@ -1,11 +1,12 @@
-import requests
+from collections import defaultdict
+
 from django.contrib.auth import get_user_model
 from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
-from config.settings import CHECK_DATA_SCIENTIST, DATA_SCIENTIST_PACK
 from users.models import Table, Printer
 from items.models import (
     Cell,
@@ -13,8 +14,12 @@ from items.models import (
     Order,
     OrderSku,
     Sku,
+    TableOrderQueue,
     CartonType,
 )
+from items.renditions import inline_thumbnail, rendition_url
+
+from . import recommendations
 
 User = get_user_model()
 
@@ -54,6 +59,8 @@ class CreateOrderSkuSerializer(serializers.ModelSerializer):
 class CreateOrderSerializer(serializers.Serializer):
     """Сериализатор для создания заказа.
     Принимает вложенный сериализатор OrderSkuSerializer.
+    Рекомендуемая упаковка рассчитывается после коммита, см. recommendations;
+    с context["schedule_recommendation"] = False расчёт не ставится.
     """
 
     skus = CreateOrderSkuSerializer(many=True)
@@ -63,67 +70,57 @@ class CreateOrderSerializer(serializers.Serializer):
         fields = ("skus",)
 
     @staticmethod
-    def request_to_DS(order, skus_data):
-        """Метод для взаимодействия с DS.
-        Вызывается в методе create."""
-
-        list_of_sku = []
-        for item in skus_data:
-            product = Sku.objects.get(sku=item["sku"])
-            dict_of_sku = {
-                "sku": str(item["sku"]),
-                "count": item["amount"],
-                "size1": str(product.length),
-                "size2": str(product.width),
-                "size3": str(product.height),
-                "weight": str(product.goods_wght),
-                "type": list(
-                    product.cargotypes.values_list("cargotype", flat=True)
-                ),
-            }
-            list_of_sku.append(dict_of_sku)
-
-        data_for_DS = {"orderId": str(order.orderkey), "items": list_of_sku}
-        try:
-            check_DS = requests.get(CHECK_DATA_SCIENTIST)
-            if check_DS.status_code == 200:
-                response = requests.post(DATA_SCIENTIST_PACK, json=data_for_DS)
-                return response.json()
-            else:
-                return {"package": None}
-        except ConnectionError:
-            return {"package": None}
+    def create_order_skus(order, skus_data):
+        """Резервирует товары заказа.
+        Строки Sku блокируются одним запросом в порядке первичного ключа,
+        остатки проверяются в памяти, списание выполняется одним условным
+        UPDATE, а позиции заказа создаются через bulk_create."""
 
-    @staticmethod
-    def create_order_sku(order, sku_data):
-        sku_id = sku_data["sku"]
-        amount = sku_data["amount"]
-        try:
-            sku = Sku.objects.select_for_update().get(sku=sku_id)
-        except Sku.DoesNotExist as exc:
-            raise serializers.ValidationError("Invalid Sku.") from exc
-
-        if sku.quantity < amount:
+        amounts = defaultdict(int)
+        for sku_data in skus_data:
+            amounts[sku_data["sku"]] += sku_data["amount"]
+
+        skus = {
+            sku.pk: sku
+            for sku in Sku.objects.select_for_update()
+            .filter(pk__in=amounts)
+            .order_by("pk")
+            .only("sku", "quantity")
+        }
+        if len(skus) != len(amounts):
+            raise serializers.ValidationError("Invalid Sku.")
+
+        for sku_id, amount in amounts.items():
+            if skus[sku_id].quantity < amount:
+                raise serializers.ValidationError(
+                    "Insufficient quantity for Sku."
+                )
+
+        decrement = Case(
+            *(
+                When(pk=sku_id, then=Value(amount))
+                for sku_id, amount in amounts.items()
+            ),
+            output_field=IntegerField(),
+        )
+        updated = Sku.objects.filter(
+            pk__in=amounts, quantity__gte=decrement
+        ).update(quantity=F("quantity") - decrement)
+        if updated != len(amounts):
             raise serializers.ValidationError("Insufficient quantity for Sku.")
 
-        OrderSku.objects.create(order=order, sku=sku, amount=amount)
-        sku.quantity -= amount
-        sku.save()
+        OrderSku.objects.bulk_create(
+            OrderSku(order=order, sku_id=sku_id, amount=amount)
+            for sku_id, amount in amounts.items()
+        )
 
     @transaction.atomic
     def create(self, validated_data):
         skus_data = validated_data.pop("skus")
         order = Order.objects.create(status="forming")
-        for sku_data in skus_data:
-            self.create_order_sku(order, sku_data)
-
-        response_from_DS = self.request_to_DS(order, skus_data)
-        package = response_from_DS.get("package")
-        if package is not None:
-            order.recommended_cartontype = get_object_or_404(
-                CartonType, cartontype=package
-            )
-        order.save()
+        self.create_order_skus(order, skus_data)
+        if self.context.get("schedule_recommendation", True):
+            recommendations.schedule(order.pk)
         return order
 
 
@@ -143,29 +140,61 @@ class LoadSkuOrderToCellSerializer(serializers.Serializer):
     )
     skus = CellOrderSkuSerializer(many=True)
 
+    @transaction.atomic
     def create(self, validated_data):
+        """Раскладывает товары заказа по ячейке, увеличивает версию
+        заказа и ставит его в очередь стола. Все строки проверяются по
+        позициям заказа одним запросом и вставляются одним
+        bulk_create. Если ячейка переехала на другой стол, очереди
+        столов для лежащих в ней заказов перестраиваются. Возвращает
+        ячейку."""
+
         cell_barcode = validated_data.get("cell_barcode")
         orderkey = validated_data.get("order")
-        table_name = validated_data.get("table_name")
+        table = validated_data.get("table_name")
         skus = validated_data.get("skus")
 
-        cell = get_object_or_404(Cell, barcode=cell_barcode)
-        order = get_object_or_404(Order, orderkey=orderkey)
-        table = get_object_or_404(Table, name=table_name)
-
+        cell = Cell.objects.filter(barcode=cell_barcode).first()
+        if cell is None:
+            raise Http404("No Cell matches the given query.")
+        moved = cell.table_id != table.pk
+        if moved:
+            Cell.objects.filter(barcode=cell_barcode).update(table=table)
         cell.table = table
-        cell.save()
-
-        for element in skus:
-            sku_code = element.get("sku")
-            quantity = element.get("quantity")
-
-            sku = get_object_or_404(Sku, sku=sku_code)
-
-            CellOrderSku.objects.create(
-                cell=cell, sku=sku, order=order, quantity=quantity
+        # Раскладка меняет ответ order/find, поэтому увеличивает версию.
+        if not Order.objects.filter(orderkey=orderkey).update(
+            version=F("version") + 1
+        ):
+            raise Http404("No Order matches the given query.")
+
+        requested = {element.get("sku") for element in skus}
+        order_skus = set(
+            OrderSku.objects.filter(
+                order_id=orderkey, sku_id__in=requested
+            ).values_list("sku_id", flat=True)
+        )
+        if order_skus != requested:
+            raise serializers.ValidationError(
+                "SKU does not belong to the current order"
             )
 
+        CellOrderSku.objects.bulk_create(
+            CellOrderSku(
+                cell_id=cell_barcode,
+                sku_id=element.get("sku"),
+                order_id=orderkey,
+                quantity=element.get("quantity"),
+            )
+            for element in skus
+        )
+        if moved:
+            TableOrderQueue.objects.rebuild(
+                CellOrderSku.objects.filter(cell_id=cell_barcode).values_list(
+                    "order_id", flat=True
+                )
+            )
+        else:
+            TableOrderQueue.objects.enqueue(table.pk, orderkey)
         return cell
 
 
@@ -183,7 +212,7 @@ class FindOrderSerializer(serializers.Serializer):
 class SkuSerializer(serializers.ModelSerializer):
     help_text = serializers.SerializerMethodField()
     amount = serializers.SerializerMethodField()
-    image = Base64ImageField(read_only=True)
+    image = serializers.SerializerMethodField()
 
     class Meta:
         model = Sku
@@ -194,11 +223,22 @@ class SkuSerializer(serializers.ModelSerializer):
         return sku.help_text
 
     def get_amount(self, sku):
-        order = self.context["order"]
-        order_sku = OrderSku.objects.filter(order=order, sku=sku).first()
-        if order_sku:
-            return order_sku.amount
-        return None
+        return self.context["amounts"].get(sku.pk)
+
+    def get_image(self, sku):
+        """URL миниатюры изображения, с inline_images в контексте —
+        сама миниатюра в base64. Без миниатюры — URL исходного
+        изображения."""
+        if not sku.image:
+            return None
+        if not sku.image_hash:
+            return sku.image.url
+        if self.context.get("inline_images"):
+            try:
+                return inline_thumbnail(sku.image_hash)
+            except FileNotFoundError:
+                return sku.image.url
+        return rendition_url(sku.image_hash)
 
 
 class CartonTypeSerializer(serializers.ModelSerializer):
@@ -208,6 +248,10 @@ class CartonTypeSerializer(serializers.ModelSerializer):
 
 
 class GetOrderSerializer(serializers.ModelSerializer):
+    """Детали заказа.
+    Ожидает заказ, загруженный через with_details() модели Order или
+    OrderArchive."""
+
     skus = serializers.SerializerMethodField()
     recommended_cartontype = CartonTypeSerializer()
 
@@ -216,14 +260,23 @@ class GetOrderSerializer(serializers.ModelSerializer):
         fields = [
             "orderkey",
             "recommended_cartontype",
+            "recommendation_status",
             "total_skus_quantity",
             "skus",
         ]
 
-    @staticmethod
-    def get_skus(order):
+    def get_skus(self, order):
+        order_skus = order.order_skus.all()
         sku_serializer = SkuSerializer(
-            order.skus.all(), many=True, context={"order": order}
+            [order_sku.sku for order_sku in order_skus],
+            many=True,
+            context={
+                **self.context,
+                "amounts": {
+                    order_sku.sku_id: order_sku.amount
+                    for order_sku in order_skus
+                },
+            },
         )
         return sku_serializer.data
 
@@ -246,24 +299,67 @@ class OrderAddNewDataSerializer(serializers.Serializer):
     total_packages = serializers.IntegerField()
     skus = OrderSkuSerializer(many=True)
 
+    @transaction.atomic
     def update(self, instance, validated_data):
+        """Записывает выбранные упаковки и номера упаковок товаров.
+        Пишутся только изменившиеся данные, номера упаковок всех
+        позиций обновляются одним запросом. Версия заказа
+        увеличивается, только если что-то изменилось."""
+
         orderkey = validated_data.get("orderkey")
-        selected_cartontypes = validated_data.get("selected_cartontypes")
+        selected_cartontypes = set(validated_data.get("selected_cartontypes"))
         total_packages = validated_data.get("total_packages")
         skus_data = validated_data.get("skus")
 
-        instance.selected_cartontypes.set(selected_cartontypes)
-
-        instance.total_packages = total_packages
-        instance.save()
+        through = Order.selected_cartontypes.through
+        current = set(
+            through.objects.filter(order_id=instance.pk).values_list(
+                "cartontype_id", flat=True
+            )
+        )
+        removed = current - selected_cartontypes
+        if removed:
+            through.objects.filter(
+                order_id=instance.pk, cartontype_id__in=removed
+            ).delete()
+        added = selected_cartontypes - current
+        if added:
+            through.objects.bulk_create(
+                through(order_id=instance.pk, cartontype_id=cartontype)
+                for cartontype in added
+            )
 
-        for sku_data in skus_data:
-            sku = sku_data.get("sku")
-            packaging_number = sku_data.get("packaging_number")
-            OrderSku.objects.filter(order=orderkey, sku=sku).update(
-                packaging_number=packaging_number
+        packaging_numbers = {
+            sku_data.get("sku"): sku_data.get("packaging_number")
+            for sku_data in skus_data
+        }
+        lines_changed = 0
+        if packaging_numbers:
+            unchanged = Q()
+            cases = []
+            for sku, packaging_number in packaging_numbers.items():
+                unchanged |= Q(sku_id=sku, packaging_number=packaging_number)
+                cases.append(When(sku_id=sku, then=Value(packaging_number)))
+            lines_changed = (
+                OrderSku.objects.filter(
+                    order_id=orderkey, sku_id__in=packaging_numbers
+                )
+                .exclude(unchanged)
+                .update(
+                    packaging_number=Case(*cases, output_field=IntegerField())
+                )
             )
 
+        # Условный UPDATE: total_packages пишется, только если
+        # изменился, версия — если изменилось хоть что-то.
+        order = Order.objects.filter(pk=instance.pk)
+        packages_changed = order.exclude(total_packages=total_packages).update(
+            total_packages=total_packages, version=F("version") + 1
+        )
+        if not packages_changed and (removed or added or lines_changed):
+            order.update(version=F("version") + 1)
+        instance.total_packages = total_packages
+
         return instance
 
 
@@ -281,6 +377,15 @@ class StatusOrderSerializer(serializers.ModelSerializer):
         return value
 
 
+class BatchStatusOrderSerializer(serializers.Serializer):
+    orderkeys = serializers.ListField(
+        child=serializers.UUIDField(format="hex_verbose"),
+        allow_empty=False,
+        max_length=10000,
+    )
+    status = serializers.ChoiceField(choices=("collected",))
+
+
 class GetTableSerializer(serializers.ModelSerializer):
     class Meta:
         model = Table
@@ -294,7 +399,7 @@ class SelectTableSerializer(serializers.Serializer):
         user = self.context.get("request").user
         table = get_object_or_404(Table, id=validated_data["id"])
         user.table = table
-        user.save()
+        user.save(update_fields=["table"])
         return table
 
 
@@ -305,5 +410,5 @@ class SelectPrinterSerializer(serializers.Serializer):
         user = self.context.get("request").user
         printer = get_object_or_404(Printer, barcode=validated_data["barcode"])
         user.printer = printer
-        user.save()
+        user.save(update_fields=["printer"])
         return printer
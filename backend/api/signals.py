@@ -0,0 +1,71 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from items.models import CartonType, Sku
+from items.signals import catalog_imported
+from users.models import Printer, Table, User
+
+from . import packing
+from .authentication import forget_users
+from .middleware import record_query
+from .recommendations import basket_cache
+
+
+@receiver([post_save, post_delete, catalog_imported], sender=CartonType)
+def cartontypes_changed(sender, **kwargs):
+    packing.invalidate_catalog()
+    basket_cache.clear()
+
+
+@receiver([post_save, post_delete], sender=Sku)
+def sku_changed(sender, instance, **kwargs):
+    basket_cache.invalidate_sku(instance.pk)
+
+
+@receiver(catalog_imported, sender=Sku)
+def skus_imported(sender, keys, **kwargs):
+    for sku in keys:
+        basket_cache.invalidate_sku(sku)
+
+
+@receiver(m2m_changed, sender=Sku.cargotypes.through)
+def sku_cargotypes_changed(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        basket_cache.invalidate_sku(instance.pk)
+    elif pk_set:
+        for sku in pk_set:
+            basket_cache.invalidate_sku(sku)
+    else:
+        basket_cache.clear()
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    forget_users([instance.pk])
+
+
+# pre_delete: после удаления стола или принтера ссылка пользователя на
+# него уже обнулена.
+@receiver([post_save, pre_delete], sender=Table)
+@receiver([post_save, pre_delete], sender=Printer)
+def workplace_changed(sender, instance, **kwargs):
+    field = "table" if sender is Table else "printer"
+    forget_users(
+        User.objects.filter(**{field: instance}).values_list("pk", flat=True)
+    )
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
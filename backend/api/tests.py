@@ -0,0 +1,1316 @@
+import base64
+import importlib
+import os
+import socket
+import tempfile
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from django.db import connection, connections
+from django.db.models import F
+from django.test import (
+    AsyncClient,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+
+import msgpack
+import orjson
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.urls import clear_url_caches, resolve
+from django.utils import timezone
+from PIL import Image
+from prometheus_client.parser import text_string_to_metric_families
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from items.models import (
+    CartonType,
+    Cell,
+    CellOrderSku,
+    CellOrderSkuArchive,
+    Order,
+    OrderArchive,
+    OrderSku,
+    OrderSkuArchive,
+    Sku,
+    TableOrderQueue,
+)
+from items.renditions import inline_thumbnail, rendition_name, rendition_url
+from config import urls as config_urls
+from users.models import Printer, Table, User
+
+from . import packing, prefetch, recommendations
+from . import urls as api_urls
+from .async_views import AsyncCreateOrderAPIView
+from .authentication import CachedJWTAuthentication
+from .benchmarks.ds_stub import StubDS
+from .benchmarks.fixtures import make_cartontypes, make_order, make_skus
+from .benchmarks.query_plans import (
+    explain,
+    hot_queries,
+    seed_orders,
+    seq_scans,
+)
+from .cache import MISSING, BasketCache
+from .db_routing import _lag_checks
+from .ds_client import CircuitBreaker, CircuitOpen, DSClient, DSUnavailable
+from .renderers import MessagePackRenderer, ORJSONRenderer
+from .serializers import LoadSkuOrderToCellSerializer, SkuSerializer
+
+MSGPACK = "application/msgpack"
+
+
+def reload_urlconf():
+    importlib.reload(api_urls)
+    importlib.reload(config_urls)
+    clear_url_caches()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            failure_threshold=3, reset_timeout=10, clock=self.clock
+        )
+
+    def open_breaker(self):
+        for _ in range(3):
+            self.assertTrue(self.breaker.allow_request())
+            self.breaker.record_failure()
+
+    def test_opens_after_failure_threshold(self):
+        for _ in range(2):
+            self.breaker.allow_request()
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.breaker.allow_request()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_half_open_after_reset_timeout(self):
+        self.open_breaker()
+        self.clock.now = 9.9
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.clock.now = 10
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+
+    def test_half_open_admits_single_trial(self):
+        self.open_breaker()
+        self.clock.now = 10
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_trial_success_closes(self):
+        self.open_breaker()
+        self.clock.now = 10
+        self.breaker.allow_request()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_trial_failure_reopens(self):
+        self.open_breaker()
+        self.clock.now = 10
+        self.breaker.allow_request()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+        self.clock.now = 20
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_released_trial_can_be_retried(self):
+        self.open_breaker()
+        self.clock.now = 10
+        self.breaker.allow_request()
+        self.breaker.release()
+        self.assertTrue(self.breaker.allow_request())
+
+
+class BasketCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.shared = LocMemCache("basket-tests", {})
+        self.addCleanup(self.shared.clear)
+        self.cache = self.make_cache()
+
+    def make_cache(self, maxsize=2):
+        return BasketCache(
+            maxsize=maxsize, ttl=10, clock=self.clock, shared=self.shared
+        )
+
+    def test_key_ignores_line_order_and_duplicates(self):
+        self.cache.set_basket([("a", 2), ("b", 1)], "MYA")
+        self.assertEqual(
+            self.cache.get_basket([("b", 1), ("a", 1), ("a", 1)]), "MYA"
+        )
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set_basket([("a", 1)], "A")
+        self.cache.set_basket([("b", 1)], "B")
+        self.cache.get_basket([("a", 1)])
+        self.cache.set_basket([("c", 1)], "C")
+        self.assertEqual(self.cache.get_basket([("a", 1)]), "A")
+        self.assertIs(self.cache.get_basket([("b", 1)]), MISSING)
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+        # Вытесненная запись ушла и из обратного индекса.
+        self.assertNotIn("b", self.cache._keys_by_sku)
+
+    def test_expires_after_ttl(self):
+        self.cache.set_basket([("a", 1)], "A")
+        self.clock.now = 9.9
+        self.assertEqual(self.cache.get_basket([("a", 1)]), "A")
+        self.clock.now = 10
+        self.assertIs(self.cache.get_basket([("a", 1)]), MISSING)
+        self.assertEqual(len(self.cache), 0)
+        self.assertNotIn("a", self.cache._keys_by_sku)
+
+    def test_invalidate_sku_drops_baskets_with_it(self):
+        self.cache = self.make_cache(maxsize=10)
+        self.cache.set_basket([("a", 1), ("b", 1)], "AB")
+        self.cache.set_basket([("b", 2)], "B")
+        self.cache.set_basket([("c", 1)], "C")
+        self.cache.invalidate_sku("b")
+        self.assertIs(self.cache.get_basket([("a", 1), ("b", 1)]), MISSING)
+        self.assertIs(self.cache.get_basket([("b", 2)]), MISSING)
+        self.assertEqual(self.cache.get_basket([("c", 1)]), "C")
+        self.assertEqual(set(self.cache._keys_by_sku), {"c"})
+
+    def test_invalidation_reaches_other_processes(self):
+        other = self.make_cache()
+        self.cache.set_basket([("a", 1)], "A")
+        other.set_basket([("a", 1)], "A")
+        other.set_basket([("b", 1)], "B")
+        self.cache.invalidate_sku("a")
+        self.assertIs(other.get_basket([("a", 1)]), MISSING)
+        self.assertEqual(other.get_basket([("b", 1)]), "B")
+        self.cache.clear()
+        self.assertIs(other.get_basket([("b", 1)]), MISSING)
+
+    def test_lost_version_does_not_revive_entries(self):
+        self.cache.set_basket([("a", 1)], "A")
+        self.shared.clear()
+        self.assertIs(self.cache.get_basket([("a", 1)]), MISSING)
+
+
+class CartonCatalogTests(SimpleTestCase):
+    def setUp(self):
+        self.catalog = packing.CartonCatalog(
+            ["BIG", "SMALL"], [(30, 30, 30), (10, 20, 10)]
+        )
+
+    def test_smallest_fitting_carton(self):
+        self.assertEqual(self.catalog.recommend([(5, 5, 15, 1)]), "SMALL")
+        self.assertEqual(self.catalog.recommend([(5, 5, 25, 1)]), "BIG")
+        self.assertIsNone(self.catalog.recommend([(5, 5, 35, 1)]))
+
+    def test_empty_basket_gets_no_carton(self):
+        self.assertIsNone(self.catalog.recommend([]))
+        self.assertEqual(
+            self.catalog.recommend_many([[], [(5, 5, 15, 1)]]),
+            [None, "SMALL"],
+        )
+
+    def test_recommend_many_without_orders(self):
+        self.assertEqual(self.catalog.recommend_many([]), [])
+        self.assertEqual(packing.CartonCatalog([], []).recommend_many([]), [])
+
+
+class DSClientTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.client = DSClient(
+            pack_url="http://ds/pack",
+            connect_timeout=1,
+            read_timeout=1,
+            breaker=CircuitBreaker(
+                failure_threshold=1, reset_timeout=10, clock=self.clock
+            ),
+        )
+        self.session = mock.Mock()
+        self.client._local.session = self.session
+
+    def respond(self, body):
+        response = mock.Mock()
+        response.json.return_value = body
+        self.session.post.return_value = response
+
+    def half_open(self):
+        self.client.breaker.allow_request()
+        self.client.breaker.record_failure()
+        self.clock.now = 10
+
+    def test_returns_package(self):
+        self.respond({"package": "MYA"})
+        self.assertEqual(self.client.pack({}), "MYA")
+
+    def test_non_object_body_is_a_failure(self):
+        self.half_open()
+        self.respond(["MYA"])
+        with self.assertRaises(DSUnavailable):
+            self.client.pack({})
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.OPEN)
+        self.clock.now = 20
+        self.respond({"package": "MYA"})
+        self.assertEqual(self.client.pack({}), "MYA")
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_unexpected_error_releases_trial(self):
+        self.half_open()
+        self.session.post.side_effect = RuntimeError("boom")
+        with self.assertRaises(RuntimeError):
+            self.client.pack({})
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.client.breaker.allow_request())
+
+    def test_open_circuit_rejects_without_request(self):
+        self.client.breaker.allow_request()
+        self.client.breaker.record_failure()
+        with self.assertRaises(CircuitOpen):
+            self.client.pack({})
+        self.session.post.assert_not_called()
+        self.assertEqual(self.client.stats()["rejected"], 1)
+
+
+class DSClientHTTPTests(SimpleTestCase):
+    """Клиент против локальной заглушки DS по настоящему HTTP."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.ds = StubDS(package="MYA")
+        self.ds.__enter__()
+        self.addCleanup(self.ds.__exit__, None, None, None)
+
+    def make_client(self, pack_url, read_timeout=1):
+        client = DSClient(
+            pack_url=pack_url,
+            connect_timeout=1,
+            read_timeout=read_timeout,
+            breaker=CircuitBreaker(
+                failure_threshold=2, reset_timeout=10, clock=self.clock
+            ),
+        )
+        self.addCleanup(client.session.close)
+        return client
+
+    def test_connection_refused(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            host, port = sock.getsockname()
+        client = self.make_client(f"http://{host}:{port}/pack")
+        with self.assertRaises(DSUnavailable) as ctx:
+            client.pack({})
+        self.assertIsInstance(
+            ctx.exception.__cause__, requests.ConnectionError
+        )
+        self.assertEqual(client.stats()["errors"], 1)
+
+    def test_read_timeout(self):
+        self.ds.set(latency=0.5)
+        client = self.make_client(self.ds.pack_url, read_timeout=0.1)
+        with self.assertRaises(DSUnavailable) as ctx:
+            client.pack({})
+        self.assertIsInstance(ctx.exception.__cause__, requests.Timeout)
+
+    def test_breaker_opens_and_recovers(self):
+        client = self.make_client(self.ds.pack_url)
+        self.assertEqual(client.pack({}), "MYA")
+        self.ds.set(failing=True)
+        for _ in range(2):
+            with self.assertRaises(DSUnavailable):
+                client.pack({})
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+        self.ds.set(failing=False)
+        with self.assertRaises(CircuitOpen):
+            client.pack({})
+
+        self.clock.now = 10
+        self.assertEqual(client.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(client.pack({}), "MYA")
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(
+            {
+                key: client.stats()[key]
+                for key in ("requests", "errors", "rejected")
+            },
+            {"requests": 4, "errors": 2, "rejected": 1},
+        )
+
+
+class RecommendationFallbackTests(TestCase):
+    def setUp(self):
+        recommendations.basket_cache.clear()
+        packing.invalidate_catalog()
+        self.cartontype = CartonType.objects.create(
+            cartontype="BIG", length=100, width=100, height=100
+        )
+        sku = Sku.objects.create(
+            name="sku", length=10, width=10, height=10, quantity=10
+        )
+        self.order = Order.objects.create(status="forming")
+        OrderSku.objects.create(order=self.order, sku=sku, amount=1)
+
+    def test_open_circuit_falls_back_to_local_packing(self):
+        client = DSClient(
+            pack_url="http://ds/pack",
+            connect_timeout=1,
+            read_timeout=1,
+            breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60),
+        )
+        client.breaker.allow_request()
+        client.breaker.record_failure()
+        client._local.session = mock.Mock()
+
+        with mock.patch.object(
+            recommendations, "get_client", return_value=client
+        ), self.settings(RECOMMENDATION_ENGINE="ds"):
+            recommendations.recommend(self.order.pk)
+
+        client._local.session.post.assert_not_called()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.recommendation_status, "ready")
+        self.assertEqual(self.order.recommended_cartontype, self.cartontype)
+
+
+class ConstantQueriesTestCase(TestCase):
+    """Число SQL-запросов к API не должно зависеть от размера заказа."""
+
+    sizes = (1, 10, 50)
+
+    def setUp(self):
+        self.skus = make_skus(max(self.sizes))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="u"))
+
+    def assertConstantQueries(self, expected, prepare):
+        """prepare(size) готовит данные для заказа из size позиций и
+        возвращает функцию, выполняющую проверяемый запрос."""
+        for size in self.sizes:
+            request = prepare(size)
+            with self.subTest(lines=size), self.assertNumQueries(expected):
+                request()
+
+
+class QueryCountTests(ConstantQueriesTestCase):
+    def test_upload_to_cell(self):
+        table = Table.objects.create(name="t", description="t")
+
+        def prepare(size):
+            order = make_order(self.skus[:size])
+            cell = Cell.objects.create(name=str(size), table=table)
+            payload = {
+                "cell_barcode": str(cell.pk),
+                "order": str(order.pk),
+                "table_name": table.name,
+                "skus": [
+                    {"sku": str(sku.pk), "quantity": 1}
+                    for sku in self.skus[:size]
+                ],
+            }
+            return lambda: self.assertEqual(
+                self.client.post(
+                    "/api/upload-to-cell/", payload, format="json"
+                ).status_code,
+                201,
+            )
+
+        self.assertConstantQueries(8, prepare)
+
+    def test_add_packaging_data(self):
+        cartontypes = make_cartontypes(2)
+
+        def prepare(size):
+            order = make_order(self.skus[:size])
+            payload = {
+                "orderkey": str(order.pk),
+                "selected_cartontypes": [str(ct.pk) for ct in cartontypes],
+                "total_packages": 2,
+                "skus": [
+                    {"sku": str(sku.pk), "packaging_number": 1}
+                    for sku in self.skus[:size]
+                ],
+            }
+            return lambda: self.assertEqual(
+                self.client.patch(
+                    "/api/order/add-packaging-data/", payload, format="json"
+                ).status_code,
+                200,
+            )
+
+        self.assertConstantQueries(7, prepare)
+
+    def details_url(self, size):
+        order = make_order(self.skus[:size])
+        return f"/api/order/details/?orderkey={order.pk}"
+
+    def test_order_details(self):
+        def prepare(size):
+            url = self.details_url(size)
+            return lambda: self.assertEqual(
+                self.client.get(url).status_code, 200
+            )
+
+        self.assertConstantQueries(3, prepare)
+
+    def test_order_details_revalidated(self):
+        def prepare(size):
+            url = self.details_url(size)
+            etag = self.client.get(url)["ETag"]
+            return lambda: self.assertEqual(
+                self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+                304,
+            )
+
+        self.assertConstantQueries(1, prepare)
+
+
+class OrderCreateTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.skus = make_skus(2, quantity=5)
+        self.sku, self.other = self.skus
+
+    def create(self, *lines):
+        return self.client.post(
+            "/api/order/create/",
+            {
+                "skus": [
+                    {"sku": str(sku), "amount": amount}
+                    for sku, amount in lines
+                ]
+            },
+            format="json",
+        )
+
+    def assertStock(self, *quantities):
+        for sku, quantity in zip(self.skus, quantities):
+            sku.refresh_from_db()
+            self.assertEqual(sku.quantity, quantity)
+
+    def test_reserves_stock(self):
+        response = self.create((self.sku.pk, 2), (self.other.pk, 1))
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.data["orderkey"])
+        self.assertEqual(order.status, "forming")
+        self.assertEqual(
+            dict(order.order_skus.values_list("sku", "amount")),
+            {self.sku.pk: 2, self.other.pk: 1},
+        )
+        self.assertStock(3, 4)
+
+    def test_insufficient_stock_rolls_back(self):
+        response = self.create((self.sku.pk, 1), (self.other.pk, 6))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderSku.objects.exists())
+        self.assertStock(5, 5)
+
+    def test_unknown_sku(self):
+        response = self.create((self.sku.pk, 1), (uuid.uuid4(), 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertStock(5, 5)
+
+    def test_merges_duplicate_skus(self):
+        response = self.create((self.sku.pk, 1), (self.sku.pk, 2))
+        self.assertEqual(response.status_code, 201)
+        line = OrderSku.objects.get(order=response.data["orderkey"])
+        self.assertEqual((line.sku_id, line.amount), (self.sku.pk, 3))
+        self.assertStock(2)
+
+
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN JSON of PostgreSQL")
+class QueryPlanTests(TestCase):
+    def test_hot_queries_use_indexes(self):
+        orders = seed_orders(orders=40, tables=2, cells=2, lines=2, skus=20)
+        order = orders[len(orders) // 2]
+        cell = CellOrderSku.objects.filter(order=order).first().cell
+        sku_ids = list(order.order_skus.values_list("sku_id", flat=True))
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+            # На маленьких таблицах полный просмотр дешевле индекса;
+            # без него планировщик выберет индекс, если тот подходит.
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        for name, queryset in hot_queries(
+            cell.table_id, order.pk, sku_ids
+        ).items():
+            with self.subTest(query=name):
+                _, nodes = explain(queryset)
+                self.assertEqual(seq_scans(nodes), set())
+
+
+@override_settings(
+    ASYNC_VIEWS=True,
+    RECOMMENDATION_ENGINE="ds",
+    RECOMMENDATION_INLINE_TIMEOUT=0.5,
+)
+class AsyncCreateOrderTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Представление выбирается при импорте URLconf.
+        reload_urlconf()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        reload_urlconf()
+
+    def setUp(self):
+        recommendations.basket_cache.clear()
+        self.cartontype = CartonType.objects.create(
+            cartontype="MYA", length=100, width=100, height=100
+        )
+        self.sku = make_skus(1)[0]
+        self.ds = StubDS(package="MYA")
+        self.ds.__enter__()
+        self.addCleanup(self.ds.__exit__, None, None, None)
+        client = DSClient(
+            pack_url=self.ds.pack_url,
+            connect_timeout=1,
+            read_timeout=1,
+            breaker=CircuitBreaker(failure_threshold=5, reset_timeout=10),
+        )
+        patcher = mock.patch.object(
+            recommendations, "get_client", return_value=client
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def create(self):
+        return await AsyncClient().post(
+            "/api/order/create/",
+            {"skus": [{"sku": str(self.sku.pk), "amount": 1}]},
+            content_type="application/json",
+        )
+
+    async def test_recommendation_in_response(self):
+        self.assertIs(
+            resolve("/api/order/create/").func.view_class,
+            AsyncCreateOrderAPIView,
+        )
+        response = await self.create()
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data["recommendation_status"], "ready")
+        order = await Order.objects.select_related(
+            "recommended_cartontype"
+        ).aget(pk=data["orderkey"])
+        self.assertEqual(order.recommended_cartontype, self.cartontype)
+        self.assertEqual(
+            await OrderSku.objects.filter(order=order).acount(), 1
+        )
+
+    async def test_ds_unavailable(self):
+        for failure in ({"failing": True}, {"latency": 1.0}):
+            with self.subTest(**failure):
+                self.ds.set(**{"failing": False, "latency": 0.0, **failure})
+                with mock.patch.object(
+                    recommendations, "schedule"
+                ) as schedule:
+                    response = await self.create()
+                self.assertEqual(response.status_code, 201)
+                data = response.json()
+                self.assertEqual(data["order_status"], "forming")
+                self.assertEqual(data["recommendation_status"], "pending")
+                schedule.assert_called_once_with(uuid.UUID(data["orderkey"]))
+                self.assertEqual(
+                    await Order.objects.filter(pk=data["orderkey"]).acount(),
+                    1,
+                )
+
+
+class OrderStatusUpdateTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="u"))
+        self.cartontype = CartonType.objects.create(
+            cartontype="BIG", length=100, width=100, height=100
+        )
+        self.order = Order.objects.create(status="collecting")
+
+    def test_keeps_recommendation_written_concurrently(self):
+        # Рекомендация записана после того, как заказ мог быть прочитан
+        # представлением: обновление статуса не должно её затереть.
+        Order.objects.filter(pk=self.order.pk).update(
+            recommendation_status="ready",
+            recommended_cartontype=self.cartontype,
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(
+                "/api/order/collected/",
+                {"orderkey": str(self.order.pk), "status": "collected"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        writes = [
+            query["sql"]
+            for query in ctx.captured_queries
+            if query["sql"].startswith("UPDATE")
+        ]
+        self.assertEqual(len(writes), 1)
+        self.assertNotIn("recommendation", writes[0])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "collected")
+        self.assertEqual(self.order.recommendation_status, "ready")
+        self.assertEqual(self.order.recommended_cartontype, self.cartontype)
+
+    def collect(self, orderkey):
+        return self.client.patch(
+            "/api/order/collected/",
+            {"orderkey": str(orderkey), "status": "collected"},
+            format="json",
+        )
+
+    def test_unknown_order(self):
+        response = self.collect(uuid.uuid4())
+        self.assertEqual(response.status_code, 404)
+
+    def test_disallowed_transition(self):
+        order = Order.objects.create(status="forming")
+        response = self.collect(order.pk)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["status"], "forming")
+        order.refresh_from_db()
+        self.assertEqual(order.status, "forming")
+        self.assertEqual(order.version, 1)
+
+    def test_lost_race(self):
+        # Второй упаковщик собирает уже собранный заказ.
+        self.assertEqual(self.collect(self.order.pk).status_code, 200)
+        response = self.collect(self.order.pk)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["status"], "collected")
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.version, 2)
+
+
+class OrderBatchStatusUpdateTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="u"))
+
+    def test_mixed_batch(self):
+        collecting = Order.objects.create(status="collecting")
+        forming = Order.objects.create(status="forming")
+        missing = uuid.uuid4()
+        response = self.client.patch(
+            "/api/order/batch-status/",
+            {
+                "orderkeys": [
+                    str(orderkey)
+                    for orderkey in (collecting.pk, forming.pk, missing)
+                ],
+                "status": "collected",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["results"],
+            {
+                str(collecting.pk): "ok",
+                str(forming.pk): "wrong_state",
+                str(missing): "not_found",
+            },
+        )
+        self.assertEqual(
+            response.data["counts"],
+            {"ok": 1, "wrong_state": 1, "not_found": 1},
+        )
+        collecting.refresh_from_db()
+        forming.refresh_from_db()
+        self.assertEqual(collecting.status, "collected")
+        self.assertEqual(forming.status, "forming")
+
+
+class PrefetchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.table = Table.objects.create(name="t1", description="t")
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create(username="u", table=self.table)
+        )
+        self.order = make_order(make_skus(1))
+        self.cell = Cell.objects.create(name="1", table=self.table)
+        CellOrderSku.objects.create(
+            cell=self.cell,
+            sku=self.order.order_skus.get().sku,
+            order=self.order,
+            quantity=1,
+        )
+        TableOrderQueue.objects.enqueue(self.table.pk, self.order.pk)
+        prefetch.refresh(self.table.pk)
+
+    def find(self):
+        response = self.client.get("/api/order/find/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["oldest_order"], str(self.order.pk))
+        return [cell["name"] for cell in response.data["cells"]]
+
+    def test_claimed_order_served_from_slot(self):
+        self.assertEqual(self.find(), ["1"])
+        self.assertIsNone(cache.get(prefetch.slot_key(self.table.pk)))
+        self.order.refresh_from_db()
+        self.assertIsNotNone(
+            prefetch.details(self.order.pk, self.order.version)
+        )
+
+    def test_order_changed_after_prefetch(self):
+        # Заказ разложили ещё в одну ячейку после подготовки слота:
+        # версия вырастет на два, и ответ строится из базы.
+        cell = Cell.objects.create(name="2", table=self.table)
+        CellOrderSku.objects.create(
+            cell=cell,
+            sku=self.order.order_skus.get().sku,
+            order=self.order,
+            quantity=1,
+        )
+        Order.objects.filter(pk=self.order.pk).update(version=F("version") + 1)
+        self.assertEqual(sorted(self.find()), ["1", "2"])
+        self.assertIsNone(cache.get(prefetch.slot_key(self.table.pk)))
+        self.order.refresh_from_db()
+        self.assertIsNone(prefetch.details(self.order.pk, self.order.version))
+
+
+class SkuImageTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = self.settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        inline_thumbnail.cache_clear()
+        buffer = BytesIO()
+        Image.new("RGBA", (400, 200), "red").save(buffer, "PNG")
+        self.sku = Sku.objects.create(
+            name="sku",
+            length=1,
+            width=1,
+            height=1,
+            quantity=1,
+            image=ContentFile(buffer.getvalue(), name="sku.png"),
+        )
+
+    def get_image(self, inline_images):
+        return SkuSerializer(
+            self.sku,
+            context={"amounts": {}, "inline_images": inline_images},
+        ).data["image"]
+
+    def test_renditions_generated(self):
+        self.assertTrue(self.sku.image_hash)
+        for size in settings.SKU_IMAGE_RENDITION_SIZES:
+            name = rendition_name(self.sku.image_hash, size)
+            self.assertTrue(default_storage.exists(name))
+            with default_storage.open(name) as file, Image.open(file) as image:
+                self.assertEqual(image.format, "JPEG")
+                self.assertEqual(max(image.size), size)
+        self.assertEqual(
+            self.get_image(False), rendition_url(self.sku.image_hash)
+        )
+        data = base64.b64decode(self.get_image(True))
+        with Image.open(BytesIO(data)) as image:
+            self.assertEqual(
+                max(image.size), min(settings.SKU_IMAGE_RENDITION_SIZES)
+            )
+
+    def test_inline_without_hash_falls_back_to_image(self):
+        Sku.objects.filter(pk=self.sku.pk).update(image_hash="")
+        self.sku.refresh_from_db()
+        self.assertEqual(self.get_image(True), self.sku.image.url)
+        self.assertEqual(self.get_image(False), self.sku.image.url)
+
+    def test_inline_without_rendition_falls_back_to_image(self):
+        for size in settings.SKU_IMAGE_RENDITION_SIZES:
+            default_storage.delete(rendition_name(self.sku.image_hash, size))
+        self.assertEqual(self.get_image(True), self.sku.image.url)
+
+
+class ArchiveOrdersTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        skus = make_skus(2)
+        cartontypes = make_cartontypes(2)
+        table = Table.objects.create(name="t1", description="t")
+        user = User.objects.create(username="u", table=table)
+        cell = Cell.objects.create(name="1", table=table)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+        self.order = make_order(skus, amount=2, status="collected")
+        for sku in skus:
+            CellOrderSku.objects.create(
+                cell=cell, sku=sku, order=self.order, quantity=2
+            )
+        self.order.selected_cartontypes.set(cartontypes)
+        OrderSku.objects.filter(order=self.order).update(packaging_number=1)
+        old = timezone.now() - timedelta(days=40)
+        Order.objects.filter(pk=self.order.pk).update(
+            who=user,
+            total_packages=1,
+            recommended_cartontype=cartontypes[0],
+            created_at=old,
+        )
+        self.recent = make_order(skus, status="collected")
+        self.forming = make_order(skus)
+        Order.objects.filter(pk=self.forming.pk).update(created_at=old)
+
+    def snapshot(self, order_model, line_model, cell_model):
+        orderkey = self.order.pk
+        fields = [field.attname for field in Order._meta.concrete_fields]
+        return (
+            order_model.objects.filter(pk=orderkey).values(*fields).get(),
+            set(
+                line_model.objects.filter(order=orderkey).values_list(
+                    "sku", "amount", "packaging_number"
+                )
+            ),
+            set(
+                cell_model.objects.filter(order=orderkey).values_list(
+                    "cell", "sku", "quantity"
+                )
+            ),
+            set(
+                order_model.objects.get(
+                    pk=orderkey
+                ).selected_cartontypes.values_list("pk", flat=True)
+            ),
+        )
+
+    def details(self):
+        response = self.client.get(
+            "/api/order/details/", {"orderkey": str(self.order.pk)}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_archives_old_collected_orders(self):
+        live = self.snapshot(Order, OrderSku, CellOrderSku)
+        details = self.details()
+        out = StringIO()
+        call_command("archive_orders", batch_size=1, stdout=out)
+        self.assertIn("Archived 1 orders in 1 batches", out.getvalue())
+
+        self.assertFalse(Order.objects.filter(pk=self.order.pk).exists())
+        self.assertFalse(OrderSku.objects.filter(order=self.order).exists())
+        self.assertFalse(
+            CellOrderSku.objects.filter(order=self.order).exists()
+        )
+        self.assertEqual(
+            set(Order.objects.values_list("pk", flat=True)),
+            {self.recent.pk, self.forming.pk},
+        )
+        self.assertEqual(
+            self.snapshot(OrderArchive, OrderSkuArchive, CellOrderSkuArchive),
+            live,
+        )
+        self.assertIsNotNone(
+            OrderArchive.objects.get(pk=self.order.pk).archived_at
+        )
+        self.assertEqual(self.details(), details)
+
+        # Повторный запуск ничего не переносит.
+        out = StringIO()
+        call_command("archive_orders", stdout=out)
+        self.assertIn("Archived 0 orders in 0 batches", out.getvalue())
+
+
+class ContentNegotiationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="u"))
+        self.sku = make_skus(1)[0]
+
+    def request(self, method, path, data=None, media_type=MSGPACK):
+        kwargs = {"HTTP_ACCEPT": media_type}
+        if data is not None:
+            kwargs["data"] = (
+                msgpack.packb(data)
+                if media_type == MSGPACK
+                else orjson.dumps(data)
+            )
+            kwargs["content_type"] = media_type
+        response = getattr(self.client, method)(path, **kwargs)
+        self.assertEqual(response["Content-Type"], media_type)
+        if media_type == MSGPACK:
+            return response, msgpack.unpackb(response.content)
+        return response, orjson.loads(response.content)
+
+    def test_round_trip(self):
+        for media_type in (MSGPACK, "application/json"):
+            with self.subTest(media_type=media_type):
+                response, created = self.request(
+                    "post",
+                    "/api/order/create/",
+                    {"skus": [{"sku": str(self.sku.pk), "amount": 1}]},
+                    media_type,
+                )
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(created["order_status"], "forming")
+                response, details = self.request(
+                    "get",
+                    f"/api/order/details/?orderkey={created['orderkey']}",
+                    media_type=media_type,
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(details["orderkey"], created["orderkey"])
+                self.assertEqual(details["skus"][0]["sku"], str(self.sku.pk))
+
+    def test_formats_have_own_etags(self):
+        order = make_order([self.sku])
+        path = f"/api/order/details/?orderkey={order.pk}"
+        msgpack_response, msgpack_data = self.request("get", path)
+        json_response, json_data = self.request(
+            "get", path, media_type="application/json"
+        )
+        self.assertEqual(msgpack_data, json_data)
+        self.assertNotEqual(msgpack_response["ETag"], json_response["ETag"])
+
+    def test_non_string_keys(self):
+        key = uuid.uuid4()
+        data = {key: Decimal("1.5"), 1: "one"}
+        self.assertEqual(
+            orjson.loads(ORJSONRenderer().render(data)),
+            {str(key): 1.5, "1": "one"},
+        )
+        self.assertEqual(
+            msgpack.unpackb(
+                MessagePackRenderer().render(data), strict_map_key=False
+            ),
+            {str(key): 1.5, 1: "one"},
+        )
+
+    def test_non_string_keys_in_request(self):
+        response = self.client.patch(
+            "/api/order/batch-status/",
+            msgpack.packb({1: "collected"}),
+            content_type=MSGPACK,
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="u"))
+
+    def samples(self):
+        # Prometheus читает /metrics без аутентификации.
+        response = APIClient().get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        return {
+            (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+            for family in text_string_to_metric_families(
+                response.content.decode()
+            )
+            for sample in family.samples
+        }
+
+    def test_request_metrics(self):
+        route = (("route", "api/tables/"),)
+        latency = (
+            "http_request_duration_seconds_count",
+            (("method", "GET"), *route, ("status", "200")),
+        )
+        queries = ("http_request_db_queries_count", route)
+        rejected = ("ds_requests_rejected_total", ())
+        before = self.samples()
+        self.assertEqual(self.client.get("/api/tables/").status_code, 200)
+        client = DSClient(
+            pack_url="http://ds/pack",
+            connect_timeout=1,
+            read_timeout=1,
+            breaker=CircuitBreaker(failure_threshold=1, reset_timeout=10),
+        )
+        client.breaker.record_failure()
+        with self.assertRaises(CircuitOpen):
+            client.pack({})
+        after = self.samples()
+        for key in (latency, queries, rejected):
+            with self.subTest(sample=key[0]):
+                self.assertEqual(after[key] - before.get(key, 0), 1)
+        self.assertGreater(
+            after[("http_request_db_queries_sum", route)],
+            before.get(("http_request_db_queries_sum", route), 0),
+        )
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.table = Table.objects.create(name="t1", description="t")
+        self.user = User.objects.create(username="u", table=self.table)
+        self.token = AccessToken.for_user(self.user)
+        self.auth = CachedJWTAuthentication()
+
+    def get_user(self):
+        return self.auth.get_user(self.token)
+
+    def test_cached_user_needs_no_queries(self):
+        self.get_user()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_user().table, self.table)
+
+    def test_user_change_is_seen_after_commit(self):
+        self.get_user()
+        other = Table.objects.create(name="t2", description="t")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.table = other
+            self.user.save()
+        self.assertEqual(self.get_user().table, other)
+
+    def test_table_change_and_delete_are_seen(self):
+        self.get_user()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.table.name = "t3"
+            self.table.save()
+        self.assertEqual(self.get_user().table.name, "t3")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.table.delete()
+        self.assertIsNone(self.get_user().table)
+
+    def test_printer_delete_is_seen(self):
+        printer = Printer.objects.create()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.printer = printer
+            self.user.save()
+        self.assertEqual(self.get_user().printer, printer)
+        with self.captureOnCommitCallbacks(execute=True):
+            printer.delete()
+        self.assertIsNone(self.get_user().printer)
+
+
+class CatalogImportInvalidationTests(TestCase):
+    def setUp(self):
+        recommendations.basket_cache.clear()
+        self.sku = Sku.objects.create(
+            name="sku", length=1, width=1, height=1, quantity=1
+        )
+        self.lines = [(str(self.sku.pk), 1)]
+        recommendations.basket_cache.set_basket(self.lines, "MYA")
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, self.directory)
+
+    def import_catalog(self, catalog, header, row):
+        path = os.path.join(self.directory, f"{catalog}.csv")
+        with open(path, "w") as file:
+            file.write(f"{header}\n{row}\n")
+        self.addCleanup(os.remove, path)
+        call_command("import_catalog", catalog, path, stdout=StringIO())
+
+    def test_sku_import_drops_cached_baskets(self):
+        self.import_catalog(
+            "sku",
+            "sku,name,length,width,height,goods_wght,quantity",
+            f"{self.sku.pk},sku,50,50,50,1,1",
+        )
+        self.assertIs(
+            recommendations.basket_cache.get_basket(self.lines), MISSING
+        )
+
+    def test_cartontype_import_drops_catalog(self):
+        packing.get_catalog()
+        self.import_catalog(
+            "cartontype",
+            "barcode,cartontype,length,width,height",
+            f"{uuid.uuid4()},BIG,100,100,100",
+        )
+        self.assertIs(
+            recommendations.basket_cache.get_basket(self.lines), MISSING
+        )
+        self.assertIn("BIG", packing.get_catalog().codes)
+
+
+class UploadToCellTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="u"))
+        self.skus = make_skus(2, quantity=5)
+        self.tables = [
+            Table.objects.create(name=name, description=name)
+            for name in ("t1", "t2")
+        ]
+        self.cell = Cell.objects.create(name="1")
+
+    def upload(self, order, table):
+        response = self.client.post(
+            "/api/upload-to-cell/",
+            {
+                "cell_barcode": str(self.cell.pk),
+                "order": str(order.pk),
+                "table_name": table.name,
+                "skus": [{"sku": str(self.skus[0].pk), "quantity": 1}],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def test_moving_cell_moves_its_orders_between_queues(self):
+        first, second = make_order(self.skus), make_order(self.skus)
+        self.upload(first, self.tables[0])
+        self.upload(second, self.tables[1])
+        self.assertEqual(
+            set(TableOrderQueue.objects.values_list("table", "order")),
+            {(self.tables[1].pk, first.pk), (self.tables[1].pk, second.pk)},
+        )
+
+    def test_returns_saved_cell(self):
+        order = make_order(self.skus)
+        serializer = LoadSkuOrderToCellSerializer(
+            data={
+                "cell_barcode": str(self.cell.pk),
+                "order": str(order.pk),
+                "table_name": self.tables[0].name,
+                "skus": [{"sku": str(self.skus[0].pk), "quantity": 1}],
+            }
+        )
+        serializer.is_valid(raise_exception=True)
+        cell = serializer.save()
+        self.assertEqual(cell.pk, self.cell.pk)
+        self.assertEqual(cell.name, "1")
+        self.assertEqual(cell.table, self.tables[0])
+        self.cell.refresh_from_db()
+        self.assertEqual(self.cell.table, self.tables[0])
+
+
+class AddPackagingDataTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="u"))
+        self.skus = make_skus(2, quantity=5)
+        self.cartontypes = make_cartontypes(2)
+        self.order = make_order(self.skus)
+        self.payload = {
+            "orderkey": str(self.order.pk),
+            "selected_cartontypes": [str(self.cartontypes[0].pk)],
+            "total_packages": 1,
+            "skus": [
+                {"sku": str(sku.pk), "packaging_number": 1}
+                for sku in self.skus
+            ],
+        }
+
+    def send(self):
+        response = self.client.patch(
+            "/api/order/add-packaging-data/", self.payload, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.order.refresh_from_db()
+        return self.order.version
+
+    def test_repeated_payload_changes_nothing(self):
+        version = self.send()
+        self.assertEqual(self.send(), version)
+        self.assertEqual(self.order.total_packages, 1)
+
+    def test_any_change_bumps_version_once(self):
+        version = self.send()
+        changes = (
+            ("skus", [{"sku": str(self.skus[0].pk), "packaging_number": 2}]),
+            ("selected_cartontypes", [str(self.cartontypes[1].pk)]),
+            ("total_packages", 2),
+        )
+        for field, value in changes:
+            with self.subTest(field=field):
+                self.payload[field] = value
+                version, previous = self.send(), version
+                self.assertEqual(version, previous + 1)
+        self.assertEqual(self.order.total_packages, 2)
+        self.assertEqual(
+            list(
+                self.order.order_skus.order_by("packaging_number").values_list(
+                    "packaging_number", flat=True
+                )
+            ),
+            [1, 2],
+        )
+
+
+@override_settings(DATABASE_REPLICAS=["replica1"])
+class ReplicaRoutingTests(TransactionTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Реплика смотрит в ту же тестовую базу. Псевдоним добавляется
+        # после проверки databases, поэтому запросы к нему разрешены.
+        connections.settings["replica1"] = connections[
+            "default"
+        ].settings_dict.copy()
+
+    @classmethod
+    def tearDownClass(cls):
+        connections["replica1"].close()
+        del connections["replica1"]
+        del connections.settings["replica1"]
+        _lag_checks.clear()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.table = Table.objects.create(name="t1", description="t")
+        user = User.objects.create(username="u", table=self.table)
+        self.order = Order.objects.create(status="collecting")
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}"
+        )
+
+    def get_tables(self):
+        with CaptureQueriesContext(
+            connection
+        ) as primary, CaptureQueriesContext(
+            connections["replica1"]
+        ) as replica:
+            response = self.client.get("/api/tables/")
+        self.assertEqual(response.status_code, 200)
+        return (
+            " ".join(query["sql"] for query in primary.captured_queries),
+            " ".join(query["sql"] for query in replica.captured_queries),
+        )
+
+    def test_reads_replica_until_write(self):
+        cache.clear()
+        primary, replica = self.get_tables()
+        self.assertIn('FROM "users_user"', primary)
+        self.assertNotIn('FROM "users_user"', replica)
+        self.assertIn('FROM "users_table"', replica)
+        self.assertNotIn('FROM "users_table"', primary)
+
+        response = self.client.patch(
+            "/api/order/collected/",
+            {"orderkey": str(self.order.pk), "status": "collected"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        # Сканер не хранит cookie: закрепление держится на id
+        # пользователя из токена.
+        self.client.cookies.clear()
+        primary, replica = self.get_tables()
+        self.assertIn('FROM "users_table"', primary)
+        self.assertNotIn('FROM "users_table"', replica)
@@ -1,12 +1,16 @@
+from django.conf import settings
 from django.urls import path, include
 
+from .async_views import AsyncCreateOrderAPIView
 from .views import (
     CreateOrderAPIView,
     FindOrderAPIView,
     LoadSkuOrderToCellView,
     OrderDetailsAPIView,
     OrderAddNewDataAPIView,
+    OrderBatchStatusUpdateAPIView,
     OrderStatusUpdateAPIView,
+    RecommendationStatsAPIView,
     GetTablesApiView,
     GetTokenApiView,
     SignUpApiView,
@@ -14,6 +18,11 @@ from .views import (
     SelectPrinterApiView,
 )
 
+# В режиме ASGI заказ создаётся async-представлением, см. async_views.
+CreateOrderView = (
+    AsyncCreateOrderAPIView if settings.ASYNC_VIEWS else CreateOrderAPIView
+)
+
 registration = [
     path("sign-up/", SignUpApiView.as_view()),
     path("login/", GetTokenApiView.as_view()),
@@ -31,7 +40,7 @@ urlpatterns = [
     ),
     path(
         "order/create/",
-        CreateOrderAPIView.as_view(),
+        CreateOrderView.as_view(),
         name="create_new_order",
     ),
     path(
@@ -48,4 +57,14 @@ urlpatterns = [
         OrderStatusUpdateAPIView.as_view(),
         name="order-collected",
     ),
+    path(
+        "order/batch-status/",
+        OrderBatchStatusUpdateAPIView.as_view(),
+        name="order-batch-status",
+    ),
+    path(
+        "recommendations/stats/",
+        RecommendationStatsAPIView.as_view(),
+        name="recommendation-stats",
+    ),
 ]
@@ -1,15 +1,28 @@
+from collections import Counter
+
 from django.contrib.auth import get_user_model
+from django.db.models import Count, Max
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
-from items.models import Cell, Order
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from items.models import InvalidTransition, Order, OrderArchive
 from users.models import Table
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import AccessToken
-from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.permissions import (
+    AllowAny,
+    IsAdminUser,
+    IsAuthenticated,
+)
 
+from . import metrics, prefetch
+from .ds_client import get_client
+from .recommendations import basket_cache
 from .serializers import (
-    CellSerializer,
+    BatchStatusOrderSerializer,
     CreateOrderSerializer,
     FindOrderSerializer,
     GetTokenSerializer,
@@ -26,6 +39,13 @@ from .serializers import (
 User = get_user_model()
 
 
+def order_etag(version, inline_images, media_format):
+    """ETag деталей заказа: версия заказа, вариант ответа и формат
+    (json, msgpack)."""
+    variant = "inline" if inline_images else "url"
+    return quote_etag(f"{version}-{variant}-{media_format}")
+
+
 class SignUpApiView(APIView):
     """Регистрация упаковщика.
     Доступен только админу.
@@ -58,12 +78,30 @@ class GetTablesApiView(APIView):
     """Выдача столов."""
 
     permission_classes = (IsAuthenticated,)
+    read_only = True
 
     @staticmethod
     def get(request):
+        # Версия набора столов: число столов и время последнего
+        # изменения; добавление, удаление и правка меняют хотя бы одно.
+        version = Table.objects.aggregate(
+            count=Count("pk"), updated_at=Max("updated_at")
+        )
+        updated_at = version["updated_at"]
+        etag = quote_etag(
+            f"{version['count']}-{updated_at.timestamp() if updated_at else 0}"
+            f"-{request.accepted_renderer.format}"
+        )
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified["ETag"] = etag
+            return not_modified
+
         queryset = Table.objects.all()
         serializer = GetTableSerializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(
+            serializer.data, status=status.HTTP_200_OK, headers={"ETag": etag}
+        )
 
 
 class SelectTableApiView(APIView):
@@ -96,6 +134,32 @@ class SelectPrinterApiView(APIView):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+class RecommendationStatsAPIView(APIView):
+    """Статистика кэша рекомендаций и клиента DS процесса."""
+
+    permission_classes = (IsAdminUser,)
+
+    @staticmethod
+    def get(request):
+        return Response(
+            {"cache": basket_cache.stats(), "ds": get_client().stats()},
+            status=status.HTTP_200_OK,
+        )
+
+
+class MetricsAPIView(APIView):
+    """Метрики в текстовом формате Prometheus.
+    Снаружи закрыт в nginx, читается напрямую с backend:8000."""
+
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+
+    @staticmethod
+    def get(request):
+        body, content_type = metrics.render()
+        return HttpResponse(body, content_type=content_type)
+
+
 class CreateOrderAPIView(APIView):
     @staticmethod
     def post(request):
@@ -103,7 +167,11 @@ class CreateOrderAPIView(APIView):
         if serializer.is_valid():
             order = serializer.save()
             return Response(
-                {"orderkey": order.pk, "order_status": order.status},
+                {
+                    "orderkey": order.pk,
+                    "order_status": order.status,
+                    "recommendation_status": order.recommendation_status,
+                },
                 status=status.HTTP_201_CREATED,
             )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -123,14 +191,59 @@ class LoadSkuOrderToCellView(APIView):
 
 
 class OrderDetailsAPIView(APIView):
+    read_only = True
+
     @staticmethod
     def get(request):
         orderkey = request.GET.get("orderkey")
-        order = get_object_or_404(Order, orderkey=orderkey)
+        inline_images = request.GET.get("inline_images") in ("1", "true")
+        model = Order
+        version = (
+            Order.objects.filter(orderkey=orderkey)
+            .values_list("version", flat=True)
+            .first()
+        )
+        if version is None:
+            # Старые собранные заказы переносятся в архив (archive_orders).
+            model = OrderArchive
+            version = get_object_or_404(
+                OrderArchive.objects.values_list("version", flat=True),
+                orderkey=orderkey,
+            )
+        etag = order_etag(
+            version, inline_images, request.accepted_renderer.format
+        )
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified["ETag"] = etag
+            return not_modified
+
+        if model is Order and not inline_images:
+            # Заказ, подготовленный заранее, см. prefetch.
+            data = prefetch.details(orderkey, version)
+            if data is not None:
+                return Response(
+                    data, status=status.HTTP_200_OK, headers={"ETag": etag}
+                )
 
-        serializer = GetOrderSerializer(order)
+        order = get_object_or_404(
+            model.objects.with_details(), orderkey=orderkey
+        )
+        serializer = GetOrderSerializer(
+            order, context={"inline_images": inline_images}
+        )
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(
+            serializer.data,
+            status=status.HTTP_200_OK,
+            headers={
+                "ETag": order_etag(
+                    order.version,
+                    inline_images,
+                    request.accepted_renderer.format,
+                )
+            },
+        )
 
 
 class OrderAddNewDataAPIView(APIView):
@@ -175,9 +288,9 @@ class OrderStatusUpdateAPIView(APIView):
             order_status = serializer.validated_data["status"]
 
             try:
-                order = Order.objects.get(orderkey=orderkey)
-                order.status = order_status
-                order.save()
+                Order.objects.transition(orderkey, order_status)
+                if request.user.is_authenticated:
+                    prefetch.schedule(request.user.table_id)
 
                 return Response(
                     {
@@ -190,44 +303,66 @@ class OrderStatusUpdateAPIView(APIView):
                     {"error": "Order not found"},
                     status=status.HTTP_404_NOT_FOUND,
                 )
+            except InvalidTransition as exc:
+                return Response(
+                    {"error": str(exc), "status": exc.current},
+                    status=status.HTTP_409_CONFLICT,
+                )
         else:
             return Response(
                 serializer.errors, status=status.HTTP_400_BAD_REQUEST
             )
 
 
+class OrderBatchStatusUpdateAPIView(APIView):
+    """
+    API-представление для обновления статуса многих заказов сразу,
+    например при закрытии смены. Возвращает результат по каждому
+    заказу: ok, not_found или wrong_state.
+    """
+
+    permission_classes = (IsAuthenticated,)
+
+    @staticmethod
+    def patch(request):
+        serializer = BatchStatusOrderSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        outcomes = Order.objects.transition_many(
+            serializer.validated_data["orderkeys"],
+            serializer.validated_data["status"],
+        )
+        return Response(
+            {
+                "results": {
+                    str(orderkey): outcome
+                    for orderkey, outcome in outcomes.items()
+                },
+                "counts": Counter(outcomes.values()),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
 class FindOrderAPIView(APIView):
+    permission_classes = (IsAuthenticated,)
+
     @staticmethod
     def get(request):
         user = request.user
-        table = user.table
+        oldest_order_id = Order.objects.claim_next(user.table_id, user)
 
-        oldest_order_id = (
-            Order.objects.filter(
-                cellorder_skus__cell__table=table, status="forming"
-            )
-            .order_by("cellorder_skus__order__created_at")
-            .values_list("pk", flat=True)
-            .first()
-        )
-
-        if not oldest_order_id:
+        if oldest_order_id is None:
             return Response(
                 {"error": "No orders found for the table."},
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-        oldest_order = Order.objects.get(pk=oldest_order_id)
-        oldest_order.who_id = user.id
-        oldest_order.status = "collecting"
-        oldest_order.save()
-
-        cells = Cell.objects.filter(
-            cellorder_skus__order=oldest_order_id
-        ).distinct()
-        cell_serializer = CellSerializer(cells, many=True)
+        cells = prefetch.take_cells(user.table_id, oldest_order_id)
+        if cells is None:
+            cells = prefetch.order_cells(oldest_order_id)
+        prefetch.schedule(user.table_id)
 
-        data = {"oldest_order": oldest_order_id, "cells": cell_serializer.data}
+        data = {"oldest_order": oldest_order_id, "cells": cells}
 
         serializer = FindOrderSerializer(data)
         return Response(serializer.data)
@@ -33,6 +33,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.MetricsMiddleware",
+    "api.db_routing.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
 
@@ -86,6 +88,26 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения: DB_REPLICA_HOSTS="host1,host2:5433". Куда идут
+# запросы, решает api.db_routing; в тестах реплики смотрят в тестовую
+# базу default.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(
+    filter(None, os.getenv("DB_REPLICA_HOSTS", default="").split(",")),
+    start=1,
+):
+    host, _, port = replica.strip().partition(":")
+    DATABASES[f"replica{index}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica{index}")
+DATABASE_ROUTERS = ["api.db_routing.ReplicaRouter"]
+# Сколько секунд после изменяющего запроса клиент читает с основной базы
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", default=5))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -117,8 +139,21 @@ AUTH_USER_MODEL = "users.User"
 # Настройки rest_framework
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
-    )
+        "api.authentication.CachedJWTAuthentication",
+    ),
+    # JSON через orjson; MessagePack по Accept / Content-Type
+    # application/msgpack, см. api/renderers.py
+    "DEFAULT_RENDERER_CLASSES": (
+        "api.renderers.ORJSONRenderer",
+        "api.renderers.MessagePackRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "api.parsers.ORJSONParser",
+        "api.parsers.MessagePackParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
 }
 
 SIMPLE_JWT = {
@@ -128,11 +163,72 @@ SIMPLE_JWT = {
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Миниатюры изображений товаров (items/renditions.py)
+SKU_IMAGE_RENDITION_SIZES = (64, 256)
+SKU_IMAGE_RENDITION_QUALITY = 85
+
 STATIC_URL = "/static/"
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
 
-CHECK_DATA_SCIENTIST = "http://ds:8001/health"
-DATA_SCIENTIST_PACK = "http://ds:8001/pack"
+DATA_SCIENTIST_PACK = os.getenv(
+    "DATA_SCIENTIST_PACK", default="http://ds:8001/pack"
+)
+
+# Клиент DS (api/ds_client.py)
+DS_CONNECT_TIMEOUT = float(os.getenv("DS_CONNECT_TIMEOUT", default=1.0))
+DS_READ_TIMEOUT = float(os.getenv("DS_READ_TIMEOUT", default=5.0))
+DS_CIRCUIT_FAILURE_THRESHOLD = 5
+DS_CIRCUIT_RESET_TIMEOUT = 30.0
+
+# Отложенный расчёт рекомендуемой упаковки (api/recommendations.py)
+RECOMMENDATION_WORKERS = int(os.getenv("RECOMMENDATION_WORKERS", default=4))
+RECOMMENDATION_MAX_ATTEMPTS = 3
+RECOMMENDATION_RETRY_DELAY = 0.5
+# "ds" — DS с локальным расчётом при сбое, "local" — только локальный расчёт
+RECOMMENDATION_ENGINE = os.getenv("RECOMMENDATION_ENGINE", default="ds")
+# Режим ASGI (config/asgi.py): заказ создаётся async-представлением,
+# которое ждёт ответ DS не дольше RECOMMENDATION_INLINE_TIMEOUT секунд
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", default="False") == "True"
+RECOMMENDATION_INLINE_TIMEOUT = float(
+    os.getenv("RECOMMENDATION_INLINE_TIMEOUT", default=0.5)
+)
+# Кэш рекомендаций по составу заказа, записи живут не дольше TTL секунд.
+# Записи хранятся в памяти процесса, версии для инвалидации — в кэше
+# Django.
+RECOMMENDATION_CACHE_SIZE = 10000
+RECOMMENDATION_CACHE_TTL = 600
+
+# Общий кэш воркеров: REDIS_URL="redis://redis:6379/0". В нём лежат
+# пользователи для аутентификации, подготовленные заказы столов,
+# закрепления за основной базой и версии кэша рекомендаций. Без
+# REDIS_URL кэш живёт в памяти процесса и gunicorn запускается только
+# с одним воркером (см. gunicorn.conf.py).
+REDIS_URL = os.getenv("REDIS_URL", default="")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+
+# Подготовка следующего заказа стола (api/prefetch.py) в кэше Django
+ORDER_PREFETCH = os.getenv("ORDER_PREFETCH", default="True") == "True"
+ORDER_PREFETCH_WORKERS = 2
+# Слот простаивающего стола истекает через столько секунд
+ORDER_PREFETCH_TTL = int(os.getenv("ORDER_PREFETCH_TTL", default=60))
+
+# Собранные заказы старше стольких дней переносит в архив archive_orders
+ORDER_ARCHIVE_AFTER_DAYS = int(
+    os.getenv("ORDER_ARCHIVE_AFTER_DAYS", default=30)
+)
+
+# Кэш пользователей для аутентификации по JWT (см. api/authentication.py)
+AUTH_USER_CACHE_TTL = int(os.getenv("AUTH_USER_CACHE_TTL", default=30))
+
+# Локальный расчёт упаковки (api/packing.py)
+PACKING_FILL_RATIO = 0.85
+PACKING_CATALOG_TTL = 300
 
 CSRF_TRUSTED_ORIGINS = ["http://*.127.0.0.1", "http://*.backend",
                         "http://backend", "http://*.localhost",
@@ -3,6 +3,8 @@ from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from api.views import MetricsAPIView
+
 
 admin.site.site_header = "Yandex market"
 admin.site.index_title = "Админ панель"
@@ -10,6 +12,7 @@ admin.site.index_title = "Админ панель"
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("api.urls")),
+    path("metrics", MetricsAPIView.as_view(), name="metrics"),
 ]
 
 if settings.DEBUG:
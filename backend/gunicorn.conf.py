@@ -0,0 +1,30 @@
+"""Настройки gunicorn, файл читается из рабочего каталога при запуске.
+
+Воркеры пишут метрики Prometheus в общий каталог (см. api/metrics.py).
+Каталог очищается при старте, файлы завершившихся воркеров помечаются
+для gauge-метрик. Больше одного воркера — только с общим кэшем
+(REDIS_URL, см. config/settings.py).
+"""
+import os
+import shutil
+
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus")
+
+workers = int(os.getenv("GUNICORN_WORKERS", default=1))
+
+# Без общего кэша (REDIS_URL) инвалидация кэша Django и подготовленные
+# заказы видны только своему воркеру.
+if workers > 1 and not os.getenv("REDIS_URL"):
+    raise RuntimeError("GUNICORN_WORKERS > 1 requires REDIS_URL")
+
+
+def on_starting(server):
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models import F
 
 from .models import (
     CargoType,
@@ -6,20 +7,51 @@ from .models import (
     Cell,
     CellOrderSku,
     Order,
+    OrderArchive,
     OrderSku,
     Sku,
+    TableOrderQueue,
 )
 
 
+def bump_versions(orderkeys):
+    Order.objects.filter(pk__in=orderkeys).update(version=F("version") + 1)
+
+
+class OrderPartAdmin(admin.ModelAdmin):
+    """Админка строк заказа: правка и удаление увеличивают версию
+    заказа, чтобы ETag его деталей и слот подготовки устарели."""
+
+    def orders_changed(self, orderkeys):
+        bump_versions(orderkeys)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        orderkeys = {obj.order_id}
+        if change and "order" in form.changed_data:
+            orderkeys.add(form.initial["order"])
+        self.orders_changed(orderkeys)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.orders_changed([obj.order_id])
+
+    def delete_queryset(self, request, queryset):
+        orderkeys = set(queryset.values_list("order_id", flat=True))
+        super().delete_queryset(request, queryset)
+        self.orders_changed(orderkeys)
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = (
         "orderkey",
         "status",
+        "recommendation_status",
         "created_at",
         "display_selected_cartontypes",
     )
-    list_filter = ("status", "created_at")
+    list_filter = ("status", "recommendation_status", "created_at")
     search_fields = ("orderkey", "status")
     readonly_fields = (
         "orderkey",
@@ -33,6 +65,13 @@ class OrderAdmin(admin.ModelAdmin):
 
     display_selected_cartontypes.short_description = "Selected Carton Types"
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if change:
+            bump_versions([form.instance.pk])
+        if change and "status" in form.changed_data:
+            TableOrderQueue.objects.rebuild([form.instance.pk])
+
 
 @admin.register(Sku)
 class SkuAdmin(admin.ModelAdmin):
@@ -54,7 +93,7 @@ class CartonTypeAdmin(admin.ModelAdmin):
 
 
 @admin.register(OrderSku)
-class OrderSkuAdmin(admin.ModelAdmin):
+class OrderSkuAdmin(OrderPartAdmin):
     list_display = ("order", "sku", "amount")
     list_filter = ("order", "sku")
     search_fields = ("order__orderkey", "sku__sku")
@@ -62,13 +101,63 @@ class OrderSkuAdmin(admin.ModelAdmin):
 
 @admin.register(Cell)
 class CellAdmin(admin.ModelAdmin):
+    """Перенос ячейки на другой стол и её удаление перестраивают
+    очереди столов для заказов, лежащих в ячейке."""
+
     list_display = ("barcode", "name", "table")
     list_filter = ("table",)
     search_fields = ("barcode", "name")
 
+    @staticmethod
+    def cell_orders(cells):
+        return set(
+            CellOrderSku.objects.filter(cell__in=cells).values_list(
+                "order_id", flat=True
+            )
+        )
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and "table" in form.changed_data:
+            TableOrderQueue.objects.rebuild(self.cell_orders([obj]))
+
+    def delete_model(self, request, obj):
+        orderkeys = self.cell_orders([obj])
+        super().delete_model(request, obj)
+        TableOrderQueue.objects.rebuild(orderkeys)
+
+    def delete_queryset(self, request, queryset):
+        orderkeys = self.cell_orders(queryset)
+        super().delete_queryset(request, queryset)
+        TableOrderQueue.objects.rebuild(orderkeys)
+
 
 @admin.register(CellOrderSku)
-class CellOrderSkuAdmin(admin.ModelAdmin):
+class CellOrderSkuAdmin(OrderPartAdmin):
     list_display = ("cell", "sku", "order", "quantity")
     list_filter = ("cell", "sku", "order")
     search_fields = ("cell__barcode", "sku__sku", "order__orderkey")
+
+    def orders_changed(self, orderkeys):
+        super().orders_changed(orderkeys)
+        TableOrderQueue.objects.rebuild(orderkeys)
+
+
+@admin.register(TableOrderQueue)
+class TableOrderQueueAdmin(admin.ModelAdmin):
+    list_display = ("table", "order", "order_created_at")
+    list_filter = ("table",)
+    search_fields = ("order__orderkey",)
+
+
+@admin.register(OrderArchive)
+class OrderArchiveAdmin(admin.ModelAdmin):
+    list_display = ("orderkey", "status", "created_at", "archived_at")
+    list_filter = ("archived_at",)
+    search_fields = ("orderkey",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -5,3 +5,6 @@ class ItemsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "items"
     verbose_name = "Товары"
+
+    def ready(self):
+        from . import signals  # noqa: F401
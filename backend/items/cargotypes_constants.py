@@ -1,50 +1,66 @@
 """Дополнительная упаковка для карготипов."""
 
-PACKET = (910, 100, 955)
+PACKET = frozenset((910, 100, 955))
 
-BUBBLE_WRAP = (
-    900,
-    50,
-    200,
-    500,
-    470,
-    450,
-    950,
-    230,
-    440,
-    485,
-    310,
-    480,
-    80,
-    520,
-    400,
-    140,
-    130,
-    410,
-    210,
-    81,
-    441,
-    692,
-    901,
-    640,
-    1300,
-    1200,
+BUBBLE_WRAP = frozenset(
+    (
+        900,
+        50,
+        200,
+        500,
+        470,
+        450,
+        950,
+        230,
+        440,
+        485,
+        310,
+        480,
+        80,
+        520,
+        400,
+        140,
+        130,
+        410,
+        210,
+        81,
+        441,
+        692,
+        901,
+        640,
+        1300,
+        1200,
+    )
 )
 
-STRETCH = (
-    520,
-    300,
-    140,
-    160,
-    130,
-    302,
-    340,
-    290,
-    291,
-    292,
-    641,
-    692,
-    670,
-    640,
-    360,
+STRETCH = frozenset(
+    (
+        520,
+        300,
+        140,
+        160,
+        130,
+        302,
+        340,
+        290,
+        291,
+        292,
+        641,
+        692,
+        670,
+        640,
+        360,
+    )
+)
+
+# Биты Sku.packaging_hints
+PACKET_HINT = 1
+BUBBLE_WRAP_HINT = 2
+STRETCH_HINT = 4
+
+# (бит, подсказка упаковщику, карготипы)
+PACKAGING_HINTS = (
+    (PACKET_HINT, "packet", PACKET),
+    (BUBBLE_WRAP_HINT, "bubble_wrap", BUBBLE_WRAP),
+    (STRETCH_HINT, "stretch", STRETCH),
 )
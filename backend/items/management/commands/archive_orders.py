@@ -0,0 +1,54 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from items.models import OrderArchive
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит собранные заказы старше ORDER_ARCHIVE_AFTER_DAYS дней "
+        "в архив пачками; прерванный перенос продолжается повторным "
+        "запуском."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days",
+            type=int,
+            default=settings.ORDER_ARCHIVE_AFTER_DAYS,
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--max-batches",
+            type=int,
+            default=None,
+            help="Остановиться после стольких пачек",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.0,
+            help="Пауза между пачками в секундах, чтобы реплики успевали",
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options["older_than_days"])
+        archived = 0
+        batches = 0
+        while options["max_batches"] is None or (
+            batches < options["max_batches"]
+        ):
+            count = OrderArchive.objects.archive_batch(
+                before, batch_size=options["batch_size"]
+            )
+            if not count:
+                break
+            archived += count
+            batches += 1
+            if options["pause"]:
+                time.sleep(options["pause"])
+        self.stdout.write(f"Archived {archived} orders in {batches} batches")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from items.models import Sku
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает Sku.packaging_hints по карготипам товаров."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        sku_ids = Sku.objects.values_list("pk", flat=True).order_by("pk")
+        batch = []
+        processed = 0
+        for sku_id in sku_ids.iterator(chunk_size=options["batch_size"]):
+            batch.append(sku_id)
+            if len(batch) == options["batch_size"]:
+                Sku.refresh_packaging_hints(batch)
+                processed += len(batch)
+                batch = []
+        if batch:
+            Sku.refresh_packaging_hints(batch)
+            processed += len(batch)
+        self.stdout.write(f"Processed {processed} SKUs")
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from items.models import Sku
+from items.renditions import generate_renditions
+
+
+class Command(BaseCommand):
+    help = "Создаёт миниатюры для уже загруженных изображений товаров."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Проверить и товары, у которых хэш уже заполнен.",
+        )
+
+    def handle(self, *args, **options):
+        skus = (
+            Sku.objects.exclude(image="")
+            .exclude(image=None)
+            .only("sku", "image", "image_hash")
+        )
+        if not options["all"]:
+            skus = skus.filter(image_hash="")
+        processed = 0
+        for sku in skus.iterator():
+            try:
+                image_hash = generate_renditions(sku.image)
+            except OSError as exc:
+                self.stderr.write(f"{sku.pk}: {exc}")
+                continue
+            if image_hash != sku.image_hash:
+                Sku.objects.filter(pk=sku.pk).update(image_hash=image_hash)
+            processed += 1
+        self.stdout.write(f"Processed {processed} images")
@@ -0,0 +1,368 @@
+import csv
+import io
+import json
+import re
+import sys
+import time
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from items.models import CargoType, CartonType, Sku
+from items.signals import catalog_imported
+
+# Справочник: модель, ключ для upsert и загружаемые поля.
+CATALOGS = {
+    "cargotype": (CargoType, "cargotype", ("description",)),
+    "cartontype": (
+        CartonType,
+        "barcode",
+        ("cartontype", "length", "width", "height"),
+    ),
+    "sku": (
+        Sku,
+        "sku",
+        ("name", "length", "width", "height", "goods_wght", "quantity"),
+    ),
+}
+# Поля, которые пишутся только при вставке новой записи: остаток товара
+# ведёт склад, повторная загрузка справочника его не перезаписывает.
+INSERT_ONLY = {"sku": ("quantity",)}
+
+
+def read_csv(file):
+    reader = csv.DictReader(file)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def read_jsonl(file):
+    for lineno, line in enumerate(file, start=1):
+        if line.strip():
+            try:
+                yield lineno, json.loads(line)
+            except ValueError as exc:
+                raise CommandError(f"Line {lineno}: {exc}")
+
+
+def chunked(records, size):
+    records = iter(records)
+    while chunk := list(islice(records, size)):
+        yield chunk
+
+
+def copy_value(value):
+    """Значение в текстовом формате COPY."""
+    if value is None:
+        return "\\N"
+    if not isinstance(value, str):
+        return str(value)
+    return (
+        value.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class CatalogImporter:
+    """Upsert пачки записей справочника.
+    На PostgreSQL пачка загружается COPY во временную таблицу и
+    переносится одним INSERT ... ON CONFLICT, на других СУБД —
+    bulk_create(update_conflicts=True). Для товаров из колонки
+    cargotypes пересчитываются packaging_hints и связи с карготипами.
+    Поля insert_only у существующих записей не обновляются."""
+
+    def __init__(self, model, key, columns, use_copy, insert_only=()):
+        self.model = model
+        self.key = model._meta.get_field(key)
+        self.link_cargotypes = model is Sku and "cargotypes" in columns
+        self.columns = [
+            model._meta.get_field(name)
+            for name in columns
+            if name != "cargotypes"
+        ]
+        self.use_copy = use_copy
+        self.update_fields = [
+            field.name
+            for field in self.columns
+            if field.name not in insert_only
+        ]
+        if self.link_cargotypes:
+            self.cargotype_ids = dict(
+                CargoType.objects.values_list("cargotype", "pk")
+            )
+            self.update_fields.append("packaging_hints")
+        self.insert_fields = [
+            field
+            for field in model._meta.concrete_fields
+            if field is not model._meta.auto_field
+        ]
+
+        # Для COPY значения незагружаемых полей одинаковы во всех
+        # строках: это значения по умолчанию, как при bulk_create.
+        template = model()
+        self.copy_defaults = [
+            copy_value(
+                field.get_db_prep_save(
+                    field.pre_save(template, add=True), connection
+                )
+            )
+            for field in self.insert_fields
+        ]
+
+    def import_chunk(self, records):
+        rows, links = self.build(records)
+        with transaction.atomic(), connection.cursor() as cursor:
+            if self.use_copy:
+                self.copy_upsert(cursor, rows)
+            else:
+                self.bulk_upsert(rows)
+            if self.link_cargotypes:
+                self.update_links(cursor, links)
+        # COPY и bulk_create не посылают post_save: кэши сбрасываются
+        # по этому сигналу.
+        catalog_imported.send(
+            sender=self.model,
+            keys=[values[self.key.attname] for values in rows],
+        )
+        return len(rows)
+
+    def build(self, records):
+        """Значения полей по attname без дублей ключа (побеждает
+        последняя запись) и коды карготипов товаров."""
+
+        rows = {}
+        links = {}
+        for lineno, record in records:
+            values = {}
+            for field in (self.key, *self.columns):
+                try:
+                    values[field.attname] = field.to_python(record[field.name])
+                except KeyError:
+                    raise CommandError(
+                        f"Line {lineno}: missing column {field.name!r}"
+                    )
+                except ValidationError as exc:
+                    raise CommandError(
+                        f"Line {lineno}: {field.name}: "
+                        + "; ".join(exc.messages)
+                    )
+            key = values[self.key.attname]
+            if self.link_cargotypes:
+                codes = self.parse_cargotypes(lineno, record.get("cargotypes"))
+                values["packaging_hints"] = Sku.hints_for_cargotypes(codes)
+                links[key] = codes
+            rows[key] = values
+        return list(rows.values()), links
+
+    def parse_cargotypes(self, lineno, value):
+        if value is None:
+            value = []
+        elif isinstance(value, str):
+            value = [code for code in re.split(r"[\s,;]+", value) if code]
+        try:
+            codes = {int(code) for code in value}
+        except (TypeError, ValueError):
+            raise CommandError(f"Line {lineno}: invalid cargotypes {value!r}")
+        unknown = codes - self.cargotype_ids.keys()
+        if unknown:
+            raise CommandError(
+                f"Line {lineno}: unknown cargotypes {sorted(unknown)}"
+            )
+        return codes
+
+    def bulk_upsert(self, rows):
+        self.model.objects.bulk_create(
+            [self.model(**values) for values in rows],
+            update_conflicts=True,
+            unique_fields=[self.key.name],
+            update_fields=self.update_fields,
+        )
+
+    def copy_upsert(self, cursor, rows):
+        """Значения после to_python пишутся в COPY как есть, без
+        get_db_prep_save: для полей справочников это то же самое."""
+
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        staging = quote(f"{self.model._meta.db_table}_import")
+        columns = ", ".join(
+            quote(field.column) for field in self.insert_fields
+        )
+        fields = list(
+            zip(
+                (field.attname for field in self.insert_fields),
+                self.copy_defaults,
+            )
+        )
+        buffer = io.StringIO()
+        for values in rows:
+            buffer.write(
+                "\t".join(
+                    copy_value(values[attname])
+                    if attname in values
+                    else default
+                    for attname, default in fields
+                )
+            )
+            buffer.write("\n")
+        buffer.seek(0)
+
+        updates = ", ".join(
+            f"{quote(field.column)} = EXCLUDED.{quote(field.column)}"
+            for field in self.insert_fields
+            if field.name in self.update_fields
+        )
+
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging} "
+            f"AS SELECT {columns} FROM {table} WITH NO DATA"
+        )
+        cursor.execute(f"TRUNCATE {staging}")
+        cursor.copy_expert(f"COPY {staging} ({columns}) FROM STDIN", buffer)
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) "
+            f"SELECT {columns} FROM {staging} "
+            f"ON CONFLICT ({quote(self.key.column)}) DO UPDATE SET {updates}"
+        )
+
+    def update_links(self, cursor, links):
+        """Приводит связи товаров с карготипами к загруженным: удаляет
+        лишние и добавляет недостающие строки промежуточной таблицы."""
+
+        through = Sku.cargotypes.through
+        quote = connection.ops.quote_name
+        wanted = {
+            (sku_id, self.cargotype_ids[code])
+            for sku_id, codes in links.items()
+            for code in codes
+        }
+        if self.use_copy:
+            # Товары пачки уже лежат во временной таблице.
+            cursor.execute(
+                f"SELECT link.id, link.sku_id, link.cargotype_id "
+                f"FROM {quote(through._meta.db_table)} link "
+                f"JOIN {quote(self.model._meta.db_table + '_import')} batch "
+                f"ON batch.{quote(self.key.column)} = link.sku_id"
+            )
+            current = cursor.fetchall()
+        else:
+            current = through.objects.filter(
+                sku_id__in=list(links)
+            ).values_list("pk", "sku_id", "cargotype_id")
+        stale = []
+        for pk, sku_id, cargotype_id in current:
+            if (sku_id, cargotype_id) in wanted:
+                wanted.discard((sku_id, cargotype_id))
+            else:
+                stale.append(pk)
+        if stale:
+            through.objects.filter(pk__in=stale).delete()
+        if not wanted:
+            return
+        if not self.use_copy:
+            through.objects.bulk_create(
+                through(sku_id=sku_id, cargotype_id=cargotype_id)
+                for sku_id, cargotype_id in wanted
+            )
+            return
+        buffer = io.StringIO(
+            "".join(
+                f"{sku_id}\t{cargotype_id}\n"
+                for sku_id, cargotype_id in wanted
+            )
+        )
+        cursor.copy_expert(
+            f"COPY {quote(through._meta.db_table)} "
+            f"(sku_id, cargotype_id) FROM STDIN",
+            buffer,
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        "Загружает справочник товаров, упаковок или карготипов из CSV "
+        "или JSONL и обновляет существующие записи по ключу. Файл "
+        "читается потоком и пишется пачками, каждая в своей транзакции. "
+        "Остатки существующих товаров не меняются без --update-stock. "
+        "Кэши рекомендаций в других процессах обновятся по TTL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("catalog", choices=sorted(CATALOGS))
+        parser.add_argument(
+            "path", help="Файл .csv или .jsonl; «-» — стандартный ввод."
+        )
+        parser.add_argument("--format", choices=("csv", "jsonl"))
+        parser.add_argument("--batch-size", type=int, default=10000)
+        parser.add_argument(
+            "--no-copy",
+            action="store_true",
+            help="Не использовать COPY даже на PostgreSQL.",
+        )
+        parser.add_argument(
+            "--update-stock",
+            action="store_true",
+            help="Перезаписать остатки (quantity) существующих товаров.",
+        )
+
+    def handle(self, *args, **options):
+        model, key, columns = CATALOGS[options["catalog"]]
+        path = options["path"]
+        file_format = options["format"] or (
+            "jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv"
+        )
+        use_copy = connection.vendor == "postgresql" and not options["no_copy"]
+
+        if path == "-":
+            file = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
+        else:
+            file = open(path, encoding="utf-8", newline="")
+        with file:
+            records = (read_csv if file_format == "csv" else read_jsonl)(file)
+            first = next(records, None)
+            if first is None:
+                self.stdout.write("Nothing to import")
+                return
+            missing = [
+                name for name in (key, *columns) if name not in first[1]
+            ]
+            if missing:
+                raise CommandError(f"Missing columns: {', '.join(missing)}")
+            if model is Sku and "cargotypes" in first[1]:
+                columns = (*columns, "cargotypes")
+            importer = CatalogImporter(
+                model,
+                key,
+                columns,
+                use_copy,
+                insert_only=()
+                if options["update_stock"]
+                else INSERT_ONLY.get(options["catalog"], ()),
+            )
+
+            started = time.perf_counter()
+            total = 0
+            for chunk in chunked(
+                self._prepend(first, records), options["batch_size"]
+            ):
+                total += importer.import_chunk(chunk)
+                if options["verbosity"] > 0:
+                    self.stdout.write(self._progress(total, started))
+        self.stdout.write(
+            self.style.SUCCESS(f"Imported {self._progress(total, started)}")
+        )
+
+    @staticmethod
+    def _prepend(first, records):
+        yield first
+        yield from records
+
+    @staticmethod
+    def _progress(total, started):
+        elapsed = time.perf_counter() - started
+        rate = total / elapsed if elapsed else 0.0
+        return f"{total} rows in {elapsed:.1f} s ({rate:.0f} rows/s)"
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0002_initial'),
+    ]
+
+    operations = [
+        # Существующие заказы уже получили рекомендацию синхронно.
+        migrations.AddField(
+            model_name='order',
+            name='recommendation_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', max_length=20, verbose_name='Статус расчёта рекомендуемой упаковки'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='recommendation_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='Статус расчёта рекомендуемой упаковки'),
+        ),
+    ]
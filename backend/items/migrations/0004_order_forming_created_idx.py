@@ -0,0 +1,17 @@
+# Generated by Django 4.2.1 on 2026-10-18 16:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0003_order_recommendation_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'forming')), fields=['created_at'], name='order_forming_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 16:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0004_order_forming_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sku',
+            name='image_hash',
+            field=models.CharField(blank=True, editable=False, max_length=32, verbose_name='Хэш изображения'),
+        ),
+    ]
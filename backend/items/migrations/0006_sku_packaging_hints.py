@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 16:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0005_sku_image_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sku',
+            name='packaging_hints',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text='Битовая маска, см. cargotypes_constants.PACKAGING_HINTS', verbose_name='Подсказки по упаковке'),
+        ),
+    ]
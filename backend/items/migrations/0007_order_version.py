@@ -0,0 +1,22 @@
+# Generated by Django 4.2.1 on 2026-10-18 17:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("items", "0006_sku_packaging_hints"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="version",
+            field=models.PositiveIntegerField(
+                default=1,
+                editable=False,
+                help_text="Увеличивается при каждом изменении заказа, используется в ETag деталей заказа.",
+                verbose_name="Версия",
+            ),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.1 on 2026-10-18 17:14
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+import django.db.models.deletion
+
+
+def merge_duplicate_order_skus(apps, schema_editor):
+    """Сводит повторяющиеся позиции заказа в одну с суммарным
+    количеством перед созданием unique_order_sku."""
+
+    OrderSku = apps.get_model("items", "OrderSku")
+    duplicates = (
+        OrderSku.objects.values("order_id", "sku_id")
+        .annotate(rows=Count("id"), amount=Sum("amount"), keep=Min("id"))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates:
+        rows = OrderSku.objects.filter(
+            order_id=duplicate["order_id"], sku_id=duplicate["sku_id"]
+        )
+        rows.filter(id=duplicate["keep"]).update(amount=duplicate["amount"])
+        rows.exclude(id=duplicate["keep"]).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("items", "0007_order_version"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_order_skus, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name="ordersku",
+            constraint=models.UniqueConstraint(
+                fields=("order", "sku"), name="unique_order_sku"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cellordersku",
+            index=models.Index(
+                fields=["order", "cell"], name="cellordersku_order_cell_idx"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="cellordersku",
+            name="order",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="cellorder_skus",
+                to="items.order",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="ordersku",
+            name="order",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="order_skus",
+                to="items.order",
+                verbose_name="Заказ",
+            ),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 4.2.1 on 2026-10-18 17:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_queues(apps, schema_editor):
+    """Ставит в очереди столов сформированные заказы, уже разложенные
+    по ячейкам."""
+
+    CellOrderSku = apps.get_model("items", "CellOrderSku")
+    TableOrderQueue = apps.get_model("items", "TableOrderQueue")
+    entries = (
+        CellOrderSku.objects.filter(
+            order__status="forming", cell__table__isnull=False
+        )
+        .values_list("cell__table_id", "order_id", "order__created_at")
+        .distinct()
+    )
+    TableOrderQueue.objects.bulk_create(
+        (
+            TableOrderQueue(
+                table_id=table_id,
+                order_id=order_id,
+                order_created_at=created_at,
+            )
+            for table_id, order_id, created_at in entries.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0003_table_updated_at"),
+        ("items", "0008_hot_path_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TableOrderQueue",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "order_created_at",
+                    models.DateTimeField(verbose_name="Дата создания заказа"),
+                ),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="items.order",
+                        verbose_name="Заказ",
+                    ),
+                ),
+                (
+                    "table",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="users.table",
+                        verbose_name="Стол",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Очередь заказов стола",
+                "verbose_name_plural": "Очереди заказов столов",
+                "indexes": [
+                    models.Index(
+                        fields=["table", "order_created_at", "id"],
+                        name="tableorderqueue_pop_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="tableorderqueue",
+            constraint=models.UniqueConstraint(
+                fields=("table", "order"), name="unique_table_order_queue"
+            ),
+        ),
+        migrations.RunPython(fill_queues, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,257 @@
+# Generated by Django 4.2.1 on 2026-10-18 17:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("items", "0009_table_order_queue"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CellOrderSkuArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("quantity", models.PositiveIntegerField()),
+            ],
+            options={
+                "verbose_name": "Ячейка с товарами из архивного заказа",
+                "verbose_name_plural": "Ячейки с товарами из архивных заказов",
+            },
+        ),
+        migrations.CreateModel(
+            name="OrderArchive",
+            fields=[
+                (
+                    "orderkey",
+                    models.UUIDField(
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID заказа",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("forming", "Being Formed"),
+                            ("collecting", "Being Collected"),
+                            ("collected", "Collected"),
+                        ],
+                        max_length=20,
+                        verbose_name="Статус заказа",
+                    ),
+                ),
+                (
+                    "whs",
+                    models.PositiveSmallIntegerField(
+                        default=0, verbose_name="Код сортировочного центра"
+                    ),
+                ),
+                (
+                    "total_packages",
+                    models.PositiveSmallIntegerField(
+                        blank=True,
+                        null=True,
+                        verbose_name="Количество упаковок в заказе",
+                    ),
+                ),
+                (
+                    "recommendation_status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("ready", "Ready"),
+                            ("failed", "Failed"),
+                        ],
+                        max_length=20,
+                        verbose_name="Статус расчёта рекомендуемой упаковки",
+                    ),
+                ),
+                (
+                    "sel_calc_cube",
+                    models.FloatField(
+                        blank=True,
+                        null=True,
+                        verbose_name="Объем выбранной упаковки",
+                    ),
+                ),
+                (
+                    "pack_volume",
+                    models.FloatField(
+                        blank=True,
+                        null=True,
+                        verbose_name="Рассчитанный объем упакованных товаров",
+                    ),
+                ),
+                (
+                    "tracking_id",
+                    models.UUIDField(
+                        blank=True,
+                        editable=False,
+                        null=True,
+                        verbose_name="ID доставки",
+                    ),
+                ),
+                (
+                    "goods_weight",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Общий вес товаров"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(verbose_name="Дата создания"),
+                ),
+                (
+                    "version",
+                    models.PositiveIntegerField(
+                        editable=False, verbose_name="Версия"
+                    ),
+                ),
+                (
+                    "archived_at",
+                    models.DateTimeField(verbose_name="Дата переноса в архив"),
+                ),
+            ],
+            options={
+                "verbose_name": "Архивный заказ",
+                "verbose_name_plural": "Архив заказов",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="OrderSkuArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "amount",
+                    models.PositiveIntegerField(
+                        verbose_name="Количество товара в заказе"
+                    ),
+                ),
+                (
+                    "packaging_number",
+                    models.PositiveSmallIntegerField(
+                        blank=True,
+                        null=True,
+                        verbose_name="Номер упаковки в которой находится товар",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Товары в архивном заказе",
+                "verbose_name_plural": "Товары в архивных заказах",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                condition=models.Q(("status", "collected")),
+                fields=["created_at"],
+                name="order_collected_created_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="orderskuarchive",
+            name="order",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="order_skus",
+                to="items.orderarchive",
+                verbose_name="Заказ",
+            ),
+        ),
+        migrations.AddField(
+            model_name="orderskuarchive",
+            name="sku",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="items.sku",
+                verbose_name="Товар",
+            ),
+        ),
+        migrations.AddField(
+            model_name="orderarchive",
+            name="recommended_cartontype",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="items.cartontype",
+                verbose_name="Рекомендуемый тип упаковки",
+            ),
+        ),
+        migrations.AddField(
+            model_name="orderarchive",
+            name="selected_cartontypes",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="+",
+                to="items.cartontype",
+                verbose_name="Выбранные типы упаковки",
+            ),
+        ),
+        migrations.AddField(
+            model_name="orderarchive",
+            name="who",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Пользователь",
+            ),
+        ),
+        migrations.AddField(
+            model_name="cellorderskuarchive",
+            name="cell",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="items.cell",
+            ),
+        ),
+        migrations.AddField(
+            model_name="cellorderskuarchive",
+            name="order",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="cellorder_skus",
+                to="items.orderarchive",
+            ),
+        ),
+        migrations.AddField(
+            model_name="cellorderskuarchive",
+            name="sku",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="items.sku",
+            ),
+        ),
+    ]
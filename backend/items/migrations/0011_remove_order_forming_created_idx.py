@@ -0,0 +1,16 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:16
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("items", "0010_order_archive"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="order",
+            name="order_forming_created_idx",
+        ),
+    ]
@@ -1,15 +1,123 @@
 import uuid
+from collections import defaultdict
 
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import F, Prefetch, Q, Sum
+from django.utils import timezone
 
-from .cargotypes_constants import BUBBLE_WRAP, PACKET, STRETCH
+from .cargotypes_constants import PACKAGING_HINTS
 from users.models import Table
 
 User = get_user_model()
 
 
+class InvalidTransition(Exception):
+    """Заказ в статусе, из которого переход невозможен."""
+
+    def __init__(self, orderkey, current, target):
+        self.current = current
+        self.target = target
+        super().__init__(
+            f"Order {orderkey} is {current!r}, cannot become {target!r}"
+        )
+
+
+class OrderQuerySet(models.QuerySet):
+    def with_details(self):
+        """Всё для GetOrderSerializer за постоянное число запросов."""
+        return self.select_related("recommended_cartontype").prefetch_related(
+            Prefetch(
+                "order_skus",
+                queryset=OrderSku.objects.select_related("sku").order_by(
+                    "sku"
+                ),
+            )
+        )
+
+    def transition(self, orderkey, status, **fields):
+        """Переводит заказ в статус status одним условным UPDATE по
+        таблице Order.TRANSITIONS, вместе со статусом записывает fields;
+        заказ, покинувший статус forming, убирается из очередей столов.
+        Если заказа нет, бросает Order.DoesNotExist, если переход из
+        текущего статуса запрещён — InvalidTransition."""
+
+        allowed = self.model.TRANSITIONS[status]
+        if self.filter(pk=orderkey, status__in=allowed).update(
+            status=status, version=F("version") + 1, **fields
+        ):
+            # В очередях столов ждут только сформированные заказы.
+            if "forming" in allowed:
+                TableOrderQueue.objects.using(self.db).filter(
+                    order_id=orderkey
+                ).delete()
+            return
+        current = self.filter(pk=orderkey).values_list("status", flat=True)
+        current = current.first()
+        if current is None:
+            raise self.model.DoesNotExist(f"Order {orderkey} not found")
+        raise InvalidTransition(orderkey, current, status)
+
+    def transition_many(self, orderkeys, status, batch_size=1000):
+        """Переводит заказы в статус status по тем же правилам, что
+        transition, пачками по batch_size. На пачку одно чтение статусов
+        с блокировкой строк и один UPDATE. Возвращает словарь: ключ
+        заказа -> "ok", "not_found" или "wrong_state"."""
+
+        allowed = self.model.TRANSITIONS[status]
+        orderkeys = list(dict.fromkeys(orderkeys))
+        outcomes = {}
+        for start in range(0, len(orderkeys), batch_size):
+            batch = orderkeys[start : start + batch_size]
+            with transaction.atomic(using=self.db):
+                current = dict(
+                    self.select_for_update()
+                    .filter(pk__in=batch)
+                    .order_by("pk")
+                    .values_list("pk", "status")
+                )
+                eligible = [
+                    orderkey
+                    for orderkey, order_status in current.items()
+                    if order_status in allowed
+                ]
+                if eligible:
+                    self.filter(pk__in=eligible).update(
+                        status=status, version=F("version") + 1
+                    )
+                    if "forming" in allowed:
+                        TableOrderQueue.objects.using(self.db).filter(
+                            order_id__in=eligible
+                        ).delete()
+            for orderkey in batch:
+                if orderkey not in current:
+                    outcomes[orderkey] = "not_found"
+                elif current[orderkey] in allowed:
+                    outcomes[orderkey] = "ok"
+                else:
+                    outcomes[orderkey] = "wrong_state"
+        return outcomes
+
+    def claim_next(self, table_id, user):
+        """Забирает самый старый заказ из очереди стола (TableOrderQueue),
+        переводит его в статус collecting и возвращает его ключ (или
+        None). Запись, чей заказ уже не в статусе forming, снимается с
+        очереди и пропускается."""
+
+        queue = TableOrderQueue.objects.using(self.db)
+        while True:
+            with transaction.atomic(using=self.db):
+                orderkey = queue.pop(table_id)
+                if orderkey is None:
+                    return None
+                try:
+                    self.transition(orderkey, "collecting", who=user)
+                except (InvalidTransition, self.model.DoesNotExist):
+                    continue
+                return orderkey
+
+
 class Order(models.Model):
     """
     Заказ.
@@ -20,6 +128,16 @@ class Order(models.Model):
         ("collecting", "Being Collected"),
         ("collected", "Collected"),
     )
+    # Новый статус -> статусы, из которых в него можно перейти.
+    TRANSITIONS = {
+        "collecting": ("forming",),
+        "collected": ("collecting",),
+    }
+    RECOMMENDATION_STATUS_CHOICES = (
+        ("pending", "Pending"),
+        ("ready", "Ready"),
+        ("failed", "Failed"),
+    )
     orderkey = models.UUIDField(
         default=uuid.uuid4,
         editable=False,
@@ -65,6 +183,12 @@ class Order(models.Model):
         related_name="recommended_orders",
         verbose_name="Рекомендуемый тип упаковки",
     )
+    recommendation_status = models.CharField(
+        max_length=20,
+        choices=RECOMMENDATION_STATUS_CHOICES,
+        default="pending",
+        verbose_name="Статус расчёта рекомендуемой упаковки",
+    )
     sel_calc_cube = models.FloatField(
         null=True, blank=True, verbose_name="Объем выбранной упаковки"
     )
@@ -87,19 +211,34 @@ class Order(models.Model):
         auto_now_add=True,
         verbose_name="Дата создания",
     )
+    version = models.PositiveIntegerField(
+        default=1,
+        editable=False,
+        verbose_name="Версия",
+        help_text="Увеличивается при каждом изменении заказа, "
+        "используется в ETag деталей заказа.",
+    )
+
+    objects = OrderQuerySet.as_manager()
 
     class Meta:
         ordering = ["status"]
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
+        indexes = [
+            models.Index(
+                fields=["created_at"],
+                condition=Q(status="collected"),
+                name="order_collected_created_idx",
+            ),
+        ]
 
     @property
     def total_skus_quantity(self):
         """Возвращает общее количество всех видов sku в заказе"""
-        total = 0
-        for order_sku in self.order_skus.all():
-            total += order_sku.amount
-        return total
+        if "order_skus" in getattr(self, "_prefetched_objects_cache", {}):
+            return sum(order_sku.amount for order_sku in self.order_skus.all())
+        return self.order_skus.aggregate(total=Sum("amount"))["total"] or 0
 
 
 class Sku(models.Model):
@@ -122,7 +261,19 @@ class Sku(models.Model):
         null=True,
         verbose_name="Изображение",
     )
+    image_hash = models.CharField(
+        max_length=32,
+        blank=True,
+        editable=False,
+        verbose_name="Хэш изображения",
+    )
     name = models.CharField(max_length=255, verbose_name="Название товара")
+    packaging_hints = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Подсказки по упаковке",
+        help_text="Битовая маска, см. cargotypes_constants.PACKAGING_HINTS",
+    )
 
     class Meta:
         ordering = ["sku"]
@@ -137,21 +288,43 @@ class Sku(models.Model):
     @property
     def help_text(self):
         """Возвращает подсказку для Sku на основе cargotypes"""
-        cargotypes = self.cargotypes.values_list("cargotype", flat=True)
-
-        cargotype_help_text = []
-
-        if cargotypes:
-            if any(cargotype in cargotypes for cargotype in PACKET):
-                cargotype_help_text.append("packet")
-
-            if any(cargotype in cargotypes for cargotype in BUBBLE_WRAP):
-                cargotype_help_text.append("bubble_wrap")
-
-            if any(cargotype in cargotypes for cargotype in STRETCH):
-                cargotype_help_text.append("stretch")
+        return [
+            hint
+            for flag, hint, _ in PACKAGING_HINTS
+            if self.packaging_hints & flag
+        ]
 
-        return cargotype_help_text
+    @staticmethod
+    def hints_for_cargotypes(cargotypes):
+        """Битовая маска подсказок для набора кодов карготипов."""
+        mask = 0
+        for flag, _, codes in PACKAGING_HINTS:
+            if not codes.isdisjoint(cargotypes):
+                mask |= flag
+        return mask
+
+    @classmethod
+    def refresh_packaging_hints(cls, sku_ids, batch_size=1000):
+        """Пересчитывает packaging_hints товаров пачками: на пачку один
+        запрос на чтение и по UPDATE на каждое значение маски."""
+
+        sku_ids = list(sku_ids)
+        for start in range(0, len(sku_ids), batch_size):
+            batch = sku_ids[start : start + batch_size]
+            cargotypes = defaultdict(set)
+            for sku_id, cargotype in cls.cargotypes.through.objects.filter(
+                sku_id__in=batch
+            ).values_list("sku_id", "cargotype__cargotype"):
+                cargotypes[sku_id].add(cargotype)
+
+            by_mask = defaultdict(list)
+            for sku_id in batch:
+                mask = cls.hints_for_cargotypes(cargotypes[sku_id])
+                by_mask[mask].append(sku_id)
+            for mask, ids in by_mask.items():
+                cls.objects.filter(pk__in=ids).exclude(
+                    packaging_hints=mask
+                ).update(packaging_hints=mask)
 
     def __str__(self):
         return str(self.sku)
@@ -206,11 +379,13 @@ class CartonType(models.Model):
 
 
 class OrderSku(models.Model):
+    # Поиск по заказу обслуживает индекс unique_order_sku.
     order = models.ForeignKey(
         Order,
         on_delete=models.CASCADE,
         related_name="order_skus",
         verbose_name="Заказ",
+        db_index=False,
     )
     sku = models.ForeignKey(
         Sku, on_delete=models.CASCADE, verbose_name="Товар"
@@ -227,6 +402,11 @@ class OrderSku(models.Model):
     class Meta:
         verbose_name = "Товары в заказе"
         verbose_name_plural = "Товары в заказе"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["order", "sku"], name="unique_order_sku"
+            )
+        ]
 
 
 class Cell(models.Model):
@@ -263,17 +443,384 @@ class CellOrderSku(models.Model):
     sku = models.ForeignKey(
         Sku, on_delete=models.CASCADE, related_name="cellorder_skus"
     )
+    # Поиск по заказу обслуживает индекс cellordersku_order_cell_idx.
     order = models.ForeignKey(
-        Order, on_delete=models.CASCADE, related_name="cellorder_skus"
+        Order,
+        on_delete=models.CASCADE,
+        related_name="cellorder_skus",
+        db_index=False,
     )
     quantity = models.PositiveIntegerField()
 
     class Meta:
         verbose_name = "Ячейка с товарами из заказа"
         verbose_name_plural = "Ячейки с товарами из заказа"
+        indexes = [
+            models.Index(
+                fields=["order", "cell"], name="cellordersku_order_cell_idx"
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.order.skus.filter(pk=self.sku.pk).exists():
             raise ValidationError("SKU does not belong to the current order")
 
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Order.objects.filter(pk=self.order_id).update(
+                version=F("version") + 1
+            )
+            if self.cell.table_id is not None:
+                TableOrderQueue.objects.enqueue(
+                    self.cell.table_id, self.order_id
+                )
+
+
+class TableOrderQueueQuerySet(models.QuerySet):
+    def enqueue(self, table_id, orderkey):
+        """Ставит заказ в очередь стола, если он в статусе forming и
+        ещё не стоит в ней. Один INSERT ... SELECT."""
+
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(self.model._meta.db_table)} "
+                f"({quote('table_id')}, {quote('order_id')}, "
+                f"{quote('order_created_at')}) "
+                f"SELECT %s, {quote('orderkey')}, {quote('created_at')} "
+                f"FROM {quote(Order._meta.db_table)} "
+                f"WHERE {quote('orderkey')} = %s AND {quote('status')} = %s "
+                f"ON CONFLICT ({quote('table_id')}, {quote('order_id')}) "
+                f"DO NOTHING",
+                [
+                    table_id,
+                    Order._meta.pk.get_db_prep_value(orderkey, connection),
+                    "forming",
+                ],
+            )
+
+    def rebuild(self, orderkeys):
+        """Приводит очереди к текущему состоянию заказов orderkeys:
+        заказ в статусе forming стоит в очереди каждого стола, в чьих
+        ячейках лежат его товары, и больше нигде. Нужно после правок,
+        которые enqueue и transition не видят: смены статуса в админке,
+        переноса ячейки на другой стол, удаления раскладки."""
+
+        orderkeys = list(set(orderkeys))
+        if not orderkeys:
+            return
+        with transaction.atomic(using=self.db):
+            self.filter(order_id__in=orderkeys).delete()
+            self.bulk_create(
+                self.model(
+                    table_id=table_id,
+                    order_id=orderkey,
+                    order_created_at=created_at,
+                )
+                for table_id, orderkey, created_at in (
+                    CellOrderSku.objects.using(self.db)
+                    .filter(
+                        order_id__in=orderkeys,
+                        order__status="forming",
+                        cell__table__isnull=False,
+                    )
+                    .values_list(
+                        "cell__table_id", "order_id", "order__created_at"
+                    )
+                    .distinct()
+                )
+            )
+
+    def pop(self, table_id):
+        """Снимает с очереди стола самый старый заказ и возвращает его
+        ключ (или None).
+
+        На PostgreSQL это один DELETE ... WHERE id = (SELECT ... FOR
+        UPDATE SKIP LOCKED LIMIT 1) RETURNING по индексу очереди:
+        параллельные упаковщики не ждут друг друга и не получают одну
+        и ту же запись. На базах без SKIP LOCKED запись удаляется
+        условным DELETE с повтором.
+        """
+        head = self.filter(table_id=table_id).order_by(
+            "order_created_at", "id"
+        )
+        connection = connections[self.db]
+        if not connection.features.has_select_for_update_skip_locked:
+            while True:
+                entry = head.values_list("pk", "order_id").first()
+                if entry is None:
+                    return None
+                if self.filter(pk=entry[0]).delete()[0]:
+                    return entry[1]
+
+        subquery, params = (
+            head.select_for_update(skip_locked=True)
+            .values("pk")[:1]
+            .query.get_compiler(using=self.db)
+            .as_sql()
+        )
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {quote(self.model._meta.db_table)} "
+                f"WHERE {quote('id')} = ({subquery}) "
+                f"RETURNING {quote('order_id')}",
+                params,
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+
+class TableOrderQueue(models.Model):
+    """Очередь сформированных заказов стола.
+    Заказ попадает в очередь стола при раскладке по его ячейке и
+    покидает все очереди, когда упаковщик его забирает (см.
+    OrderQuerySet.transition), поэтому поиск следующего заказа не
+    зависит от числа исторических заказов. Правки в обход этих путей
+    (админка, перенос ячейки на другой стол) исправляет rebuild. Запись,
+    оставшуюся после гонки раскладки и сборки, отбрасывает claim_next."""
+
+    # Поиск по столу обслуживает индекс tableorderqueue_pop_idx.
+    table = models.ForeignKey(
+        Table, on_delete=models.CASCADE, verbose_name="Стол", db_index=False
+    )
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, verbose_name="Заказ"
+    )
+    order_created_at = models.DateTimeField(
+        verbose_name="Дата создания заказа"
+    )
+
+    objects = TableOrderQueueQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Очередь заказов стола"
+        verbose_name_plural = "Очереди заказов столов"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["table", "order"], name="unique_table_order_queue"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["table", "order_created_at", "id"],
+                name="tableorderqueue_pop_idx",
+            ),
+        ]
+
+
+def _copy_rows(connection, target, source, columns, key, keys, extra=()):
+    """INSERT INTO target (...) SELECT ... FROM source WHERE key IN keys.
+    columns — пары (столбец target, столбец source), extra — пары
+    (столбец target, значение), одинаковое для всех строк."""
+
+    quote = connection.ops.quote_name
+    target_columns = [quote(column) for column, _ in (*columns, *extra)]
+    source_columns = [quote(column) for _, column in columns]
+    source_columns += ["%s"] * len(extra)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(target)} ({', '.join(target_columns)}) "
+            f"SELECT {', '.join(source_columns)} FROM {quote(source)} "
+            f"WHERE {quote(key)} IN ({', '.join(['%s'] * len(keys))})",
+            [value for _, value in extra] + list(keys),
+        )
+
+
+class OrderArchiveQuerySet(models.QuerySet):
+    def with_details(self):
+        """Всё для GetOrderSerializer, как Order.objects.with_details()."""
+        return self.select_related("recommended_cartontype").prefetch_related(
+            Prefetch(
+                "order_skus",
+                queryset=OrderSkuArchive.objects.select_related(
+                    "sku"
+                ).order_by("sku"),
+            )
+        )
+
+    def archive_batch(self, before, batch_size=1000):
+        """Переносит в архив до batch_size заказов в статусе collected,
+        созданных раньше before, вместе с позициями, раскладкой по
+        ячейкам и выбранными упаковками, и возвращает их число.
+
+        Пачка переносится в одной транзакции: INSERT ... SELECT в
+        архивные таблицы и удаление из рабочих. Прерванный перенос
+        продолжается следующим вызовом. Заказы, заблокированные другими
+        транзакциями, пропускаются до следующего вызова."""
+
+        connection = connections[self.db]
+        with transaction.atomic(using=self.db):
+            keys = list(
+                Order.objects.using(self.db)
+                .select_for_update(skip_locked=True)
+                .filter(status="collected", created_at__lt=before)
+                .order_by("created_at")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not keys:
+                return 0
+            keys = [
+                Order._meta.pk.get_db_prep_value(key, connection)
+                for key in keys
+            ]
+            archived_at = self.model._meta.get_field(
+                "archived_at"
+            ).get_db_prep_value(timezone.now(), connection)
+            _copy_rows(
+                connection,
+                self.model._meta.db_table,
+                Order._meta.db_table,
+                [(field.column,) * 2 for field in Order._meta.concrete_fields],
+                Order._meta.pk.column,
+                keys,
+                extra=[("archived_at", archived_at)],
+            )
+            for target, source in (
+                (OrderSkuArchive, OrderSku),
+                (CellOrderSkuArchive, CellOrderSku),
+            ):
+                _copy_rows(
+                    connection,
+                    target._meta.db_table,
+                    source._meta.db_table,
+                    [
+                        (field.column,) * 2
+                        for field in source._meta.concrete_fields
+                        if not field.primary_key
+                    ],
+                    "order_id",
+                    keys,
+                )
+            target = self.model._meta.get_field("selected_cartontypes")
+            source = Order._meta.get_field("selected_cartontypes")
+            _copy_rows(
+                connection,
+                target.m2m_db_table(),
+                source.m2m_db_table(),
+                [
+                    (target.m2m_column_name(), source.m2m_column_name()),
+                    (target.m2m_reverse_name(), source.m2m_reverse_name()),
+                ],
+                source.m2m_column_name(),
+                keys,
+            )
+            Order.objects.using(self.db).filter(pk__in=keys).delete()
+        return len(keys)
+
+
+class OrderArchive(models.Model):
+    """Собранный заказ, перенесённый из Order командой archive_orders.
+    Поля и их столбцы совпадают с Order, детали архивного заказа
+    отдаёт тот же API."""
+
+    orderkey = models.UUIDField(
+        primary_key=True, editable=False, verbose_name="ID заказа"
+    )
+    who = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="+",
+        blank=True,
+        null=True,
+        verbose_name="Пользователь",
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=Order.STATUS_CHOICES,
+        verbose_name="Статус заказа",
+    )
+    whs = models.PositiveSmallIntegerField(
+        default=0, verbose_name="Код сортировочного центра"
+    )
+    total_packages = models.PositiveSmallIntegerField(
+        blank=True, null=True, verbose_name="Количество упаковок в заказе"
+    )
+    selected_cartontypes = models.ManyToManyField(
+        "CartonType",
+        blank=True,
+        related_name="+",
+        verbose_name="Выбранные типы упаковки",
+    )
+    recommended_cartontype = models.ForeignKey(
+        "CartonType",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        verbose_name="Рекомендуемый тип упаковки",
+    )
+    recommendation_status = models.CharField(
+        max_length=20,
+        choices=Order.RECOMMENDATION_STATUS_CHOICES,
+        verbose_name="Статус расчёта рекомендуемой упаковки",
+    )
+    sel_calc_cube = models.FloatField(
+        null=True, blank=True, verbose_name="Объем выбранной упаковки"
+    )
+    pack_volume = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name="Рассчитанный объем упакованных товаров",
+    )
+    tracking_id = models.UUIDField(
+        editable=False,
+        null=True,
+        blank=True,
+        verbose_name="ID доставки",
+    )
+    goods_weight = models.FloatField(
+        blank=True, null=True, verbose_name="Общий вес товаров"
+    )
+    created_at = models.DateTimeField(verbose_name="Дата создания")
+    version = models.PositiveIntegerField(
+        editable=False, verbose_name="Версия"
+    )
+    archived_at = models.DateTimeField(verbose_name="Дата переноса в архив")
+
+    objects = OrderArchiveQuerySet.as_manager()
+
+    total_skus_quantity = Order.total_skus_quantity
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name = "Архивный заказ"
+        verbose_name_plural = "Архив заказов"
+
+
+class OrderSkuArchive(models.Model):
+    order = models.ForeignKey(
+        OrderArchive,
+        on_delete=models.CASCADE,
+        related_name="order_skus",
+        verbose_name="Заказ",
+    )
+    sku = models.ForeignKey(
+        Sku, on_delete=models.CASCADE, related_name="+", verbose_name="Товар"
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name="Количество товара в заказе"
+    )
+    packaging_number = models.PositiveSmallIntegerField(
+        blank=True,
+        null=True,
+        verbose_name="Номер упаковки в которой находится товар",
+    )
+
+    class Meta:
+        verbose_name = "Товары в архивном заказе"
+        verbose_name_plural = "Товары в архивных заказах"
+
+
+class CellOrderSkuArchive(models.Model):
+    cell = models.ForeignKey(Cell, on_delete=models.CASCADE, related_name="+")
+    sku = models.ForeignKey(Sku, on_delete=models.CASCADE, related_name="+")
+    order = models.ForeignKey(
+        OrderArchive, on_delete=models.CASCADE, related_name="cellorder_skus"
+    )
+    quantity = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = "Ячейка с товарами из архивного заказа"
+        verbose_name_plural = "Ячейки с товарами из архивных заказов"
@@ -0,0 +1,87 @@
+"""Миниатюры изображений товаров.
+
+Миниатюры создаются при загрузке изображения и адресуются хэшем его
+содержимого: имя файла меняется вместе с содержимым, поэтому nginx
+может отдавать их с бессрочным кэшированием.
+"""
+import base64
+import hashlib
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+RENDITIONS_DIR = "sku_renditions"
+
+
+def content_hash(field_file):
+    digest = hashlib.sha256()
+    field_file.open("rb")
+    try:
+        for chunk in field_file.chunks():
+            digest.update(chunk)
+    finally:
+        field_file.close()
+    return digest.hexdigest()[:32]
+
+
+def rendition_name(image_hash, size):
+    return f"{RENDITIONS_DIR}/{image_hash[:2]}/{image_hash}_{size}.jpg"
+
+
+def rendition_url(image_hash, size=None):
+    if size is None:
+        size = max(settings.SKU_IMAGE_RENDITION_SIZES)
+    return default_storage.url(rendition_name(image_hash, size))
+
+
+def generate_renditions(field_file):
+    """Создаёт недостающие миниатюры изображения, возвращает его хэш."""
+    image_hash = content_hash(field_file)
+    missing = [
+        size
+        for size in settings.SKU_IMAGE_RENDITION_SIZES
+        if not default_storage.exists(rendition_name(image_hash, size))
+    ]
+    if not missing:
+        return image_hash
+
+    field_file.open("rb")
+    try:
+        with Image.open(field_file) as source:
+            source.load()
+    finally:
+        field_file.close()
+    if source.mode in ("RGBA", "LA", "P"):
+        source = source.convert("RGBA")
+        background = Image.new("RGB", source.size, "white")
+        background.paste(source, mask=source.getchannel("A"))
+        source = background
+    else:
+        source = source.convert("RGB")
+
+    for size in missing:
+        thumbnail = source.copy()
+        thumbnail.thumbnail((size, size))
+        buffer = BytesIO()
+        thumbnail.save(
+            buffer,
+            "JPEG",
+            quality=settings.SKU_IMAGE_RENDITION_QUALITY,
+            optimize=True,
+        )
+        default_storage.save(
+            rendition_name(image_hash, size), ContentFile(buffer.getvalue())
+        )
+    return image_hash
+
+
+@lru_cache(maxsize=1024)
+def inline_thumbnail(image_hash):
+    """Наименьшая миниатюра в base64 для клиентов без загрузки по URL."""
+    name = rendition_name(image_hash, min(settings.SKU_IMAGE_RENDITION_SIZES))
+    with default_storage.open(name, "rb") as file:
+        return base64.b64encode(file.read()).decode()
@@ -0,0 +1,80 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import Signal, receiver
+
+from .models import CargoType, Sku
+from .renditions import generate_renditions
+
+# Пачка справочника загружена import_catalog; keys — ключи записей.
+catalog_imported = Signal()
+
+
+@receiver(pre_save, sender=Sku)
+def detect_image_change(sender, instance, raw=False, **kwargs):
+    image = instance.image
+    if raw or not image:
+        instance._image_changed = False
+    elif not image._committed or not instance.image_hash:
+        instance._image_changed = True
+    else:
+        stored = (
+            Sku.objects.filter(pk=instance.pk)
+            .values_list("image", flat=True)
+            .first()
+        )
+        instance._image_changed = stored != image.name
+
+
+@receiver(post_save, sender=Sku)
+def update_image_renditions(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if getattr(instance, "_image_changed", False):
+        image_hash = generate_renditions(instance.image)
+    elif not instance.image:
+        image_hash = ""
+    else:
+        return
+    if image_hash != instance.image_hash:
+        instance.image_hash = image_hash
+        Sku.objects.filter(pk=instance.pk).update(image_hash=image_hash)
+
+
+@receiver(m2m_changed, sender=Sku.cargotypes.through)
+def update_packaging_hints(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if not reverse:
+        if action.startswith("post_"):
+            Sku.refresh_packaging_hints([instance.pk])
+    elif action == "pre_clear":
+        instance._cleared_skus = list(
+            instance.sku_set.values_list("pk", flat=True)
+        )
+    elif action == "post_clear":
+        Sku.refresh_packaging_hints(instance._cleared_skus)
+    elif action.startswith("post_"):
+        Sku.refresh_packaging_hints(list(pk_set))
+
+
+@receiver(post_save, sender=CargoType)
+def cargotype_saved(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        Sku.refresh_packaging_hints(
+            list(instance.sku_set.values_list("pk", flat=True))
+        )
+
+
+@receiver(pre_delete, sender=CargoType)
+def remember_cargotype_skus(sender, instance, **kwargs):
+    instance._linked_skus = list(instance.sku_set.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=CargoType)
+def cargotype_deleted(sender, instance, **kwargs):
+    Sku.refresh_packaging_hints(getattr(instance, "_linked_skus", []))
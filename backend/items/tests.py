@@ -1,3 +1,351 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+import uuid
+from io import StringIO
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+
+from users.models import Table, User
+
+from .cargotypes_constants import (
+    BUBBLE_WRAP,
+    BUBBLE_WRAP_HINT,
+    PACKET,
+    PACKET_HINT,
+    STRETCH,
+    STRETCH_HINT,
+)
+from .models import (
+    CargoType,
+    Cell,
+    CellOrderSku,
+    Order,
+    OrderSku,
+    Sku,
+    TableOrderQueue,
+)
+
+
+class ClaimNextTests(TransactionTestCase):
+    def setUp(self):
+        self.table = Table.objects.create(name="t", description="t")
+        self.user = User.objects.create(username="u", table=self.table)
+        self.order = Order.objects.create(status="forming")
+        TableOrderQueue.objects.enqueue(self.table.pk, self.order.pk)
+
+    def test_claims_oldest_order(self):
+        self.assertEqual(
+            Order.objects.claim_next(self.table.pk, self.user), self.order.pk
+        )
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "collecting")
+        self.assertEqual(self.order.who, self.user)
+        self.assertIsNone(Order.objects.claim_next(self.table.pk, self.user))
+
+    @skipUnlessDBFeature("has_select_for_update_skip_locked")
+    def test_waits_for_row_locked_by_recommendation(self):
+        # Фоновый расчёт упаковки ненадолго блокирует строку заказа;
+        # claim_next должен дождаться её, а не вернуть None.
+        locked = threading.Event()
+        release = threading.Event()
+
+        def recommend():
+            try:
+                with transaction.atomic():
+                    Order.objects.filter(pk=self.order.pk).update(
+                        recommendation_status="ready"
+                    )
+                    locked.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        worker = threading.Thread(target=recommend)
+        worker.start()
+        try:
+            self.assertTrue(locked.wait(5))
+            threading.Timer(0.2, release.set).start()
+            orderkey = Order.objects.claim_next(self.table.pk, self.user)
+        finally:
+            release.set()
+            worker.join()
+        self.assertEqual(orderkey, self.order.pk)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "collecting")
+        self.assertEqual(self.order.recommendation_status, "ready")
+
+
+class TransitionManyTests(TestCase):
+    def test_batches_keep_every_key_once(self):
+        orders = [
+            Order.objects.create(status=status)
+            for status in ("collecting",) * 3 + ("forming", "collecting")
+        ]
+        missing = uuid.uuid4()
+        orderkeys = [order.pk for order in orders] + [missing]
+        # Повторы ключей не должны попасть в разные пачки дважды.
+        outcomes = Order.objects.transition_many(
+            orderkeys + orderkeys[:2], "collected", batch_size=2
+        )
+        self.assertEqual(list(outcomes), orderkeys)
+        self.assertEqual(outcomes[missing], "not_found")
+        self.assertEqual(outcomes[orders[3].pk], "wrong_state")
+        for order in orders:
+            version = order.version
+            order.refresh_from_db()
+            if order.pk == orders[3].pk:
+                self.assertEqual(order.status, "forming")
+                self.assertEqual(order.version, version)
+            else:
+                self.assertEqual(outcomes[order.pk], "ok")
+                self.assertEqual(order.status, "collected")
+                self.assertEqual(order.version, version + 1)
+
+
+def only_in(codes, *others):
+    return min(codes.difference(*others))
+
+
+class PackagingHintsTests(TestCase):
+    def setUp(self):
+        self.packet, self.stretch = CargoType.objects.bulk_create(
+            CargoType(cargotype=code, description=str(code))
+            for code in (
+                only_in(PACKET, BUBBLE_WRAP, STRETCH),
+                only_in(STRETCH, PACKET, BUBBLE_WRAP),
+            )
+        )
+        self.skus = [
+            Sku.objects.create(
+                name=str(index), length=1, width=1, height=1, quantity=1
+            )
+            for index in range(2)
+        ]
+        self.sku = self.skus[0]
+
+    def assertHints(self, *expected):
+        self.assertEqual(
+            list(
+                Sku.objects.order_by("name").values_list(
+                    "packaging_hints", flat=True
+                )
+            ),
+            list(expected),
+        )
+
+    def test_sku_cargotypes_changed(self):
+        self.sku.cargotypes.add(self.packet)
+        self.assertHints(PACKET_HINT, 0)
+        self.sku.cargotypes.add(self.stretch)
+        self.assertHints(PACKET_HINT | STRETCH_HINT, 0)
+        self.sku.cargotypes.remove(self.packet)
+        self.assertHints(STRETCH_HINT, 0)
+        self.sku.cargotypes.clear()
+        self.assertHints(0, 0)
+
+    def test_cargotype_skus_changed(self):
+        self.packet.sku_set.add(*self.skus)
+        self.assertHints(PACKET_HINT, PACKET_HINT)
+        self.packet.sku_set.remove(self.skus[1])
+        self.assertHints(PACKET_HINT, 0)
+        self.packet.sku_set.add(self.skus[1])
+        self.packet.sku_set.clear()
+        self.assertHints(0, 0)
+
+    def test_cargotype_code_changed(self):
+        self.sku.cargotypes.add(self.packet)
+        self.packet.cargotype = only_in(BUBBLE_WRAP, PACKET, STRETCH)
+        self.packet.save()
+        self.assertHints(BUBBLE_WRAP_HINT, 0)
+
+    def test_cargotype_deleted(self):
+        self.sku.cargotypes.add(self.packet, self.stretch)
+        self.stretch.delete()
+        self.assertHints(PACKET_HINT, 0)
+
+    def test_backfill_is_idempotent(self):
+        self.sku.cargotypes.add(self.packet)
+        Sku.objects.update(packaging_hints=STRETCH_HINT)
+        for batch_size in (1, 1000):
+            with self.subTest(batch_size=batch_size):
+                out = StringIO()
+                call_command(
+                    "backfill_packaging_hints",
+                    batch_size=batch_size,
+                    stdout=out,
+                )
+                self.assertHints(PACKET_HINT, 0)
+                self.assertIn("Processed 2 SKUs", out.getvalue())
+
+
+class AdminOrderVersionTests(TestCase):
+    def setUp(self):
+        self.client.force_login(
+            User.objects.create_superuser(username="admin", password="x")
+        )
+        self.sku = Sku.objects.create(
+            name="sku", length=1, width=1, height=1, quantity=10
+        )
+        self.order = Order.objects.create(status="forming")
+        self.line = OrderSku.objects.create(
+            order=self.order, sku=self.sku, amount=1
+        )
+
+    def assertBumped(self, order):
+        version = order.version
+        order.refresh_from_db()
+        self.assertEqual(order.version, version + 1)
+
+    def test_order_change(self):
+        response = self.client.post(
+            f"/admin/items/order/{self.order.pk}/change/",
+            {
+                "status": "forming",
+                "whs": 1,
+                "recommendation_status": "pending",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertBumped(self.order)
+
+    def test_ordersku_change_and_move(self):
+        other = Order.objects.create(status="forming")
+        url = f"/admin/items/ordersku/{self.line.pk}/change/"
+        data = {"order": self.order.pk, "sku": self.sku.pk, "amount": 5}
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        self.assertBumped(self.order)
+
+        data["order"] = other.pk
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        self.assertBumped(self.order)
+        self.assertBumped(other)
+
+    def test_ordersku_delete(self):
+        response = self.client.post(
+            f"/admin/items/ordersku/{self.line.pk}/delete/", {"post": "yes"}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertBumped(self.order)
+
+    def test_cellordersku_bulk_delete(self):
+        cell = Cell.objects.create(name="1")
+        CellOrderSku.objects.create(
+            cell=cell, sku=self.sku, order=self.order, quantity=1
+        )
+        self.order.refresh_from_db()
+        response = self.client.post(
+            "/admin/items/cellordersku/",
+            {
+                "action": "delete_selected",
+                "_selected_action": list(
+                    CellOrderSku.objects.values_list("pk", flat=True)
+                ),
+                "post": "yes",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(CellOrderSku.objects.exists())
+        self.assertBumped(self.order)
+
+
+class ImportCatalogTests(TestCase):
+    def setUp(self):
+        self.sku = Sku.objects.create(
+            name="old", length=1, width=1, height=1, quantity=7
+        )
+        self.new_key = uuid.uuid4()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, directory)
+        self.path = os.path.join(directory, "skus.csv")
+        with open(self.path, "w") as file:
+            file.write("sku,name,length,width,height,goods_wght,quantity\n")
+            for key in (self.sku.pk, self.new_key):
+                file.write(f"{key},new,2,2,2,1.5,100\n")
+        self.addCleanup(os.remove, self.path)
+
+    def import_skus(self, **options):
+        call_command(
+            "import_catalog", "sku", self.path, stdout=StringIO(), **options
+        )
+
+    def test_keeps_stock_of_existing_skus(self):
+        for no_copy in (False, True):
+            with self.subTest(no_copy=no_copy):
+                self.import_skus(no_copy=no_copy)
+                self.sku.refresh_from_db()
+                self.assertEqual(self.sku.name, "new")
+                self.assertEqual(self.sku.quantity, 7)
+                self.assertEqual(
+                    Sku.objects.get(pk=self.new_key).quantity, 100
+                )
+
+    def test_update_stock(self):
+        self.import_skus(update_stock=True)
+        self.sku.refresh_from_db()
+        self.assertEqual(self.sku.quantity, 100)
+
+
+class AdminQueueTests(TestCase):
+    def setUp(self):
+        self.client.force_login(
+            User.objects.create_superuser(username="admin", password="x")
+        )
+        self.tables = [
+            Table.objects.create(name=name, description=name)
+            for name in ("t1", "t2")
+        ]
+        self.cell = Cell.objects.create(name="1", table=self.tables[0])
+        sku = Sku.objects.create(
+            name="sku", length=1, width=1, height=1, quantity=10
+        )
+        self.order = Order.objects.create(status="forming")
+        OrderSku.objects.create(order=self.order, sku=sku, amount=1)
+        CellOrderSku.objects.create(
+            cell=self.cell, sku=sku, order=self.order, quantity=1
+        )
+
+    def assertQueued(self, *tables):
+        self.assertEqual(
+            set(
+                TableOrderQueue.objects.filter(order=self.order).values_list(
+                    "table", flat=True
+                )
+            ),
+            {table.pk for table in tables},
+        )
+
+    def change_status(self, status):
+        response = self.client.post(
+            f"/admin/items/order/{self.order.pk}/change/",
+            {"status": status, "whs": 0, "recommendation_status": "pending"},
+        )
+        self.assertEqual(response.status_code, 302)
+
+    def test_cell_moved_to_another_table(self):
+        self.assertQueued(self.tables[0])
+        response = self.client.post(
+            f"/admin/items/cell/{self.cell.pk}/change/",
+            {
+                "barcode": self.cell.pk,
+                "name": "1",
+                "table": self.tables[1].pk,
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertQueued(self.tables[1])
+
+    def test_cell_deleted(self):
+        response = self.client.post(
+            f"/admin/items/cell/{self.cell.pk}/delete/", {"post": "yes"}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertQueued()
+
+    def test_status_edits(self):
+        self.change_status("collected")
+        self.assertQueued()
+        self.change_status("forming")
+        self.assertQueued(self.tables[0])
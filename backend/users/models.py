@@ -44,6 +44,7 @@ class Table(models.Model):
     name = models.CharField("Название", max_length=32, unique=True)
     description = models.TextField("Описание", max_length=128)
     available = models.BooleanField(default=True)
+    updated_at = models.DateTimeField("Дата изменения", auto_now=True)
 
     class Meta:
         ordering = ["name"]